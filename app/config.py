@@ -29,9 +29,89 @@ class Settings:
         "sqlite:///./ab_testing.db"
     )
     
+    # SQLite storage profile: "shared" (one engine for everything) or "split"
+    # (a dedicated writer pool + a pool of read-only connections, WAL journal)
+    db_storage_profile: str = os.getenv("DB_STORAGE_PROFILE", "shared")
+    db_writer_pool_size: int = int(os.getenv("DB_WRITER_POOL_SIZE", "1"))
+    db_read_pool_size: int = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+    # SQLite pragmas for every connection; empty = SQLite's default (or the split profile's)
+    sqlite_journal_mode: str = os.getenv("SQLITE_JOURNAL_MODE", "")
+    sqlite_synchronous: str = os.getenv("SQLITE_SYNCHRONOUS", "")
+    sqlite_cache_size: str = os.getenv("SQLITE_CACHE_SIZE", "")  # pages, or negative = KiB
+    sqlite_mmap_size: str = os.getenv("SQLITE_MMAP_SIZE", "")  # bytes
+    sqlite_busy_timeout_ms: str = os.getenv("SQLITE_BUSY_TIMEOUT_MS", "")
+    
+    # Per-experiment SQLite shards: assignments, events and everything derived from
+    # them (rollups, summaries) live in files under this directory; empty = one database
+    event_shard_dir: str = os.getenv("EVENT_SHARD_DIR", "")
+    # 0 = one file per experiment, N = N files picked by experiment_id % N
+    event_shard_buckets: int = int(os.getenv("EVENT_SHARD_BUCKETS", "0"))
+    event_shard_max_open: int = int(os.getenv("EVENT_SHARD_MAX_OPEN", "32"))
+    
     # Cache settings
     cache_ttl: int = int(os.getenv("CACHE_TTL", "3600"))
     cache_max_size: int = int(os.getenv("CACHE_MAX_SIZE", "10000"))
+    # external user id -> integer key from the users dictionary (keys never change)
+    user_key_cache_size: int = int(os.getenv("USER_KEY_CACHE_SIZE", "100000"))
+    
+    # Rollups (pre-aggregated hourly metrics + background job)
+    results_use_rollups: bool = os.getenv("RESULTS_USE_ROLLUPS", "true").lower() == "true"
+    # off by default: every process that runs the startup hook (each uvicorn
+    # worker) would start its own job; enable it in exactly one process
+    rollup_worker_enabled: bool = os.getenv("ROLLUP_WORKER_ENABLED", "false").lower() == "true"
+    rollup_interval_seconds: float = float(os.getenv("ROLLUP_INTERVAL_SECONDS", "30"))
+    rollup_batch_size: int = int(os.getenv("ROLLUP_BATCH_SIZE", "50000"))
+    # HyperLogLog sketches per rollup bucket, for results?approx=true
+    rollup_sketches_enabled: bool = os.getenv("ROLLUP_SKETCHES_ENABLED", "true").lower() == "true"
+    # numeric event properties (comma separated, dotted for nested keys) that get a
+    # t-digest per rollup bucket, for results?quantiles=properties.<key>
+    rollup_quantile_properties: List[str] = [
+        p.strip() for p in os.getenv("ROLLUP_QUANTILE_PROPERTIES", "").split(",") if p.strip()
+    ]
+    
+    # Results response cache (validated against per-experiment data watermarks)
+    results_cache_enabled: bool = os.getenv("RESULTS_CACHE_ENABLED", "true").lower() == "true"
+    results_cache_ttl: int = int(os.getenv("RESULTS_CACHE_TTL", "300"))
+    results_cache_max_size: int = int(os.getenv("RESULTS_CACHE_MAX_SIZE", "1000"))
+    
+    # Results jobs (POST .../results/jobs): process pool + TTL store for finished jobs
+    results_job_workers: int = int(os.getenv("RESULTS_JOB_WORKERS", "2"))
+    results_job_max_pending: int = int(os.getenv("RESULTS_JOB_MAX_PENDING", "100"))
+    results_job_store_size: int = int(os.getenv("RESULTS_JOB_STORE_SIZE", "200"))
+    results_job_ttl: int = int(os.getenv("RESULTS_JOB_TTL", "3600"))
+    
+    # Bootstrap CIs (results?ci_method=bootstrap): resample chunks run on a process pool
+    bootstrap_workers: int = int(os.getenv("BOOTSTRAP_WORKERS", "2"))
+    bootstrap_chunk_size: int = int(os.getenv("BOOTSTRAP_CHUNK_SIZE", "500"))
+    bootstrap_resamples: int = int(os.getenv("BOOTSTRAP_RESAMPLES", "2000"))
+    bootstrap_max_resamples: int = int(os.getenv("BOOTSTRAP_MAX_RESAMPLES", "20000"))
+    
+    # Per-user summaries (unique users / conversions without scanning events)
+    results_use_user_summaries: bool = os.getenv("RESULTS_USE_USER_SUMMARIES", "true").lower() == "true"
+    
+    # Assignment writes: "sync" (insert + commit before responding) or
+    # "write_behind" (respond from cached config, background writer batches inserts)
+    assignment_write_mode: str = os.getenv("ASSIGNMENT_WRITE_MODE", "sync")
+    assignment_writer_batch_size: int = int(os.getenv("ASSIGNMENT_WRITER_BATCH_SIZE", "500"))
+    assignment_writer_flush_ms: int = int(os.getenv("ASSIGNMENT_WRITER_FLUSH_MS", "50"))
+    assignment_writer_queue_size: int = int(os.getenv("ASSIGNMENT_WRITER_QUEUE_SIZE", "100000"))
+    
+    # Async event ingestion (POST /events?mode=async -> 202, group-committed by a writer thread)
+    event_queue_enabled: bool = os.getenv("EVENT_QUEUE_ENABLED", "false").lower() == "true"
+    event_queue_max_events: int = int(os.getenv("EVENT_QUEUE_MAX_EVENTS", "100000"))
+    event_queue_batch_size: int = int(os.getenv("EVENT_QUEUE_BATCH_SIZE", "2000"))
+    event_queue_flush_ms: int = int(os.getenv("EVENT_QUEUE_FLUSH_MS", "200"))
+    
+    # Streaming NDJSON ingestion (POST /events/ndjson)
+    ndjson_chunk_size: int = int(os.getenv("NDJSON_CHUNK_SIZE", "1000"))
+    ndjson_max_line_bytes: int = int(os.getenv("NDJSON_MAX_LINE_BYTES", "1048576"))
+    ndjson_max_errors: int = int(os.getenv("NDJSON_MAX_ERRORS", "100"))
+    
+    # Single-writer deployment: when set, web workers forward every write to the
+    # writer process (python -m app.services.writer_process) on this Unix socket
+    writer_socket: str = os.getenv("WRITER_SOCKET", "")
+    writer_batch_size: int = int(os.getenv("WRITER_BATCH_SIZE", "5000"))
+    writer_timeout: float = float(os.getenv("WRITER_TIMEOUT_SECONDS", "30"))
     
     # Server
     host: str = os.getenv("HOST", "0.0.0.0")
@@ -1,15 +1,199 @@
 
-from sqlalchemy import create_engine
+import asyncio
+import functools
+import os
+import shutil
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple, Union
+from sqlalchemy import and_, bindparam, create_engine, event, exc, func, inspect, select, text, union, update
+from sqlalchemy.engine import Connection, Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import await_only
+from starlette.concurrency import run_in_threadpool
 from app.config import settings
+from app.utils.assignment import hash_user_sample
 
 # from sqlalchemy.pool import StaticPool
 # from sqlalchemy.engine import Engine
 
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
+# async drivers -> the blocking driver the sync engine uses for the same database
+ASYNC_DRIVERS = {"aiosqlite": "pysqlite", "asyncpg": "psycopg2"}
+
+
+def is_async_url(url: str) -> bool:
+    return make_url(url).get_driver_name() in ASYNC_DRIVERS
+
+
+def sync_database_url(url: str) -> str:
+    """DATABASE_URL with an async driver swapped for its blocking twin (unchanged otherwise)."""
+    parsed = make_url(url)
+    driver = parsed.get_driver_name()
+    if driver not in ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{ASYNC_DRIVERS[driver]}").render_as_string(
+        hide_password=False
+    )
+
+
+# DATABASE_URL=sqlite+aiosqlite://... (or postgresql+asyncpg://...) switches the
+# API to AsyncSessions. Background workers, results jobs and tests keep using
+# the blocking engine below, pointed at the same database.
+USE_ASYNC_DB = is_async_url(settings.database_url)
+SYNC_DATABASE_URL = sync_database_url(settings.database_url)
+
+STORAGE_PROFILES = ("shared", "split")
+_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+_SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def _is_sqlite_file(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:")
+
+
+def sqlite_pragmas(read_only: bool = False) -> Dict[str, str]:
+    """
+    PRAGMAs run on every new SQLite connection, from the SQLITE_* settings.
+    The split profile defaults to WAL + synchronous=NORMAL + a busy timeout;
+    readers additionally get query_only and leave the journal mode to the writer.
+    """
+    split = settings.db_storage_profile == "split"
+    journal_mode = (settings.sqlite_journal_mode or ("WAL" if split else "")).upper()
+    synchronous = (settings.sqlite_synchronous or ("NORMAL" if split else "")).upper()
+    if journal_mode and journal_mode not in _JOURNAL_MODES:
+        raise ValueError(f"SQLITE_JOURNAL_MODE must be one of {', '.join(_JOURNAL_MODES)}")
+    if synchronous and synchronous not in _SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(_SYNCHRONOUS_MODES)}")
+
+    pragmas: Dict[str, str] = {}
+    if journal_mode and not read_only:
+        pragmas["journal_mode"] = journal_mode
+    if synchronous:
+        pragmas["synchronous"] = synchronous
+    for name, value in (
+        ("cache_size", settings.sqlite_cache_size),
+        ("mmap_size", settings.sqlite_mmap_size),
+        ("busy_timeout", settings.sqlite_busy_timeout_ms or ("5000" if split else "")),
+    ):
+        if value:
+            pragmas[name] = str(int(value))  # ints only: these end up in the SQL text
+    if read_only:
+        pragmas["query_only"] = "ON"
+    return pragmas
+
+
+def _install_pragmas(sync_engine: Engine, pragmas: Dict[str, str]) -> None:
+    if not pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+class FifoQueuePool(QueuePool):
+    """
+    QueuePool that hands connections to waiting threads in arrival order.
+    A plain QueuePool lets the thread that just returned a connection take it
+    straight back, so with one writer connection a busy thread can starve the
+    others for seconds; here a returned connection goes to the oldest waiter.
+    """
+
+    def __init__(self, creator, pool_size: int = 5, max_overflow: int = 10, timeout: float = 30.0, **kw):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, timeout=timeout, **kw)
+        self._slots = pool_size + max_overflow
+        self._waiters: Deque[threading.Event] = deque()
+        self._slots_lock = threading.Lock()
+
+    def _take_slot(self) -> None:
+        with self._slots_lock:
+            if self._slots > 0 and not self._waiters:
+                self._slots -= 1
+                return
+            turn = threading.Event()
+            self._waiters.append(turn)
+        if turn.wait(self._timeout):
+            return
+        with self._slots_lock:
+            if turn.is_set():  # handed over while timing out
+                return
+            self._waiters.remove(turn)
+        raise exc.TimeoutError(f"FifoQueuePool limit of {self._slots} reached, timed out after {self._timeout}s")
+
+    def _give_slot(self) -> None:
+        with self._slots_lock:
+            if self._waiters:
+                self._waiters.popleft().set()  # the slot passes straight to the oldest waiter
+            else:
+                self._slots += 1
+
+    def _do_get(self):
+        self._take_slot()
+        try:
+            return super()._do_get()
+        except BaseException:
+            self._give_slot()
+            raise
+
+    def _do_return_conn(self, record) -> None:
+        try:
+            super()._do_return_conn(record)
+        finally:
+            self._give_slot()
+
+
+def make_engine(url: str, read_only: bool = False, **kwargs) -> Engine:
+    """create_engine plus the configured SQLite pragmas (read_only -> query_only connections)."""
+    is_sqlite = make_url(url).get_backend_name() == "sqlite"
+    new_engine = create_engine(url, connect_args={"check_same_thread": False} if is_sqlite else {}, **kwargs)
+    if is_sqlite:
+        _install_pragmas(new_engine, sqlite_pragmas(read_only))
+    return new_engine
+
+
+def make_async_engine(url: str, read_only: bool = False, **kwargs):
+    """create_async_engine twin of make_engine."""
+    new_engine = create_async_engine(url, **kwargs)
+    if make_url(url).get_backend_name() == "sqlite":
+        _install_pragmas(new_engine.sync_engine, sqlite_pragmas(read_only))
+    return new_engine
+
+
+if settings.db_storage_profile not in STORAGE_PROFILES:
+    raise ValueError(f"DB_STORAGE_PROFILE must be one of {', '.join(STORAGE_PROFILES)}")
+
+# split profile: writes (ingest, assignments, workers) queue for a dedicated writer
+# pool instead of fighting over SQLite's lock; results scans use their own
+# query_only connections, which WAL lets run alongside the writer. Only for
+# file databases: an in-memory database can't be shared between pools.
+SPLIT_STORAGE = settings.db_storage_profile == "split" and _is_sqlite_file(SYNC_DATABASE_URL)
+_WRITER_POOL = dict(pool_size=settings.db_writer_pool_size, max_overflow=0) if SPLIT_STORAGE else {}
+_READER_POOL = dict(pool_size=settings.db_read_pool_size, max_overflow=0)
+_FIFO = dict(poolclass=FifoQueuePool) if SPLIT_STORAGE else {}
+
+# EVENT_SHARD_DIR: tables declared with schema=SHARD_SCHEMA (models.py) live in
+# per-experiment files, ATTACHed as "shard" on connections of that shard's engine.
+# The main engine maps the schema away, so its copies of those tables sit in the
+# main file (events without an experiment end up there).
+SHARDING = bool(settings.event_shard_dir)
+if SHARDING and (USE_ASYNC_DB or not _is_sqlite_file(SYNC_DATABASE_URL)):
+    raise ValueError("EVENT_SHARD_DIR needs a file SQLite DATABASE_URL with a blocking driver")
+SHARD_SCHEMA = "shard" if SHARDING else None
+_MAIN_OPTIONS = dict(schema_translate_map={SHARD_SCHEMA: None}) if SHARDING else {}
+
+engine = make_engine(SYNC_DATABASE_URL, **_WRITER_POOL, **_FIFO).execution_options(**_MAIN_OPTIONS)
+read_engine = (
+    make_engine(SYNC_DATABASE_URL, read_only=True, **_READER_POOL, **_FIFO).execution_options(**_MAIN_OPTIONS)
+    if SPLIT_STORAGE else engine
 )
 
 # engine = create_engine(
@@ -19,6 +203,21 @@ engine = create_engine(
 # )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine, info={"read_only": True})
+
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+if USE_ASYNC_DB:
+    async_engine = make_async_engine(settings.database_url, **_WRITER_POOL)
+    async_read_engine = (
+        make_async_engine(settings.database_url, read_only=True, **_READER_POOL) if SPLIT_STORAGE else async_engine
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    AsyncReadSessionLocal = async_sessionmaker(
+        async_read_engine, autoflush=False, expire_on_commit=False, info={"read_only": True}
+    )
 
 Base = declarative_base()
 
@@ -26,6 +225,168 @@ Base = declarative_base()
 #     return engine
 
 
+class ShardSet:
+    """
+    Engines for the shard files, opened on first use and kept open for the
+    `max_open` most recently used shards. Only writes create a missing file
+    (and its tables); reads never do, see routed_by_experiment.
+    Each engine connects to the main database and ATTACHes one shard file.
+    """
+
+    def __init__(self, directory: str, buckets: int = 0, max_open: int = 32):
+        self.directory = directory
+        self.buckets = buckets
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        # shard path -> (writer sessionmaker, reader sessionmaker)
+        self._open: "OrderedDict[str, Tuple[sessionmaker, sessionmaker]]" = OrderedDict()
+
+    def path(self, experiment_id: int) -> str:
+        name = f"bucket_{experiment_id % self.buckets}.db" if self.buckets else f"experiment_{experiment_id}.db"
+        return os.path.join(self.directory, name)
+
+    def paths(self) -> List[str]:
+        """Shard files that currently exist."""
+        if not os.path.isdir(self.directory):
+            return []
+        prefix = "bucket_" if self.buckets else "experiment_"
+        return sorted(
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if name.startswith(prefix) and name.endswith(".db")
+        )
+
+    @staticmethod
+    def _engine(path: str, read_only: bool, **kwargs) -> Engine:
+        shard_engine = make_engine(SYNC_DATABASE_URL, read_only=read_only, **kwargs)
+        journal_mode = sqlite_pragmas().get("journal_mode")
+
+        @event.listens_for(shard_engine, "connect")
+        def _attach_shard(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"ATTACH DATABASE ? AS {SHARD_SCHEMA}", (path,))
+            if journal_mode and not read_only:
+                cursor.execute(f"PRAGMA {SHARD_SCHEMA}.journal_mode = {journal_mode}")
+            cursor.close()
+
+        return shard_engine
+
+    def sessions(self, path: str, read_only: bool = False) -> sessionmaker:
+        with self._lock:
+            entry = self._open.get(path)
+            if entry is None:
+                if read_only and not os.path.exists(path):
+                    raise FileNotFoundError(path)
+                import app.models  # noqa: F401  (registers the shard tables on Base.metadata)
+                os.makedirs(self.directory, exist_ok=True)
+                writer = self._engine(path, False, **_WRITER_POOL, **_FIFO)
+                tables = [t for t in Base.metadata.sorted_tables if t.schema == SHARD_SCHEMA]
+                Base.metadata.create_all(bind=writer, tables=tables)
+                with writer.begin() as conn:
+                    upgrade_schema(conn, tables)
+                reader = self._engine(path, True, **_READER_POOL, **_FIFO) if SPLIT_STORAGE else writer
+                entry = (
+                    sessionmaker(autocommit=False, autoflush=False, bind=writer, info={"shard": path}),
+                    sessionmaker(autocommit=False, autoflush=False, bind=reader, info={"shard": path, "read_only": True}),
+                )
+                self._open[path] = entry
+                while len(self._open) > self.max_open:
+                    self._dispose(self._open.popitem(last=False)[1])
+            else:
+                self._open.move_to_end(path)
+        return entry[1] if read_only else entry[0]
+
+    @staticmethod
+    def _dispose(entry: Tuple[sessionmaker, sessionmaker]) -> None:
+        for factory in entry:
+            factory.kw["bind"].dispose()
+
+    def archive(self, experiment_id: int, destination: str) -> str:
+        """
+        Move an experiment's shard file into `destination` (a directory) and return
+        its new path. Its results read as empty afterwards, until the file is moved back.
+        """
+        if self.buckets:
+            raise ValueError("Bucketed shards hold several experiments and can't be archived one by one")
+        path = self.path(experiment_id)
+        with self._lock:
+            entry = self._open.pop(path, None)
+            if entry is not None:
+                self._dispose(entry)
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+            # fold a WAL back into the file, so the one file is the whole shard
+            conn = sqlite3.connect(path)
+            try:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                conn.close()
+            target = shutil.move(path, os.path.join(destination, os.path.basename(path)))
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.unlink(path + suffix)
+        return target
+
+
+shards = ShardSet(
+    settings.event_shard_dir,
+    buckets=settings.event_shard_buckets,
+    max_open=settings.event_shard_max_open
+) if SHARDING else None
+
+
+def needs_shard(db: Session) -> bool:
+    """True for a main-database session while sharding is on: shard data must be routed."""
+    return SHARDING and "shard" not in db.info
+
+
+def shard_path(db: Session, experiment_id: Optional[int]) -> Optional[str]:
+    """
+    The shard file `db`'s work on experiment_id belongs in, or None to stay on
+    `db`: sharding off, already a shard session, no experiment, or an unknown
+    experiment (which gets its 404 from the main database, not a new shard).
+    """
+    if experiment_id is None or not needs_shard(db):
+        return None
+    path = shards.path(experiment_id)
+    if os.path.exists(path):
+        return path
+    if db.execute(text("SELECT 1 FROM experiments WHERE id = :id"), {"id": experiment_id}).first() is None:
+        return None
+    return path
+
+
+def on_shard(path: str, fn: Callable[..., Any], *args, read_only: bool = False, **kwargs) -> Any:
+    """Run `fn(session, *args, **kwargs)` on a session of the shard at `path`."""
+    db = shards.sessions(path, read_only=read_only)()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+def routed_by_experiment(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    For service functions shaped fn(db, experiment_id, ...): handed a main-database
+    session while sharding is on, run on the experiment's shard instead (read
+    sessions get a read-only shard session). A read of a shard file that doesn't
+    exist (never written, or archived) stays on the main database, whose shard
+    tables hold no rows for the experiment, so it reads as empty without creating
+    the file. Without sharding this is fn itself.
+    """
+    if not SHARDING:
+        return fn
+
+    @functools.wraps(fn)
+    def routed(db: Session, experiment_id: int, *args, **kwargs):
+        path = shard_path(db, experiment_id)
+        read_only = db.info.get("read_only", False)
+        if path is None or (read_only and not os.path.exists(path)):
+            return fn(db, experiment_id, *args, **kwargs)
+        return on_shard(path, fn, experiment_id, *args, read_only=read_only, **kwargs)
+
+    return routed
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -34,6 +395,219 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    """Session for read-only work (results); the reader pool under the split profile."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+# what the routers depend on: AsyncSessions when DATABASE_URL has an async
+# driver, otherwise plain get_db/get_read_db (so test overrides still work)
+get_session = get_async_db if USE_ASYNC_DB else get_db
+get_read_session = get_async_read_db if USE_ASYNC_DB else get_read_db
+
+
+async def run_session(db: Union[Session, AsyncSession], fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a sync service function `fn(session, *args, **kwargs)` from async code.
+    AsyncSession: on the event loop via run_sync (the driver is awaited, no
+    thread). Session: in the threadpool, as a sync endpoint would.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+# blocking-driver read sessions for async engines other than the app's own (keyed by URL)
+_sync_read_sessions: Dict[str, sessionmaker] = {}
+_sync_read_lock = threading.Lock()
+
+
+def _sync_read_sessionmaker(db: AsyncSession) -> sessionmaker:
+    bind = db.bind
+    if bind is async_engine or bind is async_read_engine:
+        return ReadSessionLocal
+    url = bind.url.render_as_string(hide_password=False)
+    with _sync_read_lock:
+        factory = _sync_read_sessions.get(url)
+        if factory is None:
+            factory = _sync_read_sessions[url] = sessionmaker(
+                autocommit=False, autoflush=False, info={"read_only": True},
+                bind=make_engine(sync_database_url(url), read_only=True, **_READER_POOL)
+            )
+    return factory
+
+
+def _in_session(factory: sessionmaker, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    with factory() as db:
+        return fn(db, *args, **kwargs)
+
+
+async def run_read(db: Union[Session, AsyncSession], fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    run_session for read-only, CPU-heavy service functions (results). run_sync
+    would keep the whole computation on the event loop, so with an AsyncSession
+    `fn` runs in the threadpool on a blocking read session of the same database.
+    """
+    if isinstance(db, AsyncSession):
+        return await run_in_threadpool(_in_session, _sync_read_sessionmaker(db), fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Call CPU-bound or blocking work `fn(*args, **kwargs)` from a sync service function.
+    Under run_session with an AsyncSession the service runs on the event loop
+    (run_sync), so the call goes to the threadpool and is awaited from there,
+    leaving the loop free for other requests. Anywhere else it is a plain call.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return fn(*args, **kwargs)
+    return await_only(run_in_threadpool(fn, *args, **kwargs))
+
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        upgrade_schema(conn, Base.metadata.sorted_tables)
+
+
+# rows per round trip while backfilling sample_bucket
+UPGRADE_CHUNK_SIZE = 10000
+
+
+def _qualified(conn: Connection, schema: Optional[str], name: str) -> str:
+    preparer = conn.dialect.identifier_preparer
+    return preparer.quote(name) if schema is None else f"{preparer.quote_schema(schema)}.{preparer.quote(name)}"
+
+
+def upgrade_schema(conn: Connection, tables: List[Any]) -> None:
+    """
+    Bring tables created by an older version up to the models. create_all only
+    creates missing tables; this adds missing columns, backfills the ones
+    derived from user_id (user_key through the users dictionary, sample_bucket),
+    fills empty per-user summary tables from the events already stored, and
+    rebuilds indexes whose columns changed, dropping idx_/ix_ indexes the
+    models no longer declare. A no-op on an up-to-date database.
+    """
+    inspector = inspect(conn)
+    added: Dict[str, List[str]] = {}
+    for table in tables:
+        schema = conn.schema_for_object(table)
+        existing = {c["name"] for c in inspector.get_columns(table.name, schema=schema)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            # left nullable: SQLite can't add a NOT NULL column without a default
+            conn.execute(text(
+                f"ALTER TABLE {_qualified(conn, schema, table.name)} "
+                f"ADD COLUMN {conn.dialect.identifier_preparer.quote(column.name)} {column.type.compile(conn.dialect)}"
+            ))
+            added.setdefault(table.name, []).append(column.name)
+
+    by_name = {t.name: t for t in tables}
+    keyed = [by_name[name] for name, columns in added.items() if "user_key" in columns]
+    if keyed:
+        users = by_name["users"]
+        external_ids = union(*(select(t.c.user_id) for t in keyed)).subquery()
+        conn.execute(
+            # the WHERE also keeps SQLite from reading ON CONFLICT as a join constraint
+            dialect_insert(conn)(users).from_select(
+                ["external_id"], select(external_ids.c.user_id).where(external_ids.c.user_id.isnot(None))
+            ).on_conflict_do_nothing(index_elements=["external_id"])
+        )
+        for table in keyed:
+            conn.execute(update(table).where(table.c.user_key.is_(None)).values(
+                user_key=select(users.c.id).where(users.c.external_id == table.c.user_id).scalar_subquery()
+            ))
+    if "sample_bucket" in added.get("user_assignments", []):
+        assignments = by_name["user_assignments"]
+        fill = update(assignments).where(assignments.c.id == bindparam("row_id")).values(
+            sample_bucket=bindparam("bucket")
+        )
+        while True:
+            rows = conn.execute(
+                select(assignments.c.id, assignments.c.user_id)
+                .where(assignments.c.sample_bucket.is_(None)).limit(UPGRADE_CHUNK_SIZE)
+            ).all()
+            if not rows:
+                break
+            conn.execute(fill, [{"row_id": row_id, "bucket": hash_user_sample(user_id)} for row_id, user_id in rows])
+    _backfill_summaries(conn, by_name)
+
+    for table in tables:
+        schema = conn.schema_for_object(table)
+        existing = {i["name"]: i["column_names"] for i in inspector.get_indexes(table.name, schema=schema)}
+        declared = {i.name: [c.name for c in i.columns] for i in table.indexes}
+        for name, columns in existing.items():
+            if declared.get(name) != columns and name.startswith(("idx_", "ix_")):
+                conn.execute(text(f"DROP INDEX {_qualified(conn, schema, name)}"))
+        for index in table.indexes:
+            if existing.get(index.name) != declared[index.name]:
+                index.create(conn)
+
+
+def _backfill_summaries(conn: Connection, by_name: Dict[str, Any]) -> None:
+    """
+    Ingest keeps the summaries current, but tables created after events were
+    stored start empty. Fill an empty one in one INSERT ... SELECT, with the
+    same attribution rule as summary_service (event at/after assigned_at).
+    """
+    if not {"events", "user_assignments", "user_experiment_summaries", "user_event_type_summaries"} <= set(by_name):
+        return
+    events, assignments = by_name["events"], by_name["user_assignments"]
+    joined = events.join(assignments, and_(
+        events.c.user_key == assignments.c.user_key,
+        events.c.experiment_id == assignments.c.experiment_id,
+        events.c.timestamp >= assignments.c.assigned_at,
+    ))
+    user_columns = [
+        assignments.c.experiment_id, assignments.c.user_id, assignments.c.user_key,
+        assignments.c.variant_id,
+    ]
+
+    summaries = by_name["user_experiment_summaries"]
+    if conn.execute(select(summaries.c.id).limit(1)).first() is None:
+        conn.execute(summaries.insert().from_select(
+            ["experiment_id", "user_id", "user_key", "variant_id", "assigned_at",
+             "first_event_at", "last_event_at", "event_count"],
+            select(
+                *user_columns, assignments.c.assigned_at,
+                func.min(events.c.timestamp), func.max(events.c.timestamp), func.count(events.c.id)
+            ).select_from(joined).group_by(*user_columns, assignments.c.assigned_at)
+        ))
+
+    type_summaries = by_name["user_event_type_summaries"]
+    if conn.execute(select(type_summaries.c.id).limit(1)).first() is None:
+        conn.execute(type_summaries.insert().from_select(
+            ["experiment_id", "user_id", "user_key", "variant_id", "event_type",
+             "first_event_at", "event_count"],
+            select(
+                *user_columns, events.c.event_type,
+                func.min(events.c.timestamp), func.count(events.c.id)
+            ).select_from(joined).group_by(*user_columns, events.c.event_type)
+        ))
+
+
+def dialect_insert(db: Union[Session, Connection]):
+    """insert() for the session's (or connection's) dialect, needed for ON CONFLICT upserts."""
+    dialect = db.get_bind().dialect if isinstance(db, Session) else db.dialect
+    if dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
 
@@ -2,7 +2,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.database import init_db
+from app.config import settings
 from app.routers import experiments, assignments, events, results
+from app.services.rollup_service import rollup_worker
+from app.services.assignment_writer import assignment_writer
+from app.services.ingest_queue import event_ingest_queue
+from app.services.results_jobs import results_jobs
+from app.services.bootstrap_service import bootstrap_pool
+from app.services.write_forwarder import write_forwarder
 
 # from starlette.middleware.trustedhost import TrustedHostMiddleware
 # from fastapi.responses import RedirectResponse
@@ -27,6 +34,7 @@ app.add_middleware(
 
 app.include_router(experiments.router)
 app.include_router(assignments.router)
+app.include_router(assignments.users_router)
 app.include_router(events.router)
 app.include_router(results.router)
 
@@ -34,9 +42,28 @@ app.include_router(results.router)
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup (create tables etc)."""
+    if write_forwarder.enabled:
+        # the writer process owns the schema and the background writers
+        return
     init_db()
     print("Database initialized")  # TODO: Replace with proper logging
     # await some_async_init()
+    if settings.rollup_worker_enabled:
+        rollup_worker.start()
+    if settings.assignment_write_mode == "write_behind":
+        assignment_writer.start()
+    if settings.event_queue_enabled:
+        event_ingest_queue.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background jobs (queued assignments/events are flushed)."""
+    rollup_worker.stop()
+    assignment_writer.stop()
+    event_ingest_queue.stop()
+    results_jobs.shutdown(wait=False)
+    bootstrap_pool.shutdown(wait=False)
 
 
 
@@ -1,11 +1,13 @@
 """SQLAlchemy models for experiments, variants, assignments, and events.
 
-These map to the tables in SQLite.
+These map to the tables in SQLite. Tables declared with schema=SHARD_SCHEMA live
+in per-experiment shard files when EVENT_SHARD_DIR is set (app/database.py).
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from app.database import Base
+from app.database import Base, SHARD_SCHEMA
+from app.utils.assignment import hash_user_sample
 
 # # from sqlalchemy.schema import UniqueConstraint
 # # from sqlalchemy import Boolean
@@ -49,22 +51,44 @@ class Variant(Base):
     )
 
 
+class User(Base):
+    """Dictionary of external user ids; rows elsewhere join on its integer id (app/services/user_keys.py)."""
+    __tablename__ = "users"
+    
+    id = Column(Integer, primary_key=True)
+    external_id = Column(String, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_users_external_id', 'external_id', unique=True),
+        {"schema": SHARD_SCHEMA},
+    )
+
+
+def _sample_bucket(context) -> int:
+    """Results-sampling bucket of the row's user, computed once on insert (ORM and Core)."""
+    return hash_user_sample(context.get_current_parameters()["user_id"])
+
+
 class UserAssignment(Base):
     __tablename__ = "user_assignments"
     
     id = Column(Integer, primary_key=True, index=True)
     experiment_id = Column(Integer, ForeignKey("experiments.id"), nullable=False)
-    user_id = Column(String, nullable=False, index=True)
+    user_id = Column(String, nullable=False)  # external id, not indexed: lookups/joins use user_key
+    user_key = Column(Integer, ForeignKey(User.id), nullable=False)
     variant_id = Column(Integer, ForeignKey("variants.id"), nullable=False)
     assigned_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    sample_bucket = Column(Integer, nullable=False, default=_sample_bucket)  # hash_user_sample(user_id)
     
     experiment = relationship("Experiment", back_populates="assignments")
     variant = relationship("Variant", back_populates="assignments")
     
     # Unique constraint ensures idempotency - one assignment per user per experiment
     __table_args__ = (
-        Index('idx_assignments_experiment_user', 'experiment_id', 'user_id', unique=True),
-        Index('idx_assignments_user_id', 'user_id'),
+        Index('idx_assignments_experiment_user', 'experiment_id', 'user_key', unique=True),
+        Index('idx_assignments_user_key', 'user_key'),
+        Index('idx_assignments_experiment_sample', 'experiment_id', 'sample_bucket'),
+        {"schema": SHARD_SCHEMA},
     )
 
 
@@ -72,7 +96,8 @@ class Event(Base):
     __tablename__ = "events"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, nullable=False, index=True)
+    user_id = Column(String, nullable=False)  # external id, not indexed: joins use user_key
+    user_key = Column(Integer, ForeignKey(User.id), nullable=False)
     event_type = Column(String, nullable=False, index=True)  # click, purchase, signup, etc.
     timestamp = Column(DateTime(timezone=True), nullable=False, index=True)
     properties = Column(Text, nullable=True)  # JSON string for flexible properties
@@ -83,9 +108,139 @@ class Event(Base):
     
     # Indexes for common query patterns
     __table_args__ = (
-        Index('idx_events_user_timestamp', 'user_id', 'timestamp'),
+        # the assignment join's equalities, so a per-user lookup never falls back to the experiment index
+        Index('idx_events_user_experiment_timestamp', 'user_key', 'experiment_id', 'timestamp'),
         Index('idx_events_type_timestamp', 'event_type', 'timestamp'),
         Index('idx_events_experiment_timestamp', 'experiment_id', 'timestamp'),
+        {"schema": SHARD_SCHEMA},
+    )
+
+
+
+# Pre-aggregated metrics, maintained by app/services/rollup_service.py.
+# Only hourly tables are kept; daily/weekly views are sums of hour buckets.
+class EventRollupHourly(Base):
+    __tablename__ = "event_rollups_hourly"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    experiment_id = Column(Integer, ForeignKey("experiments.id"), nullable=False)
+    variant_id = Column(Integer, ForeignKey("variants.id"), nullable=False)
+    event_type = Column(String, nullable=False)
+    bucket_start = Column(DateTime, nullable=False)  # truncated to the hour
+    event_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index('idx_event_rollups_key', 'experiment_id', 'variant_id', 'event_type', 'bucket_start', unique=True),
+        Index('idx_event_rollups_experiment_bucket', 'experiment_id', 'bucket_start'),
+        {"schema": SHARD_SCHEMA},
+    )
+
+
+class AssignmentRollupHourly(Base):
+    __tablename__ = "assignment_rollups_hourly"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    experiment_id = Column(Integer, ForeignKey("experiments.id"), nullable=False)
+    variant_id = Column(Integer, ForeignKey("variants.id"), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)  # assigned_at truncated to the hour
+    assigned_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index('idx_assignment_rollups_key', 'experiment_id', 'variant_id', 'bucket_start', unique=True),
+        {"schema": SHARD_SCHEMA},
+    )
+
+
+class EventSketchHourly(Base):
+    """HyperLogLog sketch of distinct users per rollup bucket (app/utils/hll.py)."""
+    __tablename__ = "event_sketches_hourly"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    experiment_id = Column(Integer, ForeignKey("experiments.id"), nullable=False)
+    variant_id = Column(Integer, ForeignKey("variants.id"), nullable=False)
+    event_type = Column(String, nullable=False)
+    bucket_start = Column(DateTime, nullable=False)  # truncated to the hour
+    registers = Column(LargeBinary, nullable=False)  # HyperLogLog.to_bytes()
+    
+    __table_args__ = (
+        Index('idx_event_sketches_key', 'experiment_id', 'variant_id', 'event_type', 'bucket_start', unique=True),
+        Index('idx_event_sketches_experiment_bucket', 'experiment_id', 'bucket_start'),
+        {"schema": SHARD_SCHEMA},
+    )
+
+
+class EventDigestHourly(Base):
+    """t-digest of a numeric event property per rollup bucket (app/utils/tdigest.py)."""
+    __tablename__ = "event_digests_hourly"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    experiment_id = Column(Integer, ForeignKey("experiments.id"), nullable=False)
+    variant_id = Column(Integer, ForeignKey("variants.id"), nullable=False)
+    event_type = Column(String, nullable=False)
+    property = Column(String, nullable=False)  # dotted key inside Event.properties, e.g. "load_ms"
+    bucket_start = Column(DateTime, nullable=False)  # truncated to the hour
+    centroids = Column(LargeBinary, nullable=False)  # TDigest.to_bytes()
+    
+    __table_args__ = (
+        Index(
+            'idx_event_digests_key',
+            'experiment_id', 'property', 'variant_id', 'event_type', 'bucket_start', unique=True
+        ),
+        {"schema": SHARD_SCHEMA},
+    )
+
+
+class RollupState(Base):
+    """High-water marks for the rollup job (last source row id folded in)."""
+    __tablename__ = "rollup_state"
+    
+    name = Column(String, primary_key=True)  # "events" or "assignments"
+    high_water_mark = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = {"schema": SHARD_SCHEMA}
+
+
+
+# Per-user exposure/conversion summaries, maintained at ingest time by
+# app/services/summary_service.py. Only events at/after assigned_at are counted.
+class UserExperimentSummary(Base):
+    __tablename__ = "user_experiment_summaries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    experiment_id = Column(Integer, ForeignKey("experiments.id"), nullable=False)
+    user_id = Column(String, nullable=False)
+    user_key = Column(Integer, ForeignKey(User.id), nullable=False)
+    variant_id = Column(Integer, ForeignKey("variants.id"), nullable=False)
+    assigned_at = Column(DateTime(timezone=True), nullable=False)
+    first_event_at = Column(DateTime(timezone=True), nullable=False)
+    last_event_at = Column(DateTime(timezone=True), nullable=False)
+    event_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index('idx_user_summaries_experiment_user', 'experiment_id', 'user_key', unique=True),
+        Index('idx_user_summaries_experiment_variant', 'experiment_id', 'variant_id', 'first_event_at'),
+        {"schema": SHARD_SCHEMA},
+    )
+
+
+class UserEventTypeSummary(Base):
+    """First occurrence (first conversion) + count per event type for one user."""
+    __tablename__ = "user_event_type_summaries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    experiment_id = Column(Integer, ForeignKey("experiments.id"), nullable=False)
+    user_id = Column(String, nullable=False)
+    user_key = Column(Integer, ForeignKey(User.id), nullable=False)
+    event_type = Column(String, nullable=False)
+    variant_id = Column(Integer, ForeignKey("variants.id"), nullable=False)
+    first_event_at = Column(DateTime(timezone=True), nullable=False)
+    event_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index('idx_user_type_summaries_key', 'experiment_id', 'user_key', 'event_type', unique=True),
+        Index('idx_user_type_summaries_experiment_type', 'experiment_id', 'event_type', 'variant_id', 'first_event_at'),
+        {"schema": SHARD_SCHEMA},
     )
 
 # def now_utc():
@@ -1,33 +1,66 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from app.database import get_db
+from typing import List
+from app.database import get_session
 from app.auth import verify_token
-from app.schemas import AssignmentResponse
-from app.services.assignment_service import get_or_create_assignment
+from app.schemas import AssignmentResponse, BulkAssignmentRequest
+from app.services.assignment_service import (
+    get_or_create_assignment_async, get_or_create_assignments_bulk, get_or_create_user_assignments
+)
+from app.services.write_forwarder import run_write
+from app.utils.cache import AssignmentRecord
 
 # # from fastapi import HTTPException
 # # from typing import Optional
 # # from app.schemas import AssignmentResponse
 
 router = APIRouter(prefix="/experiments", tags=["assignments"])
+users_router = APIRouter(prefix="/users", tags=["assignments"])
+
+
+def _to_response(assignment: AssignmentRecord) -> AssignmentResponse:
+    return AssignmentResponse(
+        experiment_id=assignment.experiment_id,
+        user_id=assignment.user_id,
+        variant_id=assignment.variant_id,
+        variant_name=assignment.variant_name,
+        assigned_at=assignment.assigned_at
+    )
 
 
 @router.get("/{experiment_id}/assignment/{user_id}", response_model=AssignmentResponse)
-def get_assignment_endpoint(
+async def get_assignment_endpoint(
     experiment_id: int,
     user_id: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     token: str = Depends(verify_token)
 ):
     # Do the main logic in the service
     # user_id = user_id.strip()
-    assignment = get_or_create_assignment(db, experiment_id, user_id)
+    assignment = await get_or_create_assignment_async(db, experiment_id, user_id)
     
-    return AssignmentResponse(
-        experiment_id=assignment.experiment_id,
-        user_id=assignment.user_id,
-        variant_id=assignment.variant_id,
-        variant_name=assignment.variant.name,
-        assigned_at=assignment.assigned_at
-    )
+    return _to_response(assignment)
+
+
+@router.post("/{experiment_id}/assignments", response_model=List[AssignmentResponse])
+async def bulk_assignment_endpoint(
+    experiment_id: int,
+    request: BulkAssignmentRequest,
+    db: Session = Depends(get_session),
+    token: str = Depends(verify_token)
+):
+    # many users, one experiment; duplicates in user_ids are returned once
+    assignments = await run_write(db, get_or_create_assignments_bulk, experiment_id, request.user_ids)
+    return [_to_response(a) for a in assignments]
+
+
+@users_router.get("/{user_id}/assignments", response_model=List[AssignmentResponse])
+async def user_assignments_endpoint(
+    user_id: str,
+    db: Session = Depends(get_session),
+    token: str = Depends(verify_token)
+):
+    # one user, every active experiment
+    assignments = await run_write(db, get_or_create_user_assignments, user_id)
+    return [_to_response(a) for a in assignments]
 
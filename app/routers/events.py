@@ -1,44 +1,65 @@
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+import logging
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from typing import List, Union
-from app.database import get_db
+from typing import List, Union, Optional, AsyncIterator, Tuple
+from app.config import settings
+from app.database import get_session, run_session
 from app.auth import verify_token
-from app.schemas import EventCreate, EventResponse
+from app.schemas import EventCreate, EventResponse, NdjsonIngestResponse, NdjsonLineError
 from app.services.event_service import create_event, create_events_batch
+from app.services.ingest_queue import event_ingest_queue, queue_events
+from app.services.write_forwarder import run_write, write_forwarder
 
 # # from fastapi import HTTPException
 # # from fastapi import BackgroundTasks
 # # from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/events", tags=["events"])
 
 
 @router.post("", response_model=Union[EventResponse, List[EventResponse]], status_code=201)
-def create_event_endpoint(
+async def create_event_endpoint(
     event_data: Union[EventCreate, List[EventCreate]],
-    db: Session = Depends(get_db),
-    token: str = Depends(verify_token)
+    db: Session = Depends(get_session),
+    token: str = Depends(verify_token),
+    mode: Optional[str] = Query(None, description="sync (default) or async: queue and return 202")
 ):
+    if mode not in (None, "sync", "async"):
+        raise HTTPException(status_code=400, detail="mode must be one of: sync, async")
+
+    if mode == "async":
+        # fire-and-forget: payload is validated, writes happen in a background group commit
+        events = event_data if isinstance(event_data, list) else [event_data]
+        if write_forwarder.enabled:
+            offered = await run_write(db, queue_events, events)  # the writer process owns the queue
+        else:
+            if not event_ingest_queue.is_running:
+                raise HTTPException(status_code=400, detail="Async event ingestion is not enabled")
+            offered = event_ingest_queue.offer(events)
+        if not offered:
+            raise HTTPException(
+                status_code=429,
+                detail="Event queue is full, retry later",
+                headers={"Retry-After": "1"}
+            )
+        return JSONResponse(status_code=202, content={"accepted": len(events)})
+
     if isinstance(event_data, list):
         # Batch creation
         # if not event_data:
         #     return []
-        events = create_events_batch(db, event_data)
-        out = []
-        for e in events:
-            out.append(EventResponse(
-                id=e.id,
-                user_id=e.user_id,
-                event_type=e.event_type,
-                timestamp=e.timestamp,
-                properties=e.properties,
-                experiment_id=e.experiment_id
-            ))
-        return out
+        # service already returns EventResponse rows (ids from INSERT ... RETURNING)
+        return await run_write(db, create_events_batch, event_data)
     else:
         # event_data = EventCreate.model_validate(event_data)
-        event = create_event(db, event_data)
+        event = await run_write(db, create_event, event_data)
         return EventResponse(
             id=event.id,
             user_id=event.user_id,
@@ -48,3 +69,124 @@ def create_event_endpoint(
             experiment_id=event.experiment_id
         )
 
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+
+
+async def _ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    Split a streamed body into (line_number, line) pairs as the bytes arrive.
+    A line longer than max_line_bytes is yielded as None and its remainder is
+    dropped, so the buffer never holds more than one (bounded) line.
+    """
+    buf = bytearray()
+    line_no = 0
+    skipping = False  # inside an over-long line, discard until the next newline
+    async for chunk in chunks:
+        start = 0
+        while True:
+            nl = chunk.find(b"\n", start)
+            if nl == -1:
+                if not skipping:
+                    buf += chunk[start:]
+                    if len(buf) > max_line_bytes:
+                        buf.clear()
+                        skipping = True
+                break
+            line_no += 1
+            if skipping:
+                skipping = False
+                yield line_no, None
+            else:
+                buf += chunk[start:nl]
+                yield line_no, (bytes(buf) if len(buf) <= max_line_bytes else None)
+                buf.clear()
+            start = nl + 1
+    if skipping:
+        yield line_no + 1, None
+    elif buf.strip():
+        yield line_no + 1, bytes(buf)
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'line'}: {err['msg']}"
+        for err in exc.errors()
+    )
+
+
+@router.post("/ndjson", response_model=NdjsonIngestResponse)
+async def ingest_ndjson_endpoint(
+    request: Request,
+    db: Session = Depends(get_session),
+    token: str = Depends(verify_token)
+):
+    """
+    Streaming bulk ingest: one event JSON object per line.
+
+    The body is read incrementally, each line is validated on arrival and
+    valid events are written every `NDJSON_CHUNK_SIZE` lines (one commit per
+    chunk), so memory does not grow with the upload. Invalid lines are
+    reported back by line number and do not stop the upload; neither does a
+    chunk whose write fails - all of its lines are reported as not stored.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in NDJSON_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail="Content-Type must be application/x-ndjson")
+
+    chunk_size = settings.ndjson_chunk_size
+    max_errors = settings.ndjson_max_errors
+    accepted = 0
+    rejected = 0
+    errors: List[NdjsonLineError] = []
+    pending: List[EventCreate] = []
+    pending_lines: List[int] = []
+
+    def reject(line_no: int, message: str) -> None:
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < max_errors:
+            errors.append(NdjsonLineError(line=line_no, error=message))
+
+    async def write_pending() -> None:
+        nonlocal accepted
+        try:
+            await run_write(db, create_events_batch, pending)
+        except (HTTPException, SQLAlchemyError) as e:
+            # the chunk is one transaction: none of its lines were stored
+            if isinstance(e, SQLAlchemyError):
+                logger.exception("NDJSON chunk write failed (%d events)", len(pending))
+                await run_session(db, Session.rollback)
+            detail = e.detail if isinstance(e, HTTPException) else "database error"
+            for line_no in pending_lines:
+                reject(line_no, f"not stored, chunk write failed: {detail}")
+        else:
+            accepted += len(pending)
+        pending.clear()
+        pending_lines.clear()
+
+    async for line_no, line in _ndjson_lines(request.stream(), settings.ndjson_max_line_bytes):
+        if line is None:
+            reject(line_no, f"line exceeds {settings.ndjson_max_line_bytes} bytes")
+            continue
+        if not line.strip():
+            continue
+        try:
+            pending.append(EventCreate.model_validate_json(line))
+        except ValidationError as e:
+            reject(line_no, _validation_message(e))
+            continue
+        pending_lines.append(line_no)
+        if len(pending) >= chunk_size:
+            await write_pending()
+
+    if pending:
+        await write_pending()
+
+    return NdjsonIngestResponse(
+        accepted=accepted,
+        rejected=rejected,
+        errors=errors,
+        errors_truncated=rejected > len(errors)
+    )
+
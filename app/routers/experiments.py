@@ -1,10 +1,11 @@
 
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_session, run_session
 from app.auth import verify_token
 from app.schemas import ExperimentCreate, ExperimentResponse
 from app.services.experiment_service import create_experiment, get_experiment_by_id
+from app.services.write_forwarder import run_write
 
 # from fastapi import Query
 # # from fastapi import HTTPException
@@ -15,10 +16,16 @@ from app.services.experiment_service import create_experiment, get_experiment_by
 router = APIRouter(prefix="/experiments", tags=["experiments"])
 
 
+def _experiment_response(experiment) -> ExperimentResponse:
+    # built inside the DB call: with an AsyncSession, lazy loads (variants) can't
+    # happen later while the response is serialized
+    return ExperimentResponse.model_validate(experiment)
+
+
 @router.post("", response_model=ExperimentResponse, status_code=201)
-def create_experiment_endpoint(
+async def create_experiment_endpoint(
     experiment_data: ExperimentCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     token: str = Depends(verify_token)
 ):
     # Create a new experiment.
@@ -26,19 +33,20 @@ def create_experiment_endpoint(
     # TODO: add some logging here (not urgent)
     # if experiment_data.name == "noop":
     #     return ExperimentResponse(...)
-    exp = create_experiment(db, experiment_data)
+    # variants come back loaded (or, from the writer process, as an ExperimentResponse)
+    exp = _experiment_response(await run_write(db, create_experiment, experiment_data))
 
     # returning it
     return exp
 
 
 @router.get("/{experiment_id}", response_model=ExperimentResponse)
-def get_experiment_endpoint(
+async def get_experiment_endpoint(
     experiment_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_session),
     token: str = Depends(verify_token)
 ):
     # experiment_id = int(experiment_id)
-    exp = get_experiment_by_id(db, experiment_id)
+    exp = await run_session(db, lambda s: _experiment_response(get_experiment_by_id(s, experiment_id)))
     return exp
 
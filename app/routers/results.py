@@ -1,12 +1,17 @@
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Header, Response, HTTPException
 from sqlalchemy.orm import Session
 from datetime import datetime
-from typing import Optional
-from app.database import get_db
+from typing import Optional, Tuple, Dict, Any
+import hashlib
+from app.config import settings
+from starlette.concurrency import run_in_threadpool
+from app.database import get_read_session, run_read, run_session
 from app.auth import verify_token
-from app.schemas import ExperimentResults
-from app.services.results_service import get_experiment_results
+from app.schemas import ExperimentResults, ResultsJobResponse
+from app.services.results_service import get_experiment_results, get_results_watermark
+from app.services.results_jobs import results_jobs, ResultsJob
+from app.utils.cache import get_results, set_results
 
 # # from fastapi import HTTPException
 # # from typing import Dict
@@ -15,31 +20,134 @@ from app.services.results_service import get_experiment_results
 router = APIRouter(prefix="/experiments", tags=["results"])
 
 
-@router.get("/{experiment_id}/results", response_model=ExperimentResults)
-def get_results_endpoint(
-    experiment_id: int,
-    db: Session = Depends(get_db),
-    token: str = Depends(verify_token),
+def results_params(
     start_date: Optional[datetime] = Query(None, description="Start date for filtering events (ISO format)"),
     end_date: Optional[datetime] = Query(None, description="End date for filtering events (ISO format)"),
     event_type: Optional[str] = Query(None, description="Filter by specific event type"),
     variant_id: Optional[int] = Query(None, description="Filter by specific variant ID"),
     primary_event_type: Optional[str] = Query(None, description="Primary conversion event type (e.g. purchase)"),
-    group_by: Optional[str] = Query(None, description="Aggregation level for time series: day or hour")
-):
-    # NOTE: only counts events after assignment timestamp (important)
-    # if start_date and end_date and start_date > end_date:
-    #     start_date, end_date = end_date, start_date
-    results = get_experiment_results(
-        db=db,
-        experiment_id=experiment_id,
+    group_by: Optional[str] = Query(None, description="Aggregation level for time series: hour, day or week"),
+    cumulative: bool = Query(False, description="Time series as running totals instead of per-bucket values"),
+    approx: bool = Query(False, description="Approximate distinct-user counts (HyperLogLog, ~1% error)"),
+    sample: Optional[float] = Query(None, gt=0, le=1, description="Preview over a stable hash-sampled fraction of users, e.g. 0.05"),
+    pairwise: bool = Query(False, description="Also compare every pair of variants, not just each vs baseline"),
+    ci_method: str = Query("normal", description="Comparison confidence intervals: normal or bootstrap"),
+    bootstrap_resamples: Optional[int] = Query(None, description="Bootstrap resamples (ci_method=bootstrap)"),
+    seed: Optional[int] = Query(None, ge=0, description="Bootstrap seed; the same seed reproduces the same intervals"),
+    metric: Optional[str] = Query(None, description="Continuous per-user metric, e.g. sum:properties.revenue"),
+    quantiles: Optional[str] = Query(None, description="p50/p90/p99 of an event property, e.g. properties.load_ms")
+) -> Dict[str, Any]:
+    """Results query parameters, shared by the sync endpoint and results jobs."""
+    return dict(
         start_date=start_date,
         end_date=end_date,
         event_type=event_type,
         variant_id=variant_id,
         primary_event_type=primary_event_type,
-        group_by=group_by
+        group_by=group_by,
+        cumulative=cumulative,
+        approx=approx,
+        sample=sample,
+        pairwise=pairwise,
+        ci_method=ci_method,
+        bootstrap_resamples=bootstrap_resamples,
+        seed=seed,
+        metric=metric,
+        quantiles=quantiles
     )
-    
+
+
+@router.get("/{experiment_id}/results", response_model=ExperimentResults)
+async def get_results_endpoint(
+    experiment_id: int,
+    response: Response,
+    db: Session = Depends(get_read_session),
+    token: str = Depends(verify_token),
+    query: Dict[str, Any] = Depends(results_params),
+    if_none_match: Optional[str] = Header(None)
+):
+    # NOTE: only counts events after assignment timestamp (important)
+    # if start_date and end_date and start_date > end_date:
+    #     start_date, end_date = end_date, start_date
+    async def compute() -> ExperimentResults:
+        # HLL/t-digest merges and folds are CPU work: off the event loop
+        return await run_read(db, get_experiment_results, experiment_id, **query)
+
+    if not settings.results_cache_enabled:
+        return await compute()
+
+    watermark = await run_session(db, get_results_watermark, experiment_id)
+    if watermark is None:
+        return await compute()  # raises the 404
+
+    params = tuple(query.values())
+    etag = _results_etag(experiment_id, params, watermark)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    cached = get_results(experiment_id, params)
+    if cached is not None and cached[0] == watermark:
+        results = cached[1]
+    else:
+        results = await compute()
+        set_results(experiment_id, params, watermark, results)
+
+    response.headers["ETag"] = etag
+    # clients may keep the body but must revalidate (cheap 304) before reuse
+    response.headers["Cache-Control"] = "no-cache"
     return results
 
+
+def _results_etag(experiment_id: int, params: Tuple, watermark: Tuple) -> str:
+    """Strong ETag from the query + data watermark; no need to compute results first."""
+    digest = hashlib.sha1(repr((experiment_id, params, watermark)).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison, as If-None-Match specifies
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+@router.post("/{experiment_id}/results/jobs", response_model=ResultsJobResponse, status_code=202)
+async def create_results_job_endpoint(
+    experiment_id: int,
+    db: Session = Depends(get_read_session),
+    token: str = Depends(verify_token),
+    query: Dict[str, Any] = Depends(results_params)
+):
+    """Compute results in the background; poll the returned job id."""
+    # cheap existence check so a typo'd id fails now rather than in the job
+    if await run_session(db, get_results_watermark, experiment_id) is None:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    # the first submit starts the pool's worker processes: keep that off the event loop
+    return _job_response(await run_in_threadpool(results_jobs.submit, experiment_id, query))
+
+
+@router.get("/{experiment_id}/results/jobs/{job_id}", response_model=ResultsJobResponse)
+async def get_results_job_endpoint(
+    experiment_id: int,
+    job_id: str,
+    token: str = Depends(verify_token)
+):
+    job = results_jobs.get(job_id)
+    if job is None or job.experiment_id != experiment_id:
+        raise HTTPException(status_code=404, detail="Results job not found (unknown or expired)")
+    return _job_response(job)
+
+
+def _job_response(job: ResultsJob) -> ResultsJobResponse:
+    return ResultsJobResponse(
+        job_id=job.id,
+        experiment_id=job.experiment_id,
+        status=job.status,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        results=job.results,
+        error=job.error
+    )
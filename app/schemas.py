@@ -50,6 +50,10 @@ class AssignmentResponse(BaseModel):
     assigned_at: datetime
 
 
+class BulkAssignmentRequest(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=10000)
+
+
 class EventCreate(BaseModel):
     user_id: str
     # NOTE: we accept "type" in JSON but map to event_type internally
@@ -79,6 +83,18 @@ class EventResponse(BaseModel):
         from_attributes = True
 
 
+class NdjsonLineError(BaseModel):
+    line: int
+    error: str
+
+
+class NdjsonIngestResponse(BaseModel):
+    accepted: int
+    rejected: int
+    errors: List[NdjsonLineError]
+    errors_truncated: bool = False
+
+
 class VariantMetrics(BaseModel):
     variant_id: int
     variant_name: str
@@ -94,6 +110,9 @@ class VariantMetrics(BaseModel):
     primary_conversion_rate: Optional[float] = None
     primary_events_per_assigned_user: Optional[float] = None
 
+    metric: Optional[Dict[str, Any]] = None  # continuous metric (metric=...), per assigned user
+    quantiles: Optional[Dict[str, Any]] = None  # p50/p90/p99 of an event property (quantiles=...)
+
 
 class ExperimentResults(BaseModel):
     experiment: ExperimentResponse
@@ -101,6 +120,8 @@ class ExperimentResults(BaseModel):
     variants: List[VariantMetrics]
     comparison: Optional[Dict[str, Any]] = None
     comparisons: Optional[List[Dict[str, Any]]] = None
+    pairwise_comparisons: Optional[List[Dict[str, Any]]] = None  # every variant pair, with pairwise=true
+    metric_comparisons: Optional[List[Dict[str, Any]]] = None  # Welch t-tests on metric=...
     timeseries: Optional[List[Dict[str, Any]]] = None
     srm: Optional[Dict[str, Any]] = None
     # Reporting fields
@@ -111,6 +132,16 @@ class ExperimentResults(BaseModel):
     comparison_matrix: Optional[List[Dict[str, Any]]] = None
     report_metadata: Optional[Dict[str, Any]] = None
 
+
+class ResultsJobResponse(BaseModel):
+    job_id: str
+    experiment_id: int
+    status: str  # queued, running, succeeded, failed
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    results: Optional[ExperimentResults] = None
+    error: Optional[Dict[str, Any]] = None
+
 # class EventType(str, Enum):
 #     click = "click"
 #     purchase = "purchase"
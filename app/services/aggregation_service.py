@@ -0,0 +1,396 @@
+"""Grouped SQL aggregations for the results endpoint.
+
+Everything here runs as GROUP BY / COUNT(DISTINCT) in the database, so the
+results code never has to pull raw event rows into Python.
+"""
+from sqlalchemy.orm import Session, Query
+from sqlalchemy import func, and_, case, distinct, literal, cast, Float
+from sqlalchemy.dialects import postgresql
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Sequence, Tuple
+from app.models import UserAssignment, Event
+from app.utils.assignment import SAMPLE_BUCKETS
+
+
+def event_assignment_join():
+    """Join condition: event belongs to an assigned user and happened after assignment."""
+    return and_(
+        Event.user_key == UserAssignment.user_key,
+        Event.experiment_id == UserAssignment.experiment_id,
+        Event.timestamp >= UserAssignment.assigned_at  # Only after assignment
+    )
+
+
+def as_datetime(value: Any) -> datetime:
+    """SQLite hands back strftime()/aggregate timestamps as strings."""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def bucket_key(dt: datetime, group_by: str) -> str:
+    """Timeseries bucket label (ISO timestamp of the bucket start; weeks start on Monday)."""
+    if group_by == "hour":
+        return dt.replace(minute=0, second=0, microsecond=0).isoformat()
+    day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if group_by == "week":
+        day -= timedelta(days=day.weekday())
+    return day.isoformat()
+
+
+# strftime formats for SQLite, date_trunc units elsewhere
+_SQLITE_BUCKET_FORMATS = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00", "week": "%Y-%m-%d 00:00:00"}
+
+
+def time_bucket_expr(db: Session, column, group_by: str):
+    """SQL expression truncating a timestamp column to the start of its hour/day/week."""
+    if db.get_bind().dialect.name == "sqlite":
+        if group_by == "week":
+            # forward to Sunday (no-op on Sundays), back to that week's Monday
+            return func.strftime(_SQLITE_BUCKET_FORMATS[group_by], column, "weekday 0", "-6 days")
+        return func.strftime(_SQLITE_BUCKET_FORMATS[group_by], column)
+    return func.date_trunc(group_by, column)
+
+
+def sample_threshold(rate: float) -> int:
+    """Users with a sample bucket below this are in a `rate` sample."""
+    return max(1, min(SAMPLE_BUCKETS, int(round(rate * SAMPLE_BUCKETS))))
+
+
+def sample_criteria(rate: float) -> List[Any]:
+    """
+    WHERE clause keeping a deterministic `rate` fraction of users: a range on the
+    stored sample_bucket, served by idx_assignments_experiment_sample. Event
+    queries join user_assignments, so the same clause samples their events.
+    """
+    return [UserAssignment.sample_bucket < sample_threshold(rate)]
+
+
+def joined_events_query(
+    db: Session,
+    experiment_id: int,
+    *columns,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None,
+    criteria: Sequence[Any] = ()
+) -> Query:
+    """
+    Events joined to their user's assignment, with the results filters applied.
+    Only events at or after the user's assigned_at are kept.
+    `criteria` are extra WHERE clauses (e.g. an event id range).
+    """
+    query = db.query(*columns).select_from(Event).join(
+        UserAssignment, event_assignment_join()
+    ).filter(
+        UserAssignment.experiment_id == experiment_id,
+        *criteria
+    )
+
+    if start_date:
+        query = query.filter(Event.timestamp >= start_date)
+    if end_date:
+        query = query.filter(Event.timestamp <= end_date)
+    if event_type:
+        query = query.filter(Event.event_type == event_type)
+    if variant_id:
+        query = query.filter(UserAssignment.variant_id == variant_id)
+
+    return query
+
+
+def event_type_counts(
+    db: Session,
+    experiment_id: int,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None,
+    criteria: Sequence[Any] = ()
+) -> List[Tuple[int, str, int]]:
+    """(variant_id, event_type, count) rows, grouped in the database."""
+    return joined_events_query(
+        db, experiment_id,
+        UserAssignment.variant_id,
+        Event.event_type,
+        func.count(Event.id),
+        start_date=start_date,
+        end_date=end_date,
+        event_type=event_type,
+        variant_id=variant_id,
+        criteria=criteria
+    ).group_by(UserAssignment.variant_id, Event.event_type).all()
+
+
+def unique_user_counts(
+    db: Session,
+    experiment_id: int,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None,
+    primary_event_type: Optional[str] = None,
+    criteria: Sequence[Any] = ()
+) -> List[Tuple[int, int, int]]:
+    """(variant_id, unique_users, primary_unique_users) rows in a single pass."""
+    primary_users = func.count(distinct(
+        case((Event.event_type == primary_event_type, Event.user_key))
+    )) if primary_event_type else literal(0)
+
+    return joined_events_query(
+        db, experiment_id,
+        UserAssignment.variant_id,
+        func.count(distinct(Event.user_key)),
+        primary_users,
+        start_date=start_date,
+        end_date=end_date,
+        event_type=event_type,
+        variant_id=variant_id,
+        criteria=criteria
+    ).group_by(UserAssignment.variant_id).all()
+
+
+def _bucket_map(rows) -> Dict[str, Dict[int, int]]:
+    """Fold (bucket, variant_id, count) rows into {bucket: {variant_id: count}}."""
+    out: Dict[str, Dict[int, int]] = {}
+    for b, v_id, cnt in rows:
+        out.setdefault(b, {})
+        out[b][v_id] = out[b].get(v_id, 0) + int(cnt or 0)
+    return out
+
+
+def assigned_counts(
+    db: Session,
+    experiment_id: int,
+    variant_id: Optional[int] = None,
+    criteria: Sequence[Any] = ()
+) -> Dict[int, int]:
+    """{variant_id: assigned users} in one GROUP BY."""
+    query = db.query(
+        UserAssignment.variant_id,
+        func.count(UserAssignment.id)
+    ).filter(UserAssignment.experiment_id == experiment_id, *criteria)
+    if variant_id:
+        query = query.filter(UserAssignment.variant_id == variant_id)
+    return dict(query.group_by(UserAssignment.variant_id).all())
+
+
+def assignment_buckets(
+    db: Session,
+    experiment_id: int,
+    group_by: str,
+    variant_id: Optional[int] = None,
+    criteria: Sequence[Any] = ()
+) -> Dict[str, Dict[int, int]]:
+    """{bucket: {variant_id: assigned}} for the timeseries, bucketed in SQL."""
+    bucket = time_bucket_expr(db, UserAssignment.assigned_at, group_by)
+    query = db.query(
+        bucket,
+        UserAssignment.variant_id,
+        func.count(UserAssignment.id)
+    ).filter(UserAssignment.experiment_id == experiment_id, *criteria)
+    if variant_id:
+        query = query.filter(UserAssignment.variant_id == variant_id)
+
+    rows = query.group_by(bucket, UserAssignment.variant_id)
+    return _bucket_map((bucket_key(as_datetime(b), group_by), v_id, cnt) for b, v_id, cnt in rows)
+
+
+def event_buckets(
+    db: Session,
+    experiment_id: int,
+    group_by: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None,
+    criteria: Sequence[Any] = ()
+) -> Dict[str, Dict[int, int]]:
+    """{bucket: {variant_id: events}}, bucketed in SQL."""
+    bucket = time_bucket_expr(db, Event.timestamp, group_by)
+    rows = joined_events_query(
+        db, experiment_id,
+        bucket,
+        UserAssignment.variant_id,
+        func.count(Event.id),
+        start_date=start_date,
+        end_date=end_date,
+        event_type=event_type,
+        variant_id=variant_id,
+        criteria=criteria
+    ).group_by(bucket, UserAssignment.variant_id)
+    return _bucket_map((bucket_key(as_datetime(b), group_by), v_id, cnt) for b, v_id, cnt in rows)
+
+
+def converting_user_buckets(
+    db: Session,
+    experiment_id: int,
+    group_by: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None,
+    primary_event_type: Optional[str] = None,
+    first_only: bool = False,
+    criteria: Sequence[Any] = ()
+) -> Dict[str, Dict[int, int]]:
+    """
+    {bucket: {variant_id: distinct converting users}}, counted in SQL.
+    A conversion is a primary_event_type event, or any event when unset.
+
+    first_only counts each user once, in the bucket of their first conversion;
+    a running sum over those buckets gives cumulative converted users.
+    """
+    if primary_event_type and event_type and event_type != primary_event_type:
+        return {}  # filtered to a type that can't convert
+    conversion_type = primary_event_type or event_type
+
+    if first_only:
+        first_at = func.min(Event.timestamp).label("first_at")
+        firsts = joined_events_query(
+            db, experiment_id,
+            UserAssignment.variant_id.label("variant_id"),
+            Event.user_key,
+            first_at,
+            start_date=start_date,
+            end_date=end_date,
+            event_type=conversion_type,
+            variant_id=variant_id,
+            criteria=criteria
+        ).group_by(UserAssignment.variant_id, Event.user_key).subquery()
+        bucket = time_bucket_expr(db, firsts.c.first_at, group_by)
+        rows = db.query(
+            bucket, firsts.c.variant_id, func.count()
+        ).select_from(firsts).group_by(bucket, firsts.c.variant_id)
+    else:
+        bucket = time_bucket_expr(db, Event.timestamp, group_by)
+        rows = joined_events_query(
+            db, experiment_id,
+            bucket,
+            UserAssignment.variant_id,
+            func.count(distinct(Event.user_key)),
+            start_date=start_date,
+            end_date=end_date,
+            event_type=conversion_type,
+            variant_id=variant_id,
+            criteria=criteria
+        ).group_by(bucket, UserAssignment.variant_id)
+
+    return _bucket_map((bucket_key(as_datetime(b), group_by), v_id, cnt) for b, v_id, cnt in rows)
+
+
+def property_value_expr(db: Session, path: Sequence[str]):
+    """Numeric value of a (nested) key in the JSON `Event.properties` text; NULL when absent."""
+    if db.get_bind().dialect.name == "sqlite":
+        return cast(func.json_extract(Event.properties, "$." + ".".join(path)), Float)
+    return cast(func.jsonb_extract_path_text(cast(Event.properties, postgresql.JSONB), *path), Float)
+
+
+# per-user aggregate of a property, for metric=<aggregation>:properties.<path>
+METRIC_AGGREGATIONS = {
+    "sum": func.sum,
+    "count": func.count,
+}
+
+
+def user_metric_moments(
+    db: Session,
+    experiment_id: int,
+    aggregation: str,
+    path: Sequence[str],
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None,
+    criteria: Sequence[Any] = ()
+) -> Dict[int, Tuple[int, float, float]]:
+    """
+    {variant_id: (users, sum, sum of squares)} of a per-user metric, e.g. revenue
+    per user, in one statement: the inner GROUP BY folds each user's events into
+    one value, the outer one folds users into moments per variant. Only users
+    with matching events appear; every other assigned user counts as 0.
+    """
+    per_user = joined_events_query(
+        db, experiment_id,
+        UserAssignment.variant_id.label("variant_id"),
+        func.coalesce(METRIC_AGGREGATIONS[aggregation](property_value_expr(db, path)), 0.0).label("value"),
+        start_date=start_date,
+        end_date=end_date,
+        event_type=event_type,
+        variant_id=variant_id,
+        criteria=criteria
+    ).group_by(UserAssignment.id, UserAssignment.variant_id).subquery()
+
+    rows = db.query(
+        per_user.c.variant_id,
+        func.count(),
+        func.sum(per_user.c.value),
+        func.sum(per_user.c.value * per_user.c.value)
+    ).group_by(per_user.c.variant_id).all()
+    return {v_id: (users, float(total or 0.0), float(squares or 0.0)) for v_id, users, total, squares in rows}
+
+
+def property_values(
+    db: Session,
+    experiment_id: int,
+    path: Sequence[str],
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None,
+    criteria: Sequence[Any] = ()
+) -> Query:
+    """
+    (timestamp, variant_id, value) per attributed event carrying the property.
+    Meant to be streamed (yield_per) into sketches, never collected or sorted.
+    """
+    value = property_value_expr(db, path)
+    return joined_events_query(
+        db, experiment_id,
+        Event.timestamp,
+        UserAssignment.variant_id,
+        value,
+        start_date=start_date,
+        end_date=end_date,
+        event_type=event_type,
+        variant_id=variant_id,
+        criteria=[*criteria, value.isnot(None)]
+    )
+
+
+def _empty_variant_stats() -> Dict[str, Any]:
+    return {
+        "event_count": 0,
+        "events_by_type": {},
+        "unique_users": 0,
+        "primary_event_count": 0,
+        "primary_unique_users": 0,
+    }
+
+
+def build_variant_stats(
+    type_counts: List[Tuple[int, str, int]],
+    user_counts: List[Tuple[int, int, int]],
+    primary_event_type: Optional[str] = None
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Fold grouped rows into {variant_id: {event_count, events_by_type, unique_users,
+    primary_event_count, primary_unique_users}}. Variants without any matching
+    events are left out; callers should use .get() with a default.
+    """
+    stats: Dict[int, Dict[str, Any]] = {}
+
+    for v_id, e_type, cnt in type_counts:
+        s = stats.setdefault(v_id, _empty_variant_stats())
+        s["events_by_type"][e_type] = s["events_by_type"].get(e_type, 0) + cnt
+        s["event_count"] += cnt
+        if primary_event_type and e_type == primary_event_type:
+            s["primary_event_count"] += cnt
+
+    for v_id, unique_users, primary_unique in user_counts:
+        s = stats.setdefault(v_id, _empty_variant_stats())
+        s["unique_users"] = unique_users or 0
+        s["primary_unique_users"] = primary_unique or 0
+
+    return stats
@@ -1,102 +1,292 @@
 
+from datetime import datetime, timezone
+from typing import List, Dict, Tuple, Sequence, Union
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from sqlalchemy.orm.exc import DetachedInstanceError
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
+from app.config import settings
 from app.models import Experiment, Variant, UserAssignment
-from app.utils.assignment import hash_user_experiment, assign_variant
-from app.utils.cache import get_assignment, set_assignment, get_experiment, set_experiment
+from app.database import dialect_insert, on_shard, routed_by_experiment, shard_path
+from app.services.assignment_writer import assignment_writer
+from app.services.rollup_service import fold_late_assignment_events
+from app.services.summary_service import record_assignments
+from app.services.user_keys import find_user_keys, user_keys
+from app.services.write_forwarder import run_write
+from app.utils.assignment import hash_user_experiment, build_allocation_table, assign_variants_batch
+from app.utils.cache import (
+    AssignmentRecord, ExperimentConfig, VariantConfig,
+    get_assignment, set_assignment, get_experiment_config, set_experiment_config
+)
 
 # # from sqlalchemy.exc import IntegrityError
 # # from sqlalchemy import select
 # # from sqlalchemy.exc import NoResultFound
 
 
+def _utc_now() -> datetime:
+    # same shape as the server-side CURRENT_TIMESTAMP default: naive UTC, whole seconds
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def get_assignment_config(db: Session, experiment_id: int) -> ExperimentConfig:
+    """
+    Status + variants needed to assign users, cached per experiment.
+    Status changes show up once the experiment cache entry expires or is cleared.
+    """
+    config = get_experiment_config(experiment_id)
+    if config is not None:
+        return config
+
+    row = db.query(Experiment.id, Experiment.status).filter(Experiment.id == experiment_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+
+    variants = db.query(
+        Variant.id, Variant.name, Variant.traffic_percentage
+    ).filter(
+        Variant.experiment_id == experiment_id
+    ).order_by(Variant.id).all()
+
+    config = ExperimentConfig(
+        id=row.id,
+        status=row.status,
+        variants=tuple(VariantConfig(v.id, v.name, v.traffic_percentage) for v in variants),
+        allocation=build_allocation_table([(v.id, v.traffic_percentage) for v in variants])
+    )
+    set_experiment_config(experiment_id, config)
+    return config
+
+
+@routed_by_experiment
 def get_or_create_assignment(
     db: Session, 
     experiment_id: int, 
     user_id: str
-) -> UserAssignment:
+) -> AssignmentRecord:
     """
     Get existing assignment or create new one.
     This is the core idempotent assignment logic.
+    Returns an immutable AssignmentRecord; cache hits never touch the DB.
     """
     cached = get_assignment(experiment_id, user_id)
-    if cached:
-        # return cached
-        # Cache stores the assignment object, but we need to refresh from DB
-        # to ensure we have the latest data
-        assignment = db.query(UserAssignment).filter(
-            UserAssignment.experiment_id == experiment_id,
-            UserAssignment.user_id == user_id
-        ).first()
-        if assignment:
-            return assignment
+    if cached is not None:
+        return cached
     
-    assignment = db.query(UserAssignment).filter(
-        UserAssignment.experiment_id == experiment_id,
-        UserAssignment.user_id == user_id
-    ).first()
-    
-    if assignment:
-        set_assignment(experiment_id, user_id, assignment)
-        return assignment
+    record = _lookup_assignments(db, [(experiment_id, user_id)]).get((experiment_id, user_id))
+    if record:
+        set_assignment(experiment_id, user_id, record)
+        return record
 
     
 
-    experiment = get_experiment(experiment_id)
-    if not experiment:
-        experiment = db.query(Experiment).filter(Experiment.id == experiment_id).first()
-        if not experiment:
-            raise HTTPException(status_code=404, detail="Experiment not found")
-        set_experiment(experiment_id, experiment)
-    # else:
-    #     db.refresh(experiment)
-
-    try:
-        status = experiment.status
-    except DetachedInstanceError:
-        status = db.query(Experiment.status).filter(Experiment.id == experiment_id).scalar()
-
-    if status != "active":
+    config = get_assignment_config(db, experiment_id)
+
+    if config.status != "active":
         raise HTTPException(
             status_code=400,
-            detail=f"Experiment is not active (status: {status})"
+            detail=f"Experiment is not active (status: {config.status})"
         )
     # if status == "paused":
     #     raise HTTPException(status_code=400, detail="Experiment paused")
     
-
-    variants = db.query(Variant).filter(
-        Variant.experiment_id == experiment_id
-    ).order_by(Variant.id).all()
-    
-    if not variants:
+    if not config.variants:
         raise HTTPException(
             status_code=400, 
             detail="Experiment has no variants configured"
         )
     
-    variant_percentages = [(v.id, v.traffic_percentage) for v in variants]
-    
     hash_value = hash_user_experiment(user_id, experiment_id)
     
-    variant_id = assign_variant(hash_value, variant_percentages)
-    
+    # precompiled table == assign_variant(hash_value, variant percentages)
+    variant_id = config.allocation[hash_value]
+    variant_name = next(v.name for v in config.variants if v.id == variant_id)
+
+    if settings.assignment_write_mode == "write_behind" and assignment_writer.is_running:
+        # respond now, the background writer persists the row (conflicts ignored)
+        record = AssignmentRecord(
+            id=None,
+            experiment_id=experiment_id,
+            user_id=user_id,
+            variant_id=variant_id,
+            variant_name=variant_name,
+            assigned_at=_utc_now()
+        )
+        if assignment_writer.submit(record):
+            set_assignment(experiment_id, user_id, record)
+            return record
+        # queue full -> fall through to a normal synchronous insert
 
-    new_assignment = UserAssignment(
+    # conflicts ignored: a concurrent request for the same user may insert first
+    stmt = dialect_insert(db)(UserAssignment).values(
         experiment_id=experiment_id,
         user_id=user_id,
+        user_key=user_keys(db, [user_id])[user_id],
         variant_id=variant_id
-    )
-    
-    db.add(new_assignment)
+    ).on_conflict_do_nothing(index_elements=["experiment_id", "user_key"]).returning(UserAssignment.id)
+    inserted = db.execute(stmt).scalars().all()
+    # events may have arrived (and been folded) before their assignment row did
+    record_assignments(db, inserted)
+    fold_late_assignment_events(db, inserted)
     # db.flush()
     db.commit()
-    db.refresh(new_assignment)
     
-    set_assignment(experiment_id, user_id, new_assignment)
+    # re-read so id/assigned_at are the stored ones (even if another writer won)
+    record = _lookup_assignments(db, [(experiment_id, user_id)])[(experiment_id, user_id)]
+    set_assignment(experiment_id, user_id, record)
     
-    return new_assignment
+    return record
 
     # return assignment
 
+
+async def get_or_create_assignment_async(
+    db: Union[Session, AsyncSession],
+    experiment_id: int,
+    user_id: str
+) -> AssignmentRecord:
+    """
+    get_or_create_assignment for async endpoints. Cache hits return right on
+    the event loop (no thread hop, no greenlet, no connection checkout); misses
+    run the same code through run_write (in the writer process, if forwarding).
+    """
+    cached = get_assignment(experiment_id, user_id)
+    if cached is not None:
+        return cached
+    record = await run_write(db, get_or_create_assignment, experiment_id, user_id)
+    set_assignment(experiment_id, user_id, record)  # forwarded calls fill this worker's cache too
+    return record
+
+
+# keeps (experiment_id, user_id) IN (...) lists under SQLite's parameter limit
+PAIR_CHUNK_SIZE = 400
+
+
+def _check_assignable(config: ExperimentConfig):
+    if config.status != "active":
+        raise HTTPException(
+            status_code=400,
+            detail=f"Experiment is not active (status: {config.status})"
+        )
+    if not config.variants:
+        raise HTTPException(
+            status_code=400,
+            detail="Experiment has no variants configured"
+        )
+
+
+def _lookup_assignments(
+    db: Session,
+    pairs: Sequence[Tuple[int, str]]
+) -> Dict[Tuple[int, str], AssignmentRecord]:
+    """Existing rows for many (experiment_id, user_id) pairs, one query per chunk."""
+    found: Dict[Tuple[int, str], AssignmentRecord] = {}
+    # users without a key have no assignment anywhere
+    keys = find_user_keys(db, [user_id for _, user_id in pairs])
+    pairs = [(exp_id, keys[user_id]) for exp_id, user_id in pairs if user_id in keys]
+    for i in range(0, len(pairs), PAIR_CHUNK_SIZE):
+        rows = db.query(
+            UserAssignment.id,
+            UserAssignment.experiment_id,
+            UserAssignment.user_id,
+            UserAssignment.variant_id,
+            Variant.name,
+            UserAssignment.assigned_at
+        ).join(
+            Variant, Variant.id == UserAssignment.variant_id
+        ).filter(
+            tuple_(UserAssignment.experiment_id, UserAssignment.user_key).in_(pairs[i:i + PAIR_CHUNK_SIZE])
+        ).all()
+        for row in rows:
+            found[(row[1], row[2])] = AssignmentRecord(*row)
+    return found
+
+
+def _resolve_assignments(
+    db: Session,
+    pairs: Sequence[Tuple[int, str]],
+    configs: Dict[int, ExperimentConfig]
+) -> Dict[Tuple[int, str], AssignmentRecord]:
+    """
+    Set-based get-or-create: cache, then one lookup for the misses, then a single
+    multi-row insert (conflicts ignored) for users that have no row yet.
+    """
+    resolved: Dict[Tuple[int, str], AssignmentRecord] = {}
+    misses = []
+    for exp_id, user_id in pairs:
+        cached = get_assignment(exp_id, user_id)
+        if cached is not None:
+            resolved[(exp_id, user_id)] = cached
+        else:
+            misses.append((exp_id, user_id))
+
+    if misses:
+        found = _lookup_assignments(db, misses)
+        missing = [p for p in misses if p not in found]
+
+        if missing:
+            by_experiment: Dict[int, List[str]] = {}
+            for exp_id, user_id in missing:
+                by_experiment.setdefault(exp_id, []).append(user_id)
+
+            keys = user_keys(db, [user_id for _, user_id in missing])
+            rows = []
+            for exp_id, user_ids in by_experiment.items():
+                variant_ids = assign_variants_batch(user_ids, exp_id, configs[exp_id].allocation)
+                rows.extend(
+                    {"experiment_id": exp_id, "user_id": u, "user_key": keys[u], "variant_id": v_id}
+                    for u, v_id in zip(user_ids, variant_ids)
+                )
+            stmt = dialect_insert(db)(UserAssignment).on_conflict_do_nothing(
+                index_elements=["experiment_id", "user_key"]
+            ).returning(UserAssignment.id)
+            inserted = db.execute(stmt, rows).scalars().all()
+            record_assignments(db, inserted)
+            fold_late_assignment_events(db, inserted)
+            db.commit()
+            # re-read so ids/assigned_at are the stored ones (even if another writer won)
+            found.update(_lookup_assignments(db, missing))
+
+        for key, record in found.items():
+            set_assignment(key[0], key[1], record)
+            resolved[key] = record
+
+    return resolved
+
+
+@routed_by_experiment
+def get_or_create_assignments_bulk(
+    db: Session,
+    experiment_id: int,
+    user_ids: List[str]
+) -> List[AssignmentRecord]:
+    """Assignments for many users in one experiment (same semantics as the single call)."""
+    config = get_assignment_config(db, experiment_id)
+    _check_assignable(config)
+
+    user_ids = list(dict.fromkeys(user_ids))  # dedupe, keep order
+    pairs = [(experiment_id, u) for u in user_ids]
+    resolved = _resolve_assignments(db, pairs, {experiment_id: config})
+    return [resolved[p] for p in pairs]
+
+
+def get_or_create_user_assignments(db: Session, user_id: str) -> List[AssignmentRecord]:
+    """Assignments for one user across every active experiment."""
+    experiment_ids = [
+        exp_id for (exp_id,) in
+        db.query(Experiment.id).filter(Experiment.status == "active").order_by(Experiment.id)
+    ]
+    configs = {exp_id: get_assignment_config(db, exp_id) for exp_id in experiment_ids}
+    # experiments without variants can't assign anyone; skip them here
+    pairs = [(exp_id, user_id) for exp_id in experiment_ids if configs[exp_id].variants]
+
+    resolved: Dict[Tuple[int, str], AssignmentRecord] = {}
+    local_pairs = []
+    for pair in pairs:
+        path = shard_path(db, pair[0])
+        if path is None:
+            local_pairs.append(pair)
+        else:
+            resolved.update(on_shard(path, _resolve_assignments, [pair], configs))
+    resolved.update(_resolve_assignments(db, local_pairs, configs))
+    return [resolved[p] for p in pairs]
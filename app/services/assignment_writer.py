@@ -0,0 +1,175 @@
+"""Write-behind persistence for assignments.
+
+In ASSIGNMENT_WRITE_MODE=write_behind the assignment endpoint answers from the
+cached experiment config and hands the new row to this writer. A daemon thread
+batches rows into multi-row INSERTs that ignore conflicts on
+idx_assignments_experiment_user, so a row that already exists (another worker,
+a retried request) is simply kept. A batch that keeps failing is given up on
+and its users' cached (id=None) records are dropped, so their next request
+goes through the synchronous insert instead of answering from the cache.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, dialect_insert, on_shard, shard_path
+from app.models import UserAssignment
+from app.services.rollup_service import fold_late_assignment_events
+from app.services.summary_service import record_assignments
+from app.services.user_keys import user_keys
+from app.utils.cache import AssignmentRecord, forget_assignment
+
+logger = logging.getLogger(__name__)
+
+
+def _insert_assignments(db: Session, records: List[AssignmentRecord]) -> int:
+    keys = user_keys(db, [r.user_id for r in records])
+    stmt = dialect_insert(db)(UserAssignment).on_conflict_do_nothing(
+        index_elements=["experiment_id", "user_key"]
+    ).returning(UserAssignment.id)
+    inserted = db.execute(stmt, [
+        {
+            "experiment_id": r.experiment_id,
+            "user_id": r.user_id,
+            "user_key": keys[r.user_id],
+            "variant_id": r.variant_id,
+            "assigned_at": r.assigned_at,
+        }
+        for r in records
+    ]).scalars().all()
+    # events may have arrived (and been folded) before their assignment row did
+    record_assignments(db, inserted)
+    fold_late_assignment_events(db, inserted)
+    db.commit()
+    return len(inserted)
+
+
+class AssignmentWriter:
+    """Background thread that batches assignment inserts."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        max_queue: int = 100000,
+        max_attempts: int = 3,
+        retry_delay: float = 0.5
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue: "queue.Queue[AssignmentRecord]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, record: AssignmentRecord) -> bool:
+        """Queue a row. Returns False if the queue is full (caller should write it itself)."""
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            return False
+
+    def write_batch(self, records: List[AssignmentRecord]) -> int:
+        """Insert rows, ignoring ones that already exist. Returns rows actually inserted."""
+        if not records:
+            return 0
+        db = self.session_factory()
+        try:
+            # with EVENT_SHARD_DIR, one insert per shard file
+            groups: Dict[Optional[str], List[AssignmentRecord]] = {}
+            paths = {exp_id: shard_path(db, exp_id) for exp_id in {r.experiment_id for r in records}}
+            for r in records:
+                groups.setdefault(paths[r.experiment_id], []).append(r)
+            return sum(
+                _insert_assignments(db, group) if path is None else on_shard(path, _insert_assignments, group)
+                for path, group in groups.items()
+            )
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _drain(self, first: Optional[AssignmentRecord] = None) -> List[AssignmentRecord]:
+        # collect up to batch_size rows or until flush_interval has passed
+        batch = [first] if first is not None else []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._write_or_forget(self._drain(first))
+
+    def _write_or_forget(self, batch: List[AssignmentRecord]) -> None:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.write_batch(batch)
+                return
+            except Exception:
+                logger.exception(
+                    "Assignment write-behind batch failed (%d rows, attempt %d of %d)",
+                    len(batch), attempt, self.max_attempts
+                )
+            if attempt < self.max_attempts:
+                self._stop.wait(self.retry_delay * attempt)  # no backoff once stopping
+        for record in batch:
+            forget_assignment(record.experiment_id, record.user_id, record)
+
+    def flush(self):
+        """Write everything still queued (used on shutdown)."""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self.write_batch(batch)
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="assignment-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+
+assignment_writer = AssignmentWriter(
+    batch_size=settings.assignment_writer_batch_size,
+    flush_interval=settings.assignment_writer_flush_ms / 1000.0,
+    max_queue=settings.assignment_writer_queue_size
+)
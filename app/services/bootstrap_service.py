@@ -0,0 +1,76 @@
+"""Bootstrap resampling for results?ci_method=bootstrap.
+
+Resamples are cut into fixed-size chunks, each with its own child seed of the
+request seed, and the chunks are spread over a process pool. Because chunking
+and seeds don't depend on the pool size, a given seed reproduces the same
+intervals whether the work ran on one worker or many.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.utils.stats import resample_means
+
+logger = logging.getLogger(__name__)
+
+# one variant's outcomes: (distinct values, number of users with each value)
+Sample = Tuple[Sequence[float], Sequence[int]]
+
+
+def _resample_chunk(samples: List[Sample], n_resamples: int, seed: np.random.SeedSequence) -> np.ndarray:
+    """Executed in a pool process (or inline). Returns means shaped (n_resamples, variants)."""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        resample_means(values, counts, n_resamples, rng) for values, counts in samples
+    ])
+
+
+class BootstrapPool:
+    """Runs bootstrap chunks on a lazily started process pool."""
+
+    def __init__(self, max_workers: int = 2, chunk_size: int = 500):
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the parent runs background threads holding locks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def resample_means(self, samples: List[Sample], n_resamples: int, seed: int) -> np.ndarray:
+        """Bootstrap means for every variant, shaped (n_resamples, len(samples))."""
+        sizes = [self.chunk_size] * (n_resamples // self.chunk_size)
+        if n_resamples % self.chunk_size:
+            sizes.append(n_resamples % self.chunk_size)
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+        if self.max_workers <= 0 or len(sizes) == 1:
+            chunks = [_resample_chunk(samples, size, s) for size, s in zip(sizes, seeds)]
+        else:
+            executor = self._get_executor()
+            chunks = list(executor.map(_resample_chunk, [samples] * len(sizes), sizes, seeds))
+        return np.concatenate(chunks)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+bootstrap_pool = BootstrapPool(
+    max_workers=settings.bootstrap_workers,
+    chunk_size=settings.bootstrap_chunk_size
+)
@@ -1,9 +1,16 @@
 
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+from app.database import on_shard, shard_path
 from app.models import Event
-from app.schemas import EventCreate
+from app.schemas import EventCreate, EventResponse
+from app.services.summary_service import record_events
+from app.services.user_keys import user_keys
 import json
-from typing import List
+from typing import List, Dict, Any, Optional
+
+# rows per INSERT ... RETURNING statement; bounds memory for 5k+ event batches
+EVENT_INSERT_CHUNK_SIZE = 1000
 
 # # from datetime import datetime, timezone
 # # from sqlalchemy.exc import SQLAlchemyError
@@ -12,6 +19,10 @@ from typing import List
 
 def create_event(db: Session, event_data: EventCreate) -> Event:
     """Create a single event"""
+    path = shard_path(db, event_data.experiment_id)
+    if path is not None:
+        return on_shard(path, create_event, event_data)
+
     properties_json = None
     if event_data.properties:
         properties_json = json.dumps(event_data.properties)
@@ -29,7 +40,9 @@ def create_event(db: Session, event_data: EventCreate) -> Event:
     #     event.experiment_id = None
     
     db.add(event)
-    # db.flush()
+    db.flush()
+    # keep per-user summaries in the same transaction
+    record_events(db, [event.id])
     db.commit()
     db.refresh(event)
     
@@ -38,36 +51,66 @@ def create_event(db: Session, event_data: EventCreate) -> Event:
     # return None
 
 
-def create_events_batch(db: Session, events_data: List[EventCreate]) -> List[Event]:
-    """Create multiple events in a batch - useful for bulk imports"""
-    events = []
-    
-    for event_data in events_data:
-        properties_json = None
-        if event_data.properties:
-            properties_json = json.dumps(event_data.properties)
-            # properties_json = json.dumps(event_data.properties, sort_keys=True)
-        
-        event = Event(
-            user_id=event_data.user_id,
-            event_type=event_data.type,
-            timestamp=event_data.timestamp,
-            properties=properties_json,
-            experiment_id=event_data.experiment_id
-        )
-        events.append(event)
-        db.add(event)
-        # if len(events) % 1000 == 0:
-        #     db.flush()
+def _event_row(event_data: EventCreate) -> Dict[str, Any]:
+    """Column values for one event, ready for a Core insert."""
+    properties_json = None
+    if event_data.properties:
+        properties_json = json.dumps(event_data.properties)
+        # properties_json = json.dumps(event_data.properties, sort_keys=True)
+    return {
+        "user_id": event_data.user_id,
+        "event_type": event_data.type,
+        "timestamp": event_data.timestamp,
+        "properties": properties_json,
+        "experiment_id": event_data.experiment_id,
+    }
+
+
+def create_events_batch(db: Session, events_data: List[EventCreate]) -> List[EventResponse]:
+    """
+    Create multiple events in a batch - useful for bulk imports.
+
+    Uses chunked multi-row INSERT ... RETURNING id instead of one ORM object
+    (and one refresh SELECT) per event; everything commits in one transaction
+    (one per shard file with EVENT_SHARD_DIR; results keep the input order).
+    """
+    paths = {exp_id: shard_path(db, exp_id) for exp_id in {e.experiment_id for e in events_data}}
+    if all(path is None for path in paths.values()):
+        return _insert_events(db, events_data)
+
+    groups: Dict[Optional[str], List[int]] = {}
+    for i, e in enumerate(events_data):
+        groups.setdefault(paths[e.experiment_id], []).append(i)
+
+    out: List[Optional[EventResponse]] = [None] * len(events_data)
+    for path, positions in groups.items():
+        subset = [events_data[i] for i in positions]
+        created = _insert_events(db, subset) if path is None else on_shard(path, _insert_events, subset)
+        for i, event in zip(positions, created):
+            out[i] = event
+    return out
+
+
+def _insert_events(db: Session, events_data: List[EventCreate]) -> List[EventResponse]:
+    out: List[EventResponse] = []
+    if not events_data:
+        return out
+
+    # NOTE: Core table, not the ORM entity - ORM bulk inserts regroup rows by
+    # which values are None and lose the single multi-row statement.
+    # returning(sort_by_parameter_order=True) would make SQLite fall back to one
+    # INSERT per row; rowids inside one write transaction are handed out in
+    # VALUES order, so sorting the returned ids lines them up with `rows`.
+    events_table = Event.__table__
+    stmt = insert(events_table).returning(events_table.c.id)
+    for i in range(0, len(events_data), EVENT_INSERT_CHUNK_SIZE):
+        chunk = events_data[i:i + EVENT_INSERT_CHUNK_SIZE]
+        keys = user_keys(db, [e.user_id for e in chunk])
+        rows = [dict(_event_row(e), user_key=keys[e.user_id]) for e in chunk]
+        ids = sorted(db.execute(stmt, rows).scalars().all())
+        record_events(db, ids)
+        out.extend(EventResponse(id=event_id, **row) for event_id, row in zip(ids, rows))
     
     db.commit()
     
-    # Refresh all events
-    for event in events:
-        db.refresh(event)
-        # _ = event.id
-    
-    return events
-
-    # return []
-
+    return out
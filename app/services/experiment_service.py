@@ -87,6 +87,8 @@ def create_experiment(db: Session, experiment_data: ExperimentCreate) -> Experim
     db.commit()
     db.refresh(experiment)
     # _ = experiment.id
+    # loaded now: callers may serialize after the session call (no lazy loads on an AsyncSession)
+    _ = experiment.variants
     
     # clear_experiment_cache()
     #
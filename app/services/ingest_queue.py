@@ -0,0 +1,169 @@
+"""Fire-and-forget event ingestion.
+
+POST /events?mode=async validates the payload, offers it to this in-process
+bounded queue and returns 202 right away. A single writer thread drains the
+queue in group commits (up to `batch_size` events or `flush_interval`
+seconds, whichever comes first) through create_events_batch, so many small
+requests share one transaction/fsync. A full queue rejects the whole request
+(the router answers 429) instead of blocking, and stop() flushes what is left.
+A single request larger than the whole queue could never fit and gets a 413.
+
+Queued events are not readable until their group commits, and are lost if the
+process dies before that - fine for tracking events, not for assignments. A
+group that fails to commit is split and retried, so a bad row only costs itself.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.schemas import EventCreate
+from app.services.event_service import create_events_batch
+
+logger = logging.getLogger(__name__)
+
+
+class EventIngestQueue:
+    """Bounded in-process queue + dedicated group-commit writer thread."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        max_events: int = 100000,
+        batch_size: int = 2000,
+        flush_interval: float = 0.2
+    ):
+        self.session_factory = session_factory
+        self.max_events = max_events
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._events: Deque[EventCreate] = deque()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending(self) -> int:
+        return len(self._events)
+
+    def offer(self, events: List[EventCreate]) -> bool:
+        """
+        Queue all events or none. Returns False when there is no room right now
+        (backpressure); a batch that can never fit raises 413 instead.
+        """
+        if len(events) > self.max_events:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch of {len(events)} events exceeds the async queue size ({self.max_events}); "
+                       f"split it or use mode=sync"
+            )
+        with self._cond:
+            if len(self._events) + len(events) > self.max_events:
+                return False
+            was_empty = not self._events
+            self._events.extend(events)
+            # wake the writer to start its flush timer, or because a batch is ready
+            if was_empty or len(self._events) >= self.batch_size:
+                self._cond.notify()
+            return True
+
+    def _take(self, limit: int) -> List[EventCreate]:
+        batch = []
+        while self._events and len(batch) < limit:
+            batch.append(self._events.popleft())
+        return batch
+
+    def _next_batch(self) -> List[EventCreate]:
+        # wait until a full batch is queued or the oldest event is flush_interval old
+        with self._cond:
+            if not self._events:
+                self._cond.wait(self.flush_interval)
+                if not self._events:
+                    return []
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._events) < self.batch_size and not self._stop.is_set():
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._cond.wait(timeout)
+            return self._take(self.batch_size)
+
+    def _write(self, batch: List[EventCreate]):
+        """Group-commit a batch; if it fails, write its halves so only the bad rows are lost."""
+        db = self.session_factory()
+        try:
+            create_events_batch(db, batch)
+            self.written += len(batch)
+            return
+        except Exception:
+            db.rollback()
+            if len(batch) == 1:
+                self.failed += 1
+                logger.exception("Dropped a queued event after its commit failed")
+                return
+            logger.warning("Group commit of %d queued events failed, retrying in halves", len(batch))
+        finally:
+            db.close()
+        middle = len(batch) // 2
+        self._write(batch[:middle])
+        self._write(batch[middle:])
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Write everything still queued."""
+        while True:
+            with self._cond:
+                batch = self._take(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="event-ingest-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+
+event_ingest_queue = EventIngestQueue(
+    max_events=settings.event_queue_max_events,
+    batch_size=settings.event_queue_batch_size,
+    flush_interval=settings.event_queue_flush_ms / 1000.0
+)
+
+
+def queue_events(db: Session, events: List[EventCreate]) -> bool:
+    """
+    POST /events?mode=async as a write operation (db is unused), so web workers
+    in the single-writer deployment can hand events to the writer's queue.
+    """
+    if not event_ingest_queue.is_running:
+        raise HTTPException(status_code=400, detail="Async event ingestion is not enabled")
+    return event_ingest_queue.offer(events)
@@ -0,0 +1,157 @@
+"""Background results jobs: heavy get_experiment_results calls run in a process pool.
+
+POST .../results/jobs submits a job and returns its id right away; GET polls
+it. Work happens in separate processes, so long analyses hold neither the
+GIL nor FastAPI's threadpool workers that assignment/ingest requests need.
+Finished jobs are kept in a bounded TTL store and then forgotten.
+"""
+import logging
+import multiprocessing
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, NamedTuple
+
+from cachetools import TTLCache
+from fastapi import HTTPException
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.database import SYNC_DATABASE_URL, make_engine
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# per worker process: one engine per database url
+_worker_sessions: Dict[str, sessionmaker] = {}
+
+
+def _run_results_job(database_url: str, experiment_id: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Executed in a pool process. Returns the results as JSON-ready data."""
+    # imported here so the spawned worker pays for app imports once, on first job
+    from app.services.results_service import get_experiment_results
+
+    session_factory = _worker_sessions.get(database_url)
+    if session_factory is None:
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=make_engine(
+            database_url, read_only=True
+        ), info={"read_only": True})
+        _worker_sessions[database_url] = session_factory
+
+    db = session_factory()
+    try:
+        return get_experiment_results(db, experiment_id, **params).model_dump(mode="json")
+    except HTTPException as e:
+        # HTTPException doesn't pickle cleanly; hand back its parts instead
+        return {"error": {"status_code": e.status_code, "detail": e.detail}}
+    finally:
+        db.close()
+
+
+class ResultsJob(NamedTuple):
+    """Snapshot of a job, as returned to pollers."""
+    id: str
+    experiment_id: int
+    status: str
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    results: Optional[Dict[str, Any]] = None
+    error: Optional[Dict[str, Any]] = None
+
+
+class ResultsJobManager:
+    """Submits results jobs to a process pool and keeps finished ones for polling."""
+
+    def __init__(
+        self,
+        database_url: str = SYNC_DATABASE_URL,
+        max_workers: int = 2,
+        max_pending: int = 100,
+        store_size: int = 200,
+        ttl_seconds: int = 3600
+    ):
+        self.database_url = database_url
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._finished: TTLCache = TTLCache(maxsize=store_size, ttl=ttl_seconds)
+        self._pending: Dict[str, tuple] = {}  # job id -> (ResultsJob, Future)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: the parent runs background threads holding locks
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def submit(self, experiment_id: int, params: Dict[str, Any]) -> ResultsJob:
+        """Queue a results computation. Raises 429 when too many jobs are pending."""
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many results jobs pending, retry later",
+                    headers={"Retry-After": "5"}
+                )
+            job = ResultsJob(
+                id=uuid.uuid4().hex,
+                experiment_id=experiment_id,
+                status=QUEUED,
+                created_at=datetime.now(timezone.utc)
+            )
+            future = self._get_executor().submit(_run_results_job, self.database_url, experiment_id, params)
+            self._pending[job.id] = (job, future)
+        future.add_done_callback(lambda f, job_id=job.id: self._finish(job_id, f))
+        return job
+
+    def _finish(self, job_id: str, future: Future) -> None:
+        with self._lock:
+            entry = self._pending.pop(job_id, None)
+            if entry is None:
+                return
+            job = entry[0]
+            try:
+                data = future.result()
+            except Exception as e:
+                logger.exception("Results job %s failed", job_id)
+                data = {"error": {"status_code": 500, "detail": str(e) or type(e).__name__}}
+            finished_at = datetime.now(timezone.utc)
+            if "error" in data:
+                job = job._replace(status=FAILED, finished_at=finished_at, error=data["error"])
+            else:
+                job = job._replace(status=SUCCEEDED, finished_at=finished_at, results=data)
+            self._finished[job_id] = job
+
+    def get(self, job_id: str) -> Optional[ResultsJob]:
+        """Current state of a job, or None if unknown / evicted."""
+        with self._lock:
+            job = self._finished.get(job_id)
+            if job is not None:
+                return job
+            entry = self._pending.get(job_id)
+        if entry is None:
+            return None
+        job, future = entry
+        return job._replace(status=RUNNING) if future.running() else job
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+results_jobs = ResultsJobManager(
+    max_workers=settings.results_job_workers,
+    max_pending=settings.results_job_max_pending,
+    store_size=settings.results_job_store_size,
+    ttl_seconds=settings.results_job_ttl
+)
@@ -1,18 +1,48 @@
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, case
+from sqlalchemy import func
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from app.models import Experiment, Variant, UserAssignment, Event
 from app.schemas import ExperimentResults, VariantMetrics, ExperimentResponse, VariantResponse
+from app.services.aggregation_service import (
+    event_type_counts, unique_user_counts, build_variant_stats,
+    assigned_counts, assignment_buckets, event_buckets, converting_user_buckets,
+    sample_criteria, sample_threshold, user_metric_moments, METRIC_AGGREGATIONS,
+    property_values, bucket_key, as_datetime
+)
+from app.services.rollup_service import (
+    is_bucket_aligned, rollup_event_type_counts, rollup_assigned_counts,
+    rollup_event_buckets, rollup_assignment_buckets,
+    sketch_unique_user_counts, sketch_converting_user_buckets, iter_digests
+)
+from app.services.summary_service import summary_unique_user_counts
+from app.services.bootstrap_service import bootstrap_pool
+from app.config import settings
+from app.database import routed_by_experiment, run_blocking
+from app.utils.assignment import SAMPLE_BUCKETS
+from app.utils.hll import error_bound
+from app.utils.tdigest import TDigest
+from app.utils.stats import compare_proportions, all_pairs, srm_test, bootstrap_intervals, welch_t_test
 from fastapi import HTTPException
 import math
+import re
+import secrets
+
+TIMESERIES_GROUPS = ("hour", "day", "week")
+CI_METHODS = ("normal", "bootstrap")
+_PROPERTY_PATH = r"properties\.([A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*)"
+_METRIC_PATTERN = re.compile(rf"^({'|'.join(METRIC_AGGREGATIONS)}):{_PROPERTY_PATH}$")
+_QUANTILES_PATTERN = re.compile(rf"^{_PROPERTY_PATH}$")
+QUANTILE_LEVELS = (0.5, 0.9, 0.99)
+MIN_BOOTSTRAP_RESAMPLES = 100
 
 # # from sqlalchemy import select
 # # from math import isfinite
 # # from collections import defaultdict
 
 
+@routed_by_experiment
 def get_experiment_results(
     db: Session,
     experiment_id: int,
@@ -21,11 +51,28 @@ def get_experiment_results(
     event_type: Optional[str] = None,
     variant_id: Optional[int] = None,
     primary_event_type: Optional[str] = None,
-    group_by: Optional[str] = None
+    group_by: Optional[str] = None,
+    cumulative: bool = False,
+    approx: bool = False,
+    sample: Optional[float] = None,
+    pairwise: bool = False,
+    ci_method: str = "normal",
+    bootstrap_resamples: Optional[int] = None,
+    seed: Optional[int] = None,
+    metric: Optional[str] = None,
+    quantiles: Optional[str] = None
 ) -> ExperimentResults:
     """
     Calculate experiment results with various filters.
     Only counts events that occur AFTER user's assignment timestamp.
+    With `sample` (0-1], everything is computed over a hash-selected subset of
+    users; counts are scaled up, significance tests use the sampled users.
+    With ci_method="bootstrap", comparison CIs are percentile bootstrap
+    intervals; the same `seed` reproduces them exactly.
+    `metric` (e.g. "sum:properties.revenue") adds a per-user continuous metric,
+    aggregated as moments in SQL and compared with Welch t-tests.
+    `quantiles` (e.g. "properties.load_ms") adds p50/p90/p99 of an event
+    property per variant (and per time bucket) from mergeable t-digests.
     """
     experiment = db.query(Experiment).filter(Experiment.id == experiment_id).first()
     if not experiment:
@@ -43,77 +90,126 @@ def get_experiment_results(
         raise HTTPException(status_code=400, detail="Experiment has no variants")
     
 
-    # This is the key requirement: events must be after assigned_at
-    # TODO: Could optimize this query for very large datasets with better indexing
-    events_query = db.query(
-        Event,
-        UserAssignment.assigned_at,
-        UserAssignment.variant_id
-    ).join(
-        UserAssignment,
-        and_(
-            Event.user_id == UserAssignment.user_id,
-            Event.experiment_id == UserAssignment.experiment_id,
-            Event.timestamp >= UserAssignment.assigned_at  # Only after assignment
-        )
-    ).filter(
-        UserAssignment.experiment_id == experiment_id
+    # Validate grouping param early
+    if group_by is not None and group_by not in TIMESERIES_GROUPS:
+        raise HTTPException(status_code=400, detail="group_by must be one of: hour, day, week")
+    if sample is not None and not (0 < sample <= 1):
+        raise HTTPException(status_code=400, detail="sample must be in (0, 1]")
+    if ci_method not in CI_METHODS:
+        raise HTTPException(status_code=400, detail="ci_method must be one of: normal, bootstrap")
+    if ci_method == "bootstrap":
+        if bootstrap_resamples is None:
+            bootstrap_resamples = settings.bootstrap_resamples
+        if not (MIN_BOOTSTRAP_RESAMPLES <= bootstrap_resamples <= settings.bootstrap_max_resamples):
+            raise HTTPException(
+                status_code=400,
+                detail=f"bootstrap_resamples must be between {MIN_BOOTSTRAP_RESAMPLES} and {settings.bootstrap_max_resamples}"
+            )
+        if seed is not None and seed < 0:
+            raise HTTPException(status_code=400, detail="seed must be non-negative")
+    metric_spec = _parse_metric(metric) if metric else None
+    quantile_property = None
+    if quantiles:
+        match = _QUANTILES_PATTERN.match(quantiles)
+        if not match:
+            raise HTTPException(status_code=400, detail="quantiles must look like properties.<key>, e.g. properties.load_ms")
+        quantile_property = match.group(1)
+
+    # This is the key requirement: events must be after assigned_at.
+    # Counting + distinct users happen in SQL (GROUP BY variant_id, event_type),
+    # so we never load the joined event rows themselves.
+    filters = dict(
+        start_date=start_date,
+        end_date=end_date,
+        event_type=event_type,
+        variant_id=variant_id,
     )
-    
-    # Apply filters
-    if start_date:
-        events_query = events_query.filter(Event.timestamp >= start_date)
-    if end_date:
-        events_query = events_query.filter(Event.timestamp <= end_date)
-    if event_type:
-        events_query = events_query.filter(Event.event_type == event_type)
-    if variant_id:
-        events_query = events_query.filter(UserAssignment.variant_id == variant_id)
-    # events_query = events_query.limit(1000)
-    
-    event_results = events_query.all()
+    # sample=<rate>: a stable hash-selected subset of users, a range on the indexed
+    # user_assignments.sample_bucket, so the database reads proportionally fewer
+    # rows. Rollups/summaries are pre-aggregated over everyone, so they're skipped.
+    sampling = sample is not None and sample < 1
+    assignment_criteria: List[Any] = []
+    event_criteria: List[Any] = []
+    if sampling:
+        assignment_criteria = event_criteria = sample_criteria(sample)
+
+    # Hourly rollups can answer counts when the date range sits on bucket boundaries
+    use_rollups = (
+        settings.results_use_rollups and not sampling
+        and is_bucket_aligned(start_date) and is_bucket_aligned(end_date)
+    )
+    if use_rollups:
+        type_counts = rollup_event_type_counts(db, experiment_id, **filters)
+    else:
+        type_counts = event_type_counts(db, experiment_id, criteria=event_criteria, **filters)
+
+    # approx=true: distinct users from the per-bucket HyperLogLog sketches
+    use_sketches = approx and use_rollups and settings.rollup_sketches_enabled
+    if use_sketches:
+        user_counts = sketch_unique_user_counts(db, experiment_id, primary_event_type=primary_event_type, **filters)
+    # Per-user summaries answer distinct-user counts unless a start_date cuts into them
+    elif settings.results_use_user_summaries and start_date is None and not sampling:
+        user_counts = summary_unique_user_counts(
+            db, experiment_id,
+            end_date=end_date,
+            event_type=event_type,
+            variant_id=variant_id,
+            primary_event_type=primary_event_type
+        )
+    else:
+        user_counts = unique_user_counts(
+            db, experiment_id, primary_event_type=primary_event_type, criteria=event_criteria, **filters
+        )
 
-    # Validate grouping param early
-    if group_by not in (None, "day", "hour"):
-        raise HTTPException(status_code=400, detail="group_by must be one of: day, hour")
+    event_stats = build_variant_stats(type_counts, user_counts, primary_event_type)
+    # assignment totals ignore the date filters, so rollups always apply
+    if settings.results_use_rollups and not sampling:
+        assigned_by_variant = rollup_assigned_counts(db, experiment_id)
+    else:
+        assigned_by_variant = assigned_counts(db, experiment_id, variant_id=variant_id, criteria=assignment_criteria)
     
+    # continuous metric: (users, sum, sum of squares) per variant from one SQL pass
+    metric_moments: Dict[int, Tuple[int, float, float]] = {}
+    if metric_spec:
+        metric_moments = user_metric_moments(
+            db, experiment_id, *metric_spec, criteria=event_criteria, **filters
+        )
+
+    # quantiles: hourly t-digests merged per variant (and per time bucket); raw
+    # values are streamed into digests when rollups can't answer the query
+    quantile_digests: Dict[int, TDigest] = {}
+    quantile_bucket_digests: Dict[str, Dict[int, TDigest]] = {}
+    if quantile_property:
+        use_digests = use_rollups and quantile_property in settings.rollup_quantile_properties
+        if use_digests:
+            digest_rows = iter_digests(db, experiment_id, quantile_property, **filters)
+        else:
+            digest_rows = property_values(
+                db, experiment_id, quantile_property.split("."), criteria=event_criteria, **filters
+            ).yield_per(10000)
+        quantile_digests, quantile_bucket_digests = _fold_digests(digest_rows, group_by)
+
     variant_metrics_list = []
     total_assigned = 0
     total_events = 0
     
     for variant in variants:
-        assigned_count = db.query(func.count(UserAssignment.id)).filter(
-            UserAssignment.experiment_id == experiment_id,
-            UserAssignment.variant_id == variant.id
-        ).scalar() or 0
+        assigned_count = assigned_by_variant.get(variant.id, 0)
         
         total_assigned += assigned_count
         
-        variant_events = [
-            (e, assigned_at, v_id) for e, assigned_at, v_id in event_results
-            if v_id == variant.id
-        ]
-        
-        event_count = len(variant_events)
+        stats = event_stats.get(variant.id, {})
+        event_count = stats.get("event_count", 0)
         total_events += event_count
         
-        events_by_type = {}
-        unique_users = set()
-        primary_unique_users = set()
-        primary_event_count = 0
-        
-        for event, assigned_at, v_id in variant_events:
-            event_type = event.event_type
-            events_by_type[event_type] = events_by_type.get(event_type, 0) + 1
-            unique_users.add(event.user_id)
-
-            if primary_event_type and event.event_type == primary_event_type:
-                primary_event_count += 1
-                primary_unique_users.add(event.user_id)
+        events_by_type = stats.get("events_by_type", {})
+        unique_users = stats.get("unique_users", 0)
+        primary_unique_users = stats.get("primary_unique_users", 0)
+        primary_event_count = stats.get("primary_event_count", 0)
         
         conversion_rate = 0.0
         if assigned_count > 0:
-            conversion_rate = len(unique_users) / assigned_count
+            conversion_rate = unique_users / assigned_count
         # conversion_rate = 0.0 if assigned_count == 0 else (event_count / assigned_count)
         
         variant_metrics = VariantMetrics(
@@ -123,19 +219,27 @@ def get_experiment_results(
             event_count=event_count,
             events_by_type=events_by_type,
             conversion_rate=round(conversion_rate, 4),
-            unique_users_with_events=len(unique_users),
+            unique_users_with_events=unique_users,
 
             primary_event_type=primary_event_type,
             primary_event_count=primary_event_count if primary_event_type else None,
-            primary_unique_users=len(primary_unique_users) if primary_event_type else None,
+            primary_unique_users=primary_unique_users if primary_event_type else None,
             primary_conversion_rate=(
-                round((len(primary_unique_users) / assigned_count), 4)
+                round((primary_unique_users / assigned_count), 4)
                 if (primary_event_type and assigned_count > 0) else (0.0 if primary_event_type else None)
             ),
             primary_events_per_assigned_user=(
                 round((primary_event_count / assigned_count), 4)
                 if (primary_event_type and assigned_count > 0) else (0.0 if primary_event_type else None)
             ),
+            metric=(
+                _metric_stats(metric, assigned_count, metric_moments.get(variant.id, (0, 0.0, 0.0)))
+                if metric_spec else None
+            ),
+            quantiles=(
+                _quantile_stats(quantiles, quantile_digests.get(variant.id), with_bounds=True)
+                if quantile_property else None
+            ),
         )
         
         variant_metrics_list.append(variant_metrics)
@@ -148,175 +252,106 @@ def get_experiment_results(
             "end": end_date.isoformat() if end_date else None
         }
     }
+    if quantile_property:
+        summary["quantiles"] = {
+            "property": quantiles,
+            "method": "tdigest",
+            "source": "rollup_digests" if use_digests else "events",
+        }
+    if approx:
+        # sketches need hour-aligned dates; otherwise the counts stay exact
+        summary["distinct_counts"] = error_bound() if use_sketches else {"method": "exact"}
 
     # SRM (Sample Ratio Mismatch): expected split (traffic %) vs observed assignments.
-    # Uses chi-square goodness-of-fit; p-value uses Wilson–Hilferty normal approximation (no scipy).
+    # Chi-square goodness-of-fit with an exact chi-square p-value (utils/stats.py).
     srm = None
     if total_assigned > 0 and len(variants) >= 2:
-        expected_split = {v.id: float(v.traffic_percentage) for v in variants}
-        observed_split = {}
-        chi_square = 0.0
-
-        # observed split based on assignments
-        for vm in variant_metrics_list:
-            observed_split[vm.variant_id] = (vm.assigned_count / total_assigned) * 100.0
-
-        # chi-square stat
-        for vm in variant_metrics_list:
-            exp_cnt = total_assigned * (expected_split.get(vm.variant_id, 0.0) / 100.0)
-            obs_cnt = vm.assigned_count
-            if exp_cnt > 0:
-                chi_square += ((obs_cnt - exp_cnt) ** 2) / exp_cnt
-
-        df = max(len(variant_metrics_list) - 1, 1)
-
-        def _norm_cdf(z: float) -> float:
-            return 0.5 * (1.0 + math.erf(z / math.sqrt(2.0)))
-
-        # Wilson–Hilferty transform to approximate chi-square survival function
-        p_value = None
-        if chi_square >= 0 and df > 0:
-            w = ((chi_square / df) ** (1.0 / 3.0) - (1.0 - 2.0 / (9.0 * df))) / math.sqrt(2.0 / (9.0 * df))
-            # sf = 1 - cdf
-            p_value = 1.0 - _norm_cdf(w)
-
-        # Common SRM threshold in A/B testing is 0.01
-        flagged = (p_value is not None) and (p_value < 0.01)
-
-        srm = {
-            "total_assigned": total_assigned,
-            "expected_split_percent": {str(k): round(v, 4) for k, v in expected_split.items()},
-            "observed_split_percent": {str(k): round(v, 4) for k, v in observed_split.items()},
-            "chi_square": round(chi_square, 6),
-            "df": df,
-            "p_value": None if p_value is None else round(p_value, 8),
-            "flagged": flagged,
-        }
+        srm = _srm_check(variants, variant_metrics_list, total_assigned)
 
-    # Stats helper: baseline vs variant (two-proportion z-test)
-    def _norm_cdf(z: float) -> float:
-        return 0.5 * (1.0 + math.erf(z / math.sqrt(2.0)))
-
-    def _compare_variants(baseline: VariantMetrics, treatment: VariantMetrics) -> Dict[str, Any]:
-        # Choose which conversion to use: primary (if requested) otherwise default.
-        if primary_event_type:
-            x1 = baseline.primary_unique_users or 0
-            n1 = baseline.assigned_count
-            x2 = treatment.primary_unique_users or 0
-            n2 = treatment.assigned_count
-            p1 = baseline.primary_conversion_rate or 0.0
-            p2 = treatment.primary_conversion_rate or 0.0
-        else:
-            x1 = baseline.unique_users_with_events
-            n1 = baseline.assigned_count
-            x2 = treatment.unique_users_with_events
-            n2 = treatment.assigned_count
-            p1 = baseline.conversion_rate
-            p2 = treatment.conversion_rate
-
-        # Lift based on chosen conversion rate
-        if p1 > 0:
-            lift = ((p2 - p1) / p1) * 100
-        else:
-            lift = 0.0 if p2 == 0 else float('inf')
-
-        alpha = 0.05
-        z_score = None
-        p_value = None
-        significant = None
-        conf_int_95 = None
-
-        if n1 > 0 and n2 > 0:
-            # pooled proportion for z-test
-            p_pool = (x1 + x2) / (n1 + n2)
-            se = math.sqrt(max(p_pool * (1.0 - p_pool) * (1.0 / n1 + 1.0 / n2), 0.0))
-            if se > 0:
-                z_score = (p2 - p1) / se
-                p_value = 2.0 * (1.0 - _norm_cdf(abs(z_score)))
-                significant = p_value < alpha
-
-            # 95% CI for difference in proportions (unpooled SE)
-            se_diff = math.sqrt(max((p1 * (1.0 - p1) / n1) + (p2 * (1.0 - p2) / n2), 0.0))
-            if se_diff > 0:
-                z_crit = 1.96
-                lo = (p2 - p1) - z_crit * se_diff
-                hi = (p2 - p1) + z_crit * se_diff
-                conf_int_95 = {"diff_low": round(lo, 6), "diff_high": round(hi, 6)}
-
-        return {
-            "baseline": baseline.variant_name,
-            "baseline_variant_id": baseline.variant_id,
-            "treatment": treatment.variant_name,
-            "treatment_variant_id": treatment.variant_id,
-            "lift_percentage": round(lift, 2),
-            "alpha": alpha,
-            "baseline_assigned": n1,
-            "treatment_assigned": n2,
-            "baseline_converted": x1,
-            "treatment_converted": x2,
-            "z_score": None if z_score is None else round(z_score, 6),
-            "p_value": None if p_value is None else round(p_value, 8),
-            "significant": significant,
-            "conversion_rate_diff_ci_95": conf_int_95,
-            "metric": primary_event_type or "any_event",
-        }
-
-    # Multi-variant comparisons (each vs baseline)
+    # Multi-variant comparisons (each vs baseline), all pairs in one vectorized pass
     comparisons = None
     comparison = None  # keep old field for backwards compatibility (baseline vs first treatment)
+    pairwise_comparisons = None
     if len(variant_metrics_list) >= 2:
-        baseline = variant_metrics_list[0]
-        comparisons = []
-        for vm in variant_metrics_list[1:]:
-            comparisons.append(_compare_variants(baseline, vm))
-
+        boot_means = None
+        if ci_method == "bootstrap":
+            # one resampling run serves both the baseline and the pairwise rows
+            if seed is None:
+                seed = secrets.randbits(32)
+            # off the event loop when called through an AsyncSession
+            boot_means = run_blocking(
+                bootstrap_pool.resample_means,
+                _conversion_samples(variant_metrics_list, primary_event_type), bootstrap_resamples, seed
+            )
+            summary["bootstrap"] = {"method": "percentile", "resamples": bootstrap_resamples, "seed": seed}
+        comparisons = _comparison_rows(variant_metrics_list, primary_event_type, bootstrap_means=boot_means)
         comparison = comparisons[0] if comparisons else None
+        if pairwise:
+            pairwise_comparisons = _comparison_rows(
+                variant_metrics_list, primary_event_type, all_pairs(len(variant_metrics_list)),
+                bootstrap_means=boot_means
+            )
+
+    metric_comparisons = None
+    if metric_spec and len(variant_metrics_list) >= 2:
+        metric_comparisons = _metric_comparison_rows(
+            variant_metrics_list, metric_moments,
+            all_pairs(len(variant_metrics_list)) if pairwise else None
+        )
 
     # Time-series aggregation (optional)
+    # Bucketing and distinct-user counts run in SQL; Python only sees one
+    # (bucket, variant, count) row per bucket, never user ids.
     timeseries = None
-    if group_by in ("day", "hour"):
-        # Pull assignments for bucketing assigned users
-        assignments_q = db.query(UserAssignment).filter(UserAssignment.experiment_id == experiment_id)
-        if variant_id:
-            assignments_q = assignments_q.filter(UserAssignment.variant_id == variant_id)
-        assignments = assignments_q.all()
-
-        def _bucket_key(dt: datetime) -> str:
-            if group_by == "hour":
-                return dt.replace(minute=0, second=0, microsecond=0).isoformat()
-            return dt.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-
-        # assigned per bucket + variant
-        assigned_by_bucket: Dict[str, Dict[int, int]] = {}
-        for a in assignments:
-            b = _bucket_key(a.assigned_at)
-            assigned_by_bucket.setdefault(b, {})
-            assigned_by_bucket[b][a.variant_id] = assigned_by_bucket[b].get(a.variant_id, 0) + 1
-
-        # conversions/events per bucket + variant (from event_results)
-        events_by_bucket: Dict[str, Dict[int, int]] = {}
-        conv_users_by_bucket: Dict[str, Dict[int, set]] = {}
-        for e, assigned_at, v_id in event_results:
-            b = _bucket_key(e.timestamp)
-            events_by_bucket.setdefault(b, {})
-            events_by_bucket[b][v_id] = events_by_bucket[b].get(v_id, 0) + 1
-
-            # conversion user tracking (primary if requested, otherwise any event)
-            if (primary_event_type is None) or (e.event_type == primary_event_type):
-                conv_users_by_bucket.setdefault(b, {})
-                conv_users_by_bucket[b].setdefault(v_id, set())
-                conv_users_by_bucket[b][v_id].add(e.user_id)
-
-        # Build rows sorted by time
-        all_buckets = sorted(set(assigned_by_bucket.keys()) | set(events_by_bucket.keys()) | set(conv_users_by_bucket.keys()))
+    if group_by in TIMESERIES_GROUPS:
+        if use_rollups:
+            # assigned/events per bucket come from the hourly rollups
+            assigned_by_bucket = rollup_assignment_buckets(db, experiment_id, group_by, variant_id=variant_id)
+            events_by_bucket = rollup_event_buckets(db, experiment_id, group_by, **filters)
+        else:
+            # assigned per bucket + variant, grouped in SQL (no assignment rows in Python)
+            assigned_by_bucket = assignment_buckets(
+                db, experiment_id, group_by, variant_id=variant_id, criteria=assignment_criteria
+            )
+            events_by_bucket = event_buckets(db, experiment_id, group_by, criteria=event_criteria, **filters)
+
+        # conversion users (primary if requested, otherwise any event); cumulative
+        # mode counts each user once, in the bucket of their first conversion
+        if use_sketches:
+            conv_by_bucket = sketch_converting_user_buckets(
+                db, experiment_id, group_by,
+                primary_event_type=primary_event_type,
+                first_only=cumulative,
+                **filters
+            )
+        else:
+            conv_by_bucket = converting_user_buckets(
+                db, experiment_id, group_by,
+                primary_event_type=primary_event_type,
+                first_only=cumulative,
+                criteria=event_criteria,
+                **filters
+            )
+
+        # Build rows sorted by time; cumulative mode keeps running totals in the same pass
+        all_buckets = sorted(set(assigned_by_bucket) | set(events_by_bucket) | set(conv_by_bucket))
+        running = {v.id: [0, 0, 0] for v in variants}  # assigned, events, conversions
+        running_digests = {v.id: TDigest() for v in variants}
         timeseries = []
         for b in all_buckets:
             row = {"bucket": b, "group_by": group_by, "metric": primary_event_type or "any_event", "variants": []}
+            if cumulative:
+                row["cumulative"] = True
             for v in variants:
                 a_cnt = assigned_by_bucket.get(b, {}).get(v.id, 0)
                 e_cnt = events_by_bucket.get(b, {}).get(v.id, 0)
-                conv_users = conv_users_by_bucket.get(b, {}).get(v.id, set())
-                conv_cnt = len(conv_users)
+                conv_cnt = conv_by_bucket.get(b, {}).get(v.id, 0)
+                if cumulative:
+                    totals = running[v.id]
+                    totals[0] += a_cnt
+                    totals[1] += e_cnt
+                    totals[2] += conv_cnt
+                    a_cnt, e_cnt, conv_cnt = totals
                 rate = (conv_cnt / a_cnt) if a_cnt > 0 else 0.0
                 row["variants"].append({
                     "variant_id": v.id,
@@ -326,6 +361,13 @@ def get_experiment_results(
                     "conversions": conv_cnt,
                     "conversion_rate": round(rate, 4),
                 })
+                if quantile_property:
+                    digest = quantile_bucket_digests.get(b, {}).get(v.id)
+                    if cumulative:
+                        if digest is not None:
+                            running_digests[v.id].merge(digest)
+                        digest = running_digests[v.id]
+                    row["variants"][-1]["quantiles"] = _quantile_stats(quantiles, digest)
             timeseries.append(row)
     
     # Reporting: Executive summary, insights, recommendations
@@ -436,6 +478,26 @@ def get_experiment_results(
         "experiment_health": "healthy" if (srm and not srm.get("flagged")) and (total_assigned > 0) else ("warning" if total_assigned == 0 else "critical")
     }
     
+    if sampling:
+        # counts are scaled to full-population estimates; rates are unchanged and the
+        # comparisons/SRM above stay on the sampled users, so their p-values and
+        # confidence intervals reflect the smaller sample (wider than a full run)
+        effective_rate = sample_threshold(sample) / SAMPLE_BUCKETS
+        scale = 1.0 / effective_rate
+        variant_metrics_list = [_scale_variant_metrics(vm, scale) for vm in variant_metrics_list]
+        summary["sample"] = {
+            "rate": effective_rate,
+            "scale_factor": round(scale, 4),
+            "sampled_assigned": total_assigned,
+            "sampled_events": total_events,
+        }
+        summary["total_assigned"] = _scale_count(total_assigned, scale)
+        summary["total_events"] = _scale_count(total_events, scale)
+        for row in timeseries or []:
+            for v in row["variants"]:
+                for field in ("assigned", "events", "conversions"):
+                    v[field] = _scale_count(v[field], scale)
+
     experiment_response = ExperimentResponse(
         id=experiment.id,
         name=experiment.name,
@@ -456,6 +518,8 @@ def get_experiment_results(
         variants=variant_metrics_list,
         comparison=comparison,
         comparisons=comparisons,
+        pairwise_comparisons=pairwise_comparisons,
+        metric_comparisons=metric_comparisons,
         timeseries=timeseries,
         srm=srm,
         insights=insights,
@@ -468,3 +532,266 @@ def get_experiment_results(
 
     # return ExperimentResults(experiment=experiment_response, summary=summary, variants=[], comparison=None)
 
+
+def _srm_check(variants: List[Variant], variant_metrics_list: List[VariantMetrics], total_assigned: int) -> Dict[str, Any]:
+    expected_split = {v.id: float(v.traffic_percentage) for v in variants}
+    test = srm_test(
+        [vm.assigned_count for vm in variant_metrics_list],
+        [expected_split.get(vm.variant_id, 0.0) for vm in variant_metrics_list]
+    )
+    p_value = float(test["p_value"])
+    return {
+        "total_assigned": total_assigned,
+        "expected_split_percent": {str(k): round(v, 4) for k, v in expected_split.items()},
+        "observed_split_percent": {
+            str(vm.variant_id): round(float(pct), 4)
+            for vm, pct in zip(variant_metrics_list, test["observed_percent"])
+        },
+        "chi_square": round(float(test["chi_square"]), 6),
+        "df": int(test["df"]),
+        "p_value": round(p_value, 8),
+        # Common SRM threshold in A/B testing is 0.01
+        "flagged": p_value < 0.01,
+    }
+
+
+def _round_or_none(value: float, digits: int) -> Optional[float]:
+    return None if math.isnan(value) else round(float(value), digits)
+
+
+def _converted_counts(variant_metrics_list: List[VariantMetrics], primary_event_type: Optional[str]) -> List[int]:
+    if primary_event_type:
+        return [vm.primary_unique_users or 0 for vm in variant_metrics_list]
+    return [vm.unique_users_with_events for vm in variant_metrics_list]
+
+
+def _conversion_samples(variant_metrics_list: List[VariantMetrics], primary_event_type: Optional[str]) -> List[Tuple]:
+    """
+    Per-user conversion outcomes per variant, as (values, counts): each assigned
+    user is 0 or 1, so the vector is fully described by the counts we have.
+    """
+    converted = _converted_counts(variant_metrics_list, primary_event_type)
+    return [
+        ([0.0, 1.0], [max(vm.assigned_count - c, 0), c])
+        for vm, c in zip(variant_metrics_list, converted)
+    ]
+
+
+def _comparison_rows(
+    variant_metrics_list: List[VariantMetrics],
+    primary_event_type: Optional[str],
+    pairs=None,
+    alpha: float = 0.05,
+    bootstrap_means=None
+) -> List[Dict[str, Any]]:
+    """
+    Two-proportion z-test rows for variant pairs (default: baseline vs each other variant).
+    With bootstrap_means (resamples x variants), the CIs are bootstrap percentiles
+    and a lift CI is added.
+    """
+    converted = _converted_counts(variant_metrics_list, primary_event_type)
+    assigned = [vm.assigned_count for vm in variant_metrics_list]
+    test = compare_proportions(converted, assigned, pairs, alpha=alpha)
+    boot = None
+    if bootstrap_means is not None:
+        boot = bootstrap_intervals(bootstrap_means, (test["baseline"], test["treatment"]))
+
+    rows = []
+    for k, (b, t) in enumerate(zip(test["baseline"], test["treatment"])):
+        baseline, treatment = variant_metrics_list[b], variant_metrics_list[t]
+        testable = bool(test["testable"][k])
+        ci = None
+        if not math.isnan(test["ci_low"][k]):
+            ci = {"diff_low": round(float(test["ci_low"][k]), 6), "diff_high": round(float(test["ci_high"][k]), 6)}
+        if boot is not None:
+            ci = None
+            if not math.isnan(boot["diff_low"][k]):
+                ci = {"diff_low": round(float(boot["diff_low"][k]), 6), "diff_high": round(float(boot["diff_high"][k]), 6)}
+        row = {
+            "baseline": baseline.variant_name,
+            "baseline_variant_id": baseline.variant_id,
+            "treatment": treatment.variant_name,
+            "treatment_variant_id": treatment.variant_id,
+            "lift_percentage": round(float(test["lift_percentage"][k]), 2),
+            "alpha": alpha,
+            "baseline_assigned": assigned[b],
+            "treatment_assigned": assigned[t],
+            "baseline_converted": converted[b],
+            "treatment_converted": converted[t],
+            "z_score": _round_or_none(test["z_score"][k], 6),
+            "p_value": _round_or_none(test["p_value"][k], 8),
+            "significant": bool(test["significant"][k]) if testable else None,
+            "conversion_rate_diff_ci_95": ci,
+            "metric": primary_event_type or "any_event",
+        }
+        if boot is not None:
+            lift_ci = None
+            if not math.isnan(boot["lift_low"][k]):
+                lift_ci = {"low": round(float(boot["lift_low"][k]), 2), "high": round(float(boot["lift_high"][k]), 2)}
+            row["lift_ci_95"] = lift_ci
+            row["ci_method"] = "bootstrap"
+        rows.append(row)
+    return rows
+
+
+def _parse_metric(metric: str) -> Tuple[str, List[str]]:
+    """"sum:properties.revenue" -> ("sum", ["revenue"]); 400 on anything else."""
+    match = _METRIC_PATTERN.match(metric)
+    if not match:
+        raise HTTPException(
+            status_code=400,
+            detail=f"metric must look like <{'|'.join(METRIC_AGGREGATIONS)}>:properties.<key>, e.g. sum:properties.revenue"
+        )
+    return match.group(1), match.group(2).split(".")
+
+
+def _metric_stats(metric: str, assigned_count: int, moments: Tuple[int, float, float]) -> Dict[str, Any]:
+    """Per-variant summary of a continuous metric; assigned users without events count as 0."""
+    users, total, squares = moments
+    mean = total / assigned_count if assigned_count else 0.0
+    std_dev = None
+    if assigned_count > 1:
+        std_dev = round(math.sqrt(max(squares - total * mean, 0.0) / (assigned_count - 1)), 6)
+    return {
+        "name": metric,
+        "users_with_value": users,
+        "sum": round(total, 6),
+        "mean_per_user": round(mean, 6),
+        "std_dev": std_dev,
+    }
+
+
+def _metric_comparison_rows(
+    variant_metrics_list: List[VariantMetrics],
+    metric_moments: Dict[int, Tuple[int, float, float]],
+    pairs=None,
+    alpha: float = 0.05
+) -> List[Dict[str, Any]]:
+    """Welch t-test rows on the per-user metric mean (default: baseline vs each other variant)."""
+    moments = [metric_moments.get(vm.variant_id, (0, 0.0, 0.0)) for vm in variant_metrics_list]
+    test = welch_t_test(
+        [vm.assigned_count for vm in variant_metrics_list],
+        [m[1] for m in moments],
+        [m[2] for m in moments],
+        pairs,
+        alpha=alpha
+    )
+
+    rows = []
+    for k, (b, t) in enumerate(zip(test["baseline"], test["treatment"])):
+        baseline, treatment = variant_metrics_list[b], variant_metrics_list[t]
+        testable = bool(test["testable"][k])
+        ci = None
+        if not math.isnan(test["ci_low"][k]):
+            ci = {"diff_low": round(float(test["ci_low"][k]), 6), "diff_high": round(float(test["ci_high"][k]), 6)}
+        lift = float(test["lift_percentage"][k])
+        rows.append({
+            "baseline": baseline.variant_name,
+            "baseline_variant_id": baseline.variant_id,
+            "treatment": treatment.variant_name,
+            "treatment_variant_id": treatment.variant_id,
+            "mean_baseline": round(float(test["mean_baseline"][k]), 6),
+            "mean_treatment": round(float(test["mean_treatment"][k]), 6),
+            "mean_diff": round(float(test["diff"][k]), 6),
+            "lift_percentage": round(lift, 2) if math.isfinite(lift) else None,
+            "alpha": alpha,
+            "t_statistic": _round_or_none(test["t_statistic"][k], 6),
+            "df": _round_or_none(test["df"][k], 2),
+            "p_value": _round_or_none(test["p_value"][k], 8),
+            "significant": bool(test["significant"][k]) if testable else None,
+            "mean_diff_ci_95": ci,
+            "metric": baseline.metric["name"],
+        })
+    return rows
+
+
+def _fold_digests(rows, group_by: Optional[str]) -> Tuple[Dict[int, TDigest], Dict[str, Dict[int, TDigest]]]:
+    """
+    Fold (timestamp, variant_id, digest or raw value) rows into one digest per
+    variant and, with group_by, one per (time bucket, variant).
+    """
+    by_variant: Dict[int, TDigest] = {}
+    by_bucket: Dict[str, Dict[int, TDigest]] = {}
+    for ts, v_id, item in rows:
+        targets = [by_variant.setdefault(v_id, TDigest())]
+        if group_by:
+            key = bucket_key(as_datetime(ts), group_by)
+            targets.append(by_bucket.setdefault(key, {}).setdefault(v_id, TDigest()))
+        for digest in targets:
+            if isinstance(item, TDigest):
+                digest.merge(item)
+            else:
+                digest.add(item)
+    return by_variant, by_bucket
+
+
+def _quantile_stats(name: str, digest: Optional[TDigest], with_bounds: bool = False) -> Dict[str, Any]:
+    """p50/p90/p99 (None without values); with_bounds adds count/min/max."""
+    stats: Dict[str, Any] = {"property": name}
+    if with_bounds:
+        low, high = digest.bounds() if digest is not None else (None, None)
+        stats.update(count=digest.count if digest is not None else 0, min=low, max=high)
+    for level in QUANTILE_LEVELS:
+        value = digest.quantile(level) if digest is not None else None
+        stats[f"p{level * 100:g}"] = None if value is None else round(value, 6)
+    return stats
+
+
+def _scale_count(count: Optional[int], scale: float) -> Optional[int]:
+    return None if count is None else int(round(count * scale))
+
+
+def _scale_variant_metrics(vm: VariantMetrics, scale: float) -> VariantMetrics:
+    """Sampled per-variant counts scaled up to full-population estimates."""
+    return vm.model_copy(update={
+        "assigned_count": _scale_count(vm.assigned_count, scale),
+        "event_count": _scale_count(vm.event_count, scale),
+        "events_by_type": {k: _scale_count(v, scale) for k, v in vm.events_by_type.items()},
+        "unique_users_with_events": _scale_count(vm.unique_users_with_events, scale),
+        "primary_event_count": _scale_count(vm.primary_event_count, scale),
+        "primary_unique_users": _scale_count(vm.primary_unique_users, scale),
+        "metric": vm.metric and {
+            **vm.metric,
+            "users_with_value": _scale_count(vm.metric["users_with_value"], scale),
+            "sum": round(vm.metric["sum"] * scale, 6),
+        },
+        "quantiles": vm.quantiles and {**vm.quantiles, "count": _scale_count(vm.quantiles["count"], scale)},
+    })
+
+
+@routed_by_experiment
+def get_results_watermark(db: Session, experiment_id: int) -> Optional[Tuple]:
+    """
+    Cheap fingerprint of everything the results depend on, in one statement:
+    experiment status/updated_at, variant count, last event id and assignment
+    count/last id. Each part is an index lookup, so this is far cheaper than
+    recomputing. None if the experiment does not exist.
+
+    New, deleted or late (write-behind) rows all move the watermark; editing
+    an existing event or assigned_at in place does not.
+    """
+    variant_count = db.query(func.count(Variant.id)).filter(
+        Variant.experiment_id == experiment_id
+    ).scalar_subquery()
+    last_event_id = db.query(func.max(Event.id)).filter(
+        Event.experiment_id == experiment_id
+    ).scalar_subquery()
+    assignment_count = db.query(func.count(UserAssignment.id)).filter(
+        UserAssignment.experiment_id == experiment_id
+    ).scalar_subquery()
+    last_assignment_id = db.query(func.max(UserAssignment.id)).filter(
+        UserAssignment.experiment_id == experiment_id
+    ).scalar_subquery()
+
+    row = db.query(
+        Experiment.status,
+        Experiment.updated_at,
+        variant_count,
+        last_event_id,
+        assignment_count,
+        last_assignment_id
+    ).filter(Experiment.id == experiment_id).first()
+    if row is None:
+        return None
+    return tuple(row)
+
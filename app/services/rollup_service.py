@@ -0,0 +1,729 @@
+"""Hourly rollups of events and assignments, plus the background job that fills them.
+
+The job folds new rows from `events` and `user_assignments` into the
+*_rollups_hourly tables and records the last folded row id per source in
+`rollup_state` (the high-water mark). Readers add the small unfolded tail
+(ids above the high-water mark) on top of the rollup sums, so results stay
+exact without the read path ever writing.
+
+Events are attributed to a variant at fold time. An event whose assignment
+row lands after it was folded (write-behind assignments) is added to the
+rollups, sketches and digests when the writer inserts that row
+(fold_late_assignment_events).
+
+Alongside the event counts, each (variant, event_type, hour) bucket keeps a
+HyperLogLog sketch of its users, so approximate distinct counts can be
+merged over any range without touching raw events. Numeric properties
+listed in ROLLUP_QUANTILE_PROPERTIES likewise get a t-digest per bucket, so
+quantiles over any range are answered by merging digests.
+"""
+import heapq
+import logging
+import threading
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple, Any, Callable, Iterator, Sequence
+
+from sqlalchemy import func, or_, tuple_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, dialect_insert, needs_shard, on_shard, shards
+from app.models import (
+    Event, UserAssignment, EventRollupHourly, AssignmentRollupHourly, EventSketchHourly, EventDigestHourly,
+    RollupState
+)
+from app.services.aggregation_service import (
+    event_assignment_join, event_type_counts, joined_events_query, bucket_key, as_datetime,
+    time_bucket_expr, property_value_expr, property_values
+)
+from app.utils.hll import HyperLogLog
+from app.utils.tdigest import TDigest
+
+logger = logging.getLogger(__name__)
+
+EVENTS_STATE = "events"
+ASSIGNMENTS_STATE = "assignments"
+
+# existing sketches loaded per IN (...) round trip while folding
+SKETCH_KEY_CHUNK_SIZE = 200
+# assignment ids per IN (...) when folding late-assigned events
+ID_CHUNK_SIZE = 500
+
+
+def is_bucket_aligned(dt: Optional[datetime]) -> bool:
+    """True if dt is unset or falls exactly on an hour boundary."""
+    return dt is None or (dt.minute == 0 and dt.second == 0 and dt.microsecond == 0)
+
+
+def hour_bucket_expr(db: Session, column):
+    """SQL expression truncating a timestamp column to the hour."""
+    return time_bucket_expr(db, column, "hour")
+
+
+def get_high_water_mark(db: Session, name: str) -> int:
+    return db.query(RollupState.high_water_mark).filter(RollupState.name == name).scalar() or 0
+
+
+def _advance_high_water_mark(db: Session, name: str, old: int, new: int) -> bool:
+    """
+    Move the mark from old to new inside the current transaction.
+    Returns False if someone else already moved it (concurrent job).
+    """
+    insert = dialect_insert(db)
+    db.execute(
+        insert(RollupState).values(name=name, high_water_mark=0).on_conflict_do_nothing(
+            index_elements=["name"]
+        )
+    )
+    updated = db.query(RollupState).filter(
+        RollupState.name == name,
+        RollupState.high_water_mark == old
+    ).update({"high_water_mark": new, "updated_at": func.now()}, synchronize_session=False)
+    return updated == 1
+
+
+def fold_events(db: Session, batch_size: int = 50000) -> int:
+    """Fold the next chunk of events past the high-water mark. Returns rows covered."""
+    hwm = get_high_water_mark(db, EVENTS_STATE)
+    max_id = db.query(func.max(Event.id)).scalar() or 0
+    if max_id <= hwm:
+        return 0
+    upper = min(max_id, hwm + batch_size)
+    criteria = [Event.id > hwm, Event.id <= upper]
+    rows = _event_rollup_rows(db, criteria)
+
+    # state first: if another job got here before us, drop our work
+    if not _advance_high_water_mark(db, EVENTS_STATE, hwm, upper):
+        db.rollback()
+        return 0
+
+    _fold_event_rows(db, rows, criteria)
+    db.commit()
+    return upper - hwm
+
+
+def fold_late_assignment_events(db: Session, assignment_ids: Sequence[int]) -> None:
+    """
+    Fold already-folded events (ids at or below the high-water mark) that only
+    join now that these new assignment rows exist. Events past the mark are left
+    to fold_events. Runs in the caller's transaction, before it commits.
+    """
+    hwm = get_high_water_mark(db, EVENTS_STATE)
+    if not hwm:
+        return
+    for i in range(0, len(assignment_ids), ID_CHUNK_SIZE):
+        criteria = [UserAssignment.id.in_(assignment_ids[i:i + ID_CHUNK_SIZE]), Event.id <= hwm]
+        _fold_event_rows(db, _event_rollup_rows(db, criteria), criteria)
+
+
+def _event_rollup_rows(db: Session, criteria: List[Any]) -> List[Tuple]:
+    """(experiment_id, variant_id, event_type, hour, count) of the joined events matching criteria."""
+    bucket = hour_bucket_expr(db, Event.timestamp)
+    return db.query(
+        UserAssignment.experiment_id,
+        UserAssignment.variant_id,
+        Event.event_type,
+        bucket,
+        func.count(Event.id)
+    ).select_from(Event).join(
+        UserAssignment, event_assignment_join()
+    ).filter(*criteria).group_by(
+        UserAssignment.experiment_id, UserAssignment.variant_id, Event.event_type, bucket
+    ).all()
+
+
+def _fold_event_rows(db: Session, rows: List[Tuple], criteria: List[Any]) -> None:
+    """Add counted rows to the event rollups, and the same events to the sketches and digests."""
+    if rows:
+        stmt = dialect_insert(db)(EventRollupHourly)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["experiment_id", "variant_id", "event_type", "bucket_start"],
+            set_={"event_count": EventRollupHourly.event_count + stmt.excluded.event_count}
+        )
+        db.execute(stmt, [
+            {
+                "experiment_id": exp_id,
+                "variant_id": v_id,
+                "event_type": e_type,
+                "bucket_start": as_datetime(b),
+                "event_count": cnt,
+            }
+            for exp_id, v_id, e_type, b, cnt in rows
+        ])
+        if settings.rollup_sketches_enabled:
+            _fold_event_sketches(db, criteria)
+        if settings.rollup_quantile_properties:
+            _fold_event_digests(db, criteria, settings.rollup_quantile_properties)
+
+
+def _fold_event_sketches(db: Session, criteria: List[Any]) -> None:
+    """Add the users of the joined events matching criteria to their hourly bucket sketches."""
+    bucket = hour_bucket_expr(db, Event.timestamp)
+    users = db.query(
+        UserAssignment.experiment_id,
+        UserAssignment.variant_id,
+        Event.event_type,
+        bucket,
+        Event.user_id
+    ).select_from(Event).join(
+        UserAssignment, event_assignment_join()
+    ).filter(*criteria).distinct().yield_per(10000)
+
+    # new sketches stay sparse: memory is bounded by the chunk's distinct users
+    sketches: Dict[Tuple[int, int, str, datetime], HyperLogLog] = {}
+    for exp_id, v_id, e_type, b, user_id in users:
+        key = (exp_id, v_id, e_type, as_datetime(b))
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = HyperLogLog()
+        sketch.add(user_id)
+
+    stmt = dialect_insert(db)(EventSketchHourly)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["experiment_id", "variant_id", "event_type", "bucket_start"],
+        set_={"registers": stmt.excluded.registers}
+    )
+    key_columns = tuple_(
+        EventSketchHourly.experiment_id, EventSketchHourly.variant_id,
+        EventSketchHourly.event_type, EventSketchHourly.bucket_start
+    )
+    keys = list(sketches)
+    for i in range(0, len(keys), SKETCH_KEY_CHUNK_SIZE):
+        chunk = keys[i:i + SKETCH_KEY_CHUNK_SIZE]
+        existing = db.query(
+            EventSketchHourly.experiment_id, EventSketchHourly.variant_id,
+            EventSketchHourly.event_type, EventSketchHourly.bucket_start,
+            EventSketchHourly.registers
+        ).filter(key_columns.in_(chunk))
+        for exp_id, v_id, e_type, b, registers in existing:
+            sketches[(exp_id, v_id, e_type, as_datetime(b))].merge(HyperLogLog.from_bytes(registers))
+        db.execute(stmt, [
+            {
+                "experiment_id": exp_id,
+                "variant_id": v_id,
+                "event_type": e_type,
+                "bucket_start": b,
+                "registers": sketches.pop((exp_id, v_id, e_type, b)).to_bytes(),
+            }
+            for exp_id, v_id, e_type, b in chunk
+        ])
+
+
+def _fold_event_digests(db: Session, criteria: List[Any], properties: List[str]) -> None:
+    """Add the given numeric properties of the joined events matching criteria to their hourly bucket digests."""
+    bucket = hour_bucket_expr(db, Event.timestamp)
+    rows = db.query(
+        UserAssignment.experiment_id,
+        UserAssignment.variant_id,
+        Event.event_type,
+        bucket,
+        *(property_value_expr(db, prop.split(".")) for prop in properties)
+    ).select_from(Event).join(
+        UserAssignment, event_assignment_join()
+    ).filter(
+        *criteria,
+        Event.properties.isnot(None)
+    ).yield_per(10000)
+
+    digests: Dict[Tuple[int, str, int, str, datetime], TDigest] = {}
+    for exp_id, v_id, e_type, b, *values in rows:
+        for prop, value in zip(properties, values):
+            if value is None:
+                continue
+            key = (exp_id, prop, v_id, e_type, as_datetime(b))
+            digest = digests.get(key)
+            if digest is None:
+                digest = digests[key] = TDigest()
+            digest.add(value)
+
+    stmt = dialect_insert(db)(EventDigestHourly)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["experiment_id", "property", "variant_id", "event_type", "bucket_start"],
+        set_={"centroids": stmt.excluded.centroids}
+    )
+    key_columns = tuple_(
+        EventDigestHourly.experiment_id, EventDigestHourly.property, EventDigestHourly.variant_id,
+        EventDigestHourly.event_type, EventDigestHourly.bucket_start
+    )
+    keys = list(digests)
+    for i in range(0, len(keys), SKETCH_KEY_CHUNK_SIZE):
+        chunk = keys[i:i + SKETCH_KEY_CHUNK_SIZE]
+        existing = db.query(
+            EventDigestHourly.experiment_id, EventDigestHourly.property, EventDigestHourly.variant_id,
+            EventDigestHourly.event_type, EventDigestHourly.bucket_start, EventDigestHourly.centroids
+        ).filter(key_columns.in_(chunk))
+        for exp_id, prop, v_id, e_type, b, centroids in existing:
+            digests[(exp_id, prop, v_id, e_type, as_datetime(b))].merge(TDigest.from_bytes(centroids))
+        db.execute(stmt, [
+            {
+                "experiment_id": exp_id,
+                "property": prop,
+                "variant_id": v_id,
+                "event_type": e_type,
+                "bucket_start": b,
+                "centroids": digests.pop((exp_id, prop, v_id, e_type, b)).to_bytes(),
+            }
+            for exp_id, prop, v_id, e_type, b in chunk
+        ])
+
+
+def fold_assignments(db: Session, batch_size: int = 50000) -> int:
+    """Fold the next chunk of assignments past the high-water mark. Returns rows covered."""
+    hwm = get_high_water_mark(db, ASSIGNMENTS_STATE)
+    max_id = db.query(func.max(UserAssignment.id)).scalar() or 0
+    if max_id <= hwm:
+        return 0
+    upper = min(max_id, hwm + batch_size)
+
+    bucket = hour_bucket_expr(db, UserAssignment.assigned_at)
+    rows = db.query(
+        UserAssignment.experiment_id,
+        UserAssignment.variant_id,
+        bucket,
+        func.count(UserAssignment.id)
+    ).filter(
+        UserAssignment.id > hwm,
+        UserAssignment.id <= upper
+    ).group_by(
+        UserAssignment.experiment_id, UserAssignment.variant_id, bucket
+    ).all()
+
+    if not _advance_high_water_mark(db, ASSIGNMENTS_STATE, hwm, upper):
+        db.rollback()
+        return 0
+
+    if rows:
+        stmt = dialect_insert(db)(AssignmentRollupHourly)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["experiment_id", "variant_id", "bucket_start"],
+            set_={"assigned_count": AssignmentRollupHourly.assigned_count + stmt.excluded.assigned_count}
+        )
+        db.execute(stmt, [
+            {
+                "experiment_id": exp_id,
+                "variant_id": v_id,
+                "bucket_start": as_datetime(b),
+                "assigned_count": cnt,
+            }
+            for exp_id, v_id, b, cnt in rows
+        ])
+
+    db.commit()
+    return upper - hwm
+
+
+def refresh_rollups(db: Session, batch_size: int = 50000) -> Dict[str, int]:
+    """
+    Fold everything currently past the high-water marks.
+    With EVENT_SHARD_DIR every shard file keeps its own rollups and marks.
+    """
+    folded = {EVENTS_STATE: 0, ASSIGNMENTS_STATE: 0}
+    for name, fold in ((ASSIGNMENTS_STATE, fold_assignments), (EVENTS_STATE, fold_events)):
+        while True:
+            n = fold(db, batch_size)
+            if n == 0:
+                break
+            folded[name] += n
+    if needs_shard(db):
+        for path in shards.paths():
+            for name, n in on_shard(path, refresh_rollups, batch_size).items():
+                folded[name] += n
+    return folded
+
+
+# ---- read side ----
+
+def _event_tail_criteria(db: Session, end_date: Optional[datetime]) -> List[Any]:
+    """
+    Raw events the rollups can't answer: everything past the high-water mark,
+    plus events exactly at an inclusive end_date (that hour's bucket is excluded).
+    """
+    hwm = get_high_water_mark(db, EVENTS_STATE)
+    if end_date:
+        return [or_(Event.id > hwm, Event.timestamp == end_date)]
+    return [Event.id > hwm]
+
+
+def _rollup_range(query, start_date: Optional[datetime], end_date: Optional[datetime], model=EventRollupHourly):
+    if start_date:
+        query = query.filter(model.bucket_start >= start_date)
+    if end_date:
+        query = query.filter(model.bucket_start < end_date)
+    return query
+
+
+def rollup_event_type_counts(
+    db: Session,
+    experiment_id: int,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None
+) -> List[Tuple[int, str, int]]:
+    """
+    Same rows as aggregation_service.event_type_counts, read from the rollups.
+    start_date/end_date must be hour aligned (see is_bucket_aligned).
+    """
+    query = db.query(
+        EventRollupHourly.variant_id,
+        EventRollupHourly.event_type,
+        func.sum(EventRollupHourly.event_count)
+    ).filter(EventRollupHourly.experiment_id == experiment_id)
+    query = _rollup_range(query, start_date, end_date)
+    if event_type:
+        query = query.filter(EventRollupHourly.event_type == event_type)
+    if variant_id:
+        query = query.filter(EventRollupHourly.variant_id == variant_id)
+    rows = query.group_by(EventRollupHourly.variant_id, EventRollupHourly.event_type).all()
+
+    tail = event_type_counts(
+        db, experiment_id,
+        start_date=start_date,
+        end_date=end_date,
+        event_type=event_type,
+        variant_id=variant_id,
+        criteria=_event_tail_criteria(db, end_date)
+    )
+    return [(v_id, e_type, int(cnt or 0)) for v_id, e_type, cnt in rows] + list(tail)
+
+
+def rollup_assigned_counts(db: Session, experiment_id: int) -> Dict[int, int]:
+    """{variant_id: assigned users} from the rollups plus unfolded assignments."""
+    counts: Dict[int, int] = {}
+    rows = db.query(
+        AssignmentRollupHourly.variant_id,
+        func.sum(AssignmentRollupHourly.assigned_count)
+    ).filter(
+        AssignmentRollupHourly.experiment_id == experiment_id
+    ).group_by(AssignmentRollupHourly.variant_id).all()
+
+    hwm = get_high_water_mark(db, ASSIGNMENTS_STATE)
+    tail = db.query(
+        UserAssignment.variant_id,
+        func.count(UserAssignment.id)
+    ).filter(
+        UserAssignment.experiment_id == experiment_id,
+        UserAssignment.id > hwm
+    ).group_by(UserAssignment.variant_id).all()
+
+    for v_id, cnt in list(rows) + list(tail):
+        counts[v_id] = counts.get(v_id, 0) + int(cnt or 0)
+    return counts
+
+
+def rollup_event_buckets(
+    db: Session,
+    experiment_id: int,
+    group_by: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None
+) -> Dict[str, Dict[int, int]]:
+    """{bucket: {variant_id: events}} for the timeseries, from hourly rollups + tail."""
+    query = db.query(
+        EventRollupHourly.bucket_start,
+        EventRollupHourly.variant_id,
+        func.sum(EventRollupHourly.event_count)
+    ).filter(EventRollupHourly.experiment_id == experiment_id)
+    query = _rollup_range(query, start_date, end_date)
+    if event_type:
+        query = query.filter(EventRollupHourly.event_type == event_type)
+    if variant_id:
+        query = query.filter(EventRollupHourly.variant_id == variant_id)
+    rows = query.group_by(EventRollupHourly.bucket_start, EventRollupHourly.variant_id).all()
+
+    bucket = hour_bucket_expr(db, Event.timestamp)
+    tail = joined_events_query(
+        db, experiment_id,
+        bucket,
+        UserAssignment.variant_id,
+        func.count(Event.id),
+        start_date=start_date,
+        end_date=end_date,
+        event_type=event_type,
+        variant_id=variant_id,
+        criteria=_event_tail_criteria(db, end_date)
+    ).group_by(bucket, UserAssignment.variant_id).all()
+
+    out: Dict[str, Dict[int, int]] = {}
+    for b, v_id, cnt in list(rows) + list(tail):
+        key = bucket_key(as_datetime(b), group_by)
+        out.setdefault(key, {})
+        out[key][v_id] = out[key].get(v_id, 0) + int(cnt or 0)
+    return out
+
+
+def rollup_assignment_buckets(
+    db: Session,
+    experiment_id: int,
+    group_by: str,
+    variant_id: Optional[int] = None
+) -> Dict[str, Dict[int, int]]:
+    """{bucket: {variant_id: assigned}} for the timeseries, from hourly rollups + tail."""
+    query = db.query(
+        AssignmentRollupHourly.bucket_start,
+        AssignmentRollupHourly.variant_id,
+        AssignmentRollupHourly.assigned_count
+    ).filter(AssignmentRollupHourly.experiment_id == experiment_id)
+    if variant_id:
+        query = query.filter(AssignmentRollupHourly.variant_id == variant_id)
+    rows = query.all()
+
+    hwm = get_high_water_mark(db, ASSIGNMENTS_STATE)
+    bucket = hour_bucket_expr(db, UserAssignment.assigned_at)
+    tail_q = db.query(
+        bucket,
+        UserAssignment.variant_id,
+        func.count(UserAssignment.id)
+    ).filter(
+        UserAssignment.experiment_id == experiment_id,
+        UserAssignment.id > hwm
+    )
+    if variant_id:
+        tail_q = tail_q.filter(UserAssignment.variant_id == variant_id)
+    tail = tail_q.group_by(bucket, UserAssignment.variant_id).all()
+
+    out: Dict[str, Dict[int, int]] = {}
+    for b, v_id, cnt in list(rows) + list(tail):
+        key = bucket_key(as_datetime(b), group_by)
+        out.setdefault(key, {})
+        out[key][v_id] = out[key].get(v_id, 0) + int(cnt or 0)
+    return out
+
+
+def _conversion_types(event_type: Optional[str], primary_event_type: Optional[str]) -> Optional[List[str]]:
+    """Event types that count as a conversion; None means any, [] means none can."""
+    if primary_event_type and event_type and event_type != primary_event_type:
+        return []
+    conversion_type = primary_event_type or event_type
+    return [conversion_type] if conversion_type else None
+
+
+def _iter_sketches(
+    db: Session,
+    experiment_id: int,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    event_types: Optional[List[str]],
+    variant_id: Optional[int]
+) -> Iterator[Tuple[datetime, int, str, HyperLogLog]]:
+    """
+    (bucket_start, variant_id, event_type, sketch) for every hour bucket in range,
+    ordered by bucket: stored sketches merged with sketches built from the raw tail.
+    """
+    query = db.query(
+        EventSketchHourly.bucket_start,
+        EventSketchHourly.variant_id,
+        EventSketchHourly.event_type,
+        EventSketchHourly.registers
+    ).filter(EventSketchHourly.experiment_id == experiment_id)
+    query = _rollup_range(query, start_date, end_date, model=EventSketchHourly)
+    if event_types is not None:
+        query = query.filter(EventSketchHourly.event_type.in_(event_types))
+    if variant_id:
+        query = query.filter(EventSketchHourly.variant_id == variant_id)
+    stored = (
+        (as_datetime(b), v_id, e_type, HyperLogLog.from_bytes(registers))
+        for b, v_id, e_type, registers in query.order_by(EventSketchHourly.bucket_start).yield_per(1000)
+    )
+
+    tail_query = joined_events_query(
+        db, experiment_id,
+        Event.timestamp,
+        UserAssignment.variant_id,
+        Event.event_type,
+        Event.user_id,
+        start_date=start_date,
+        end_date=end_date,
+        variant_id=variant_id,
+        criteria=_event_tail_criteria(db, end_date)
+    )
+    if event_types is not None:
+        tail_query = tail_query.filter(Event.event_type.in_(event_types))
+    tail: Dict[Tuple[datetime, int, str], HyperLogLog] = {}
+    for ts, v_id, e_type, user_id in tail_query.yield_per(10000):
+        b = as_datetime(ts).replace(minute=0, second=0, microsecond=0)
+        tail.setdefault((b, v_id, e_type), HyperLogLog()).add(user_id)
+    tail_sorted = ((b, v_id, e_type, sketch) for (b, v_id, e_type), sketch in sorted(tail.items()))
+
+    return heapq.merge(stored, tail_sorted, key=lambda item: item[0])
+
+
+def sketch_unique_user_counts(
+    db: Session,
+    experiment_id: int,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None,
+    primary_event_type: Optional[str] = None
+) -> List[Tuple[int, int, int]]:
+    """
+    Same rows as aggregation_service.unique_user_counts, estimated by merging
+    HyperLogLog sketches. start_date/end_date must be hour aligned.
+    """
+    users: Dict[int, HyperLogLog] = {}
+    primary: Dict[int, HyperLogLog] = {}
+    event_types = [event_type] if event_type else None
+    for _, v_id, e_type, sketch in _iter_sketches(db, experiment_id, start_date, end_date, event_types, variant_id):
+        if primary_event_type and e_type == primary_event_type:
+            primary.setdefault(v_id, HyperLogLog()).merge(sketch)
+        users.setdefault(v_id, HyperLogLog()).merge(sketch)
+
+    return [
+        (v_id, users[v_id].count(), primary[v_id].count() if v_id in primary else 0)
+        for v_id in users
+    ]
+
+
+def sketch_converting_user_buckets(
+    db: Session,
+    experiment_id: int,
+    group_by: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None,
+    primary_event_type: Optional[str] = None,
+    first_only: bool = False
+) -> Dict[str, Dict[int, int]]:
+    """
+    Same shape as aggregation_service.converting_user_buckets, estimated from
+    sketches. With first_only, each bucket holds the growth of the running
+    union, so summing buckets gives the cumulative distinct estimate.
+    """
+    event_types = _conversion_types(event_type, primary_event_type)
+    if event_types == []:
+        return {}
+
+    out: Dict[str, Dict[int, int]] = {}
+    running: Dict[int, HyperLogLog] = {}
+    reported: Dict[int, int] = {}
+    current_key: Optional[str] = None
+    current: Dict[int, HyperLogLog] = {}
+
+    def finish_bucket():
+        counts = out.setdefault(current_key, {})
+        for v_id, sketch in current.items():
+            if first_only:
+                running.setdefault(v_id, HyperLogLog()).merge(sketch)
+                total = running[v_id].count()
+                counts[v_id] = total - reported.get(v_id, 0)
+                reported[v_id] = total
+            else:
+                counts[v_id] = sketch.count()
+
+    # items arrive ordered by hour, so day/week buckets are contiguous
+    for b, v_id, _, sketch in _iter_sketches(db, experiment_id, start_date, end_date, event_types, variant_id):
+        key = bucket_key(b, group_by)
+        if key != current_key:
+            if current_key is not None:
+                finish_bucket()
+            current_key, current = key, {}
+        current.setdefault(v_id, HyperLogLog()).merge(sketch)
+    if current_key is not None:
+        finish_bucket()
+    return out
+
+
+def iter_digests(
+    db: Session,
+    experiment_id: int,
+    prop: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None
+) -> Iterator[Tuple[datetime, int, TDigest]]:
+    """
+    (bucket_start, variant_id, digest) of property `prop` for every hour bucket
+    in range, ordered by bucket: stored digests merged with digests of the raw
+    tail. Only valid for properties in ROLLUP_QUANTILE_PROPERTIES and hour
+    aligned dates.
+    """
+    query = db.query(
+        EventDigestHourly.bucket_start,
+        EventDigestHourly.variant_id,
+        EventDigestHourly.centroids
+    ).filter(
+        EventDigestHourly.experiment_id == experiment_id,
+        EventDigestHourly.property == prop
+    )
+    query = _rollup_range(query, start_date, end_date, model=EventDigestHourly)
+    if event_type:
+        query = query.filter(EventDigestHourly.event_type == event_type)
+    if variant_id:
+        query = query.filter(EventDigestHourly.variant_id == variant_id)
+    stored = (
+        (as_datetime(b), v_id, TDigest.from_bytes(centroids))
+        for b, v_id, centroids in query.order_by(EventDigestHourly.bucket_start).yield_per(1000)
+    )
+
+    tail: Dict[Tuple[datetime, int], TDigest] = {}
+    tail_query = property_values(
+        db, experiment_id, prop.split("."),
+        start_date=start_date,
+        end_date=end_date,
+        event_type=event_type,
+        variant_id=variant_id,
+        criteria=_event_tail_criteria(db, end_date)
+    )
+    for ts, v_id, value in tail_query.yield_per(10000):
+        b = as_datetime(ts).replace(minute=0, second=0, microsecond=0)
+        tail.setdefault((b, v_id), TDigest()).add(value)
+    tail_sorted = ((b, v_id, digest) for (b, v_id), digest in sorted(tail.items()))
+
+    return heapq.merge(stored, tail_sorted, key=lambda item: item[0])
+
+
+# ---- background job ----
+
+class RollupWorker:
+    """Daemon thread that periodically folds new rows into the rollup tables."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        interval_seconds: float = 30.0,
+        batch_size: int = 50000
+    ):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Dict[str, int]:
+        db = self.session_factory()
+        try:
+            return refresh_rollups(db, self.batch_size)
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Rollup job failed")
+            self._stop.wait(self.interval_seconds)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rollup-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+rollup_worker = RollupWorker(
+    interval_seconds=settings.rollup_interval_seconds,
+    batch_size=settings.rollup_batch_size
+)
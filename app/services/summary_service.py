@@ -0,0 +1,182 @@
+"""Per-(experiment, user) exposure/conversion summaries.
+
+Rows are upserted in the same transaction that inserts the events, so the
+results endpoint can count unique and converting users in O(assigned users)
+instead of re-joining every event to its assignment.
+
+Same attribution rule as the results join: an event only counts if the
+user's assignment exists and the event is at/after assigned_at when it is
+ingested. Editing assigned_at afterwards does not rewrite existing rows.
+"""
+from datetime import datetime
+from typing import Optional, Dict, List, Sequence, Tuple, Any
+
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+
+from app.database import dialect_insert
+from app.models import Event, UserAssignment, UserExperimentSummary, UserEventTypeSummary
+from app.services.aggregation_service import event_assignment_join, as_datetime
+
+# keeps the IN (...) list well under SQLite's bound-parameter limit
+ID_CHUNK_SIZE = 500
+
+
+def _earliest(column, excluded_column):
+    return case((excluded_column < column, excluded_column), else_=column)
+
+
+def _latest(column, excluded_column):
+    return case((excluded_column > column, excluded_column), else_=column)
+
+
+def record_events(db: Session, event_ids: Sequence[int]) -> None:
+    """
+    Fold freshly inserted events into the summary tables.
+    Call after the events are flushed and before commit.
+    """
+    for i in range(0, len(event_ids), ID_CHUNK_SIZE):
+        _record_chunk(db, event_ids[i:i + ID_CHUNK_SIZE])
+
+
+def record_assignments(db: Session, assignment_ids: Sequence[int]) -> None:
+    """
+    Fold events that were ingested before these (new) assignments were written.
+    Needed when assignment rows land after the fact, e.g. via the write-behind writer.
+    """
+    for i in range(0, len(assignment_ids), ID_CHUNK_SIZE):
+        event_ids = [
+            e_id for (e_id,) in db.query(Event.id).select_from(Event).join(
+                UserAssignment, event_assignment_join()
+            ).filter(
+                UserAssignment.id.in_(assignment_ids[i:i + ID_CHUNK_SIZE])
+            )
+        ]
+        record_events(db, event_ids)
+
+
+def _record_chunk(db: Session, event_ids: Sequence[int]) -> None:
+    rows = db.query(
+        UserAssignment.experiment_id,
+        UserAssignment.user_key,
+        UserAssignment.user_id,
+        UserAssignment.variant_id,
+        UserAssignment.assigned_at,
+        Event.event_type,
+        func.count(Event.id),
+        func.min(Event.timestamp),
+        func.max(Event.timestamp)
+    ).select_from(Event).join(
+        UserAssignment, event_assignment_join()
+    ).filter(
+        Event.id.in_(event_ids)
+    ).group_by(
+        UserAssignment.experiment_id, UserAssignment.user_key, UserAssignment.user_id,
+        UserAssignment.variant_id, UserAssignment.assigned_at, Event.event_type
+    ).all()
+
+    if not rows:
+        return
+
+    users: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    type_rows = []
+    for exp_id, user_key, user_id, v_id, assigned_at, e_type, cnt, first_at, last_at in rows:
+        first_at = as_datetime(first_at)
+        last_at = as_datetime(last_at)
+        type_rows.append({
+            "experiment_id": exp_id,
+            "user_id": user_id,
+            "user_key": user_key,
+            "event_type": e_type,
+            "variant_id": v_id,
+            "first_event_at": first_at,
+            "event_count": cnt,
+        })
+        u = users.get((exp_id, user_key))
+        if u is None:
+            users[(exp_id, user_key)] = {
+                "experiment_id": exp_id,
+                "user_id": user_id,
+                "user_key": user_key,
+                "variant_id": v_id,
+                "assigned_at": as_datetime(assigned_at),
+                "first_event_at": first_at,
+                "last_event_at": last_at,
+                "event_count": cnt,
+            }
+        else:
+            u["first_event_at"] = min(u["first_event_at"], first_at)
+            u["last_event_at"] = max(u["last_event_at"], last_at)
+            u["event_count"] += cnt
+
+    insert = dialect_insert(db)
+
+    stmt = insert(UserExperimentSummary)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["experiment_id", "user_key"],
+        set_={
+            "variant_id": stmt.excluded.variant_id,
+            "assigned_at": stmt.excluded.assigned_at,
+            "first_event_at": _earliest(UserExperimentSummary.first_event_at, stmt.excluded.first_event_at),
+            "last_event_at": _latest(UserExperimentSummary.last_event_at, stmt.excluded.last_event_at),
+            "event_count": UserExperimentSummary.event_count + stmt.excluded.event_count,
+        }
+    )
+    db.execute(stmt, list(users.values()))
+
+    stmt = insert(UserEventTypeSummary)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["experiment_id", "user_key", "event_type"],
+        set_={
+            "variant_id": stmt.excluded.variant_id,
+            "first_event_at": _earliest(UserEventTypeSummary.first_event_at, stmt.excluded.first_event_at),
+            "event_count": UserEventTypeSummary.event_count + stmt.excluded.event_count,
+        }
+    )
+    db.execute(stmt, type_rows)
+
+
+def _users_by_variant(
+    db: Session,
+    experiment_id: int,
+    end_date: Optional[datetime],
+    event_type: Optional[str],
+    variant_id: Optional[int]
+) -> Dict[int, int]:
+    # any event -> one row per user; a single type -> the per-type table
+    model = UserEventTypeSummary if event_type else UserExperimentSummary
+    query = db.query(
+        model.variant_id,
+        func.count(model.id)
+    ).filter(model.experiment_id == experiment_id)
+    if event_type:
+        query = query.filter(model.event_type == event_type)
+    if end_date:
+        query = query.filter(model.first_event_at <= end_date)
+    if variant_id:
+        query = query.filter(model.variant_id == variant_id)
+    return dict(query.group_by(model.variant_id).all())
+
+
+def summary_unique_user_counts(
+    db: Session,
+    experiment_id: int,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    variant_id: Optional[int] = None,
+    primary_event_type: Optional[str] = None
+) -> List[Tuple[int, int, int]]:
+    """
+    Same rows as aggregation_service.unique_user_counts, read from the summaries.
+    Only valid without a start_date: a user's first event before the window
+    says nothing about whether they had one inside it.
+    """
+    unique = _users_by_variant(db, experiment_id, end_date, event_type, variant_id)
+    primary: Dict[int, int] = {}
+    if primary_event_type and (not event_type or event_type == primary_event_type):
+        primary = _users_by_variant(db, experiment_id, end_date, primary_event_type, variant_id)
+
+    return [
+        (v_id, unique.get(v_id, 0), primary.get(v_id, 0))
+        for v_id in set(unique) | set(primary)
+    ]
@@ -0,0 +1,117 @@
+"""Integer surrogate keys for external user ids.
+
+user_assignments, events and the per-user summaries index and join on
+user_key, an integer id from the `users` dictionary table, instead of the
+external user_id string (typically a 36-char UUID). The string stays on each
+row, unindexed, for responses, hash sampling and sketches. Keys are handed
+out at assignment and ingest time. With EVENT_SHARD_DIR every shard file has
+its own dictionary, because joins never cross experiments.
+
+Keys are cached per database. A key created in a transaction that hasn't
+committed yet is not cached: if the transaction rolls back, the same id can
+go to a different user. The session keeps such keys in
+info["uncommitted_user_keys"] and caches them when it commits.
+"""
+from typing import Dict, Iterable, List, Union
+
+from sqlalchemy import event, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, object_session
+
+from app.database import dialect_insert
+from app.models import User, UserAssignment, Event
+from app.utils.cache import get_user_key, set_user_key
+
+# keeps the IN (...) list well under SQLite's bound-parameter limit
+KEY_CHUNK_SIZE = 500
+
+
+def _database(url, info: dict) -> str:
+    """Cache namespace: shard file, else the database url."""
+    return info.get("shard") or str(url)
+
+
+def _select_keys(db: Union[Session, Connection], user_ids: List[str]) -> Dict[str, int]:
+    found: Dict[str, int] = {}
+    for i in range(0, len(user_ids), KEY_CHUNK_SIZE):
+        rows = db.execute(
+            select(User.external_id, User.id).where(User.external_id.in_(user_ids[i:i + KEY_CHUNK_SIZE]))
+        )
+        found.update({external_id: key for external_id, key in rows})
+    return found
+
+
+def _user_keys(
+    db: Union[Session, Connection],
+    database: str,
+    info: dict,
+    user_ids: Iterable[str],
+    create: bool
+) -> Dict[str, int]:
+    keys: Dict[str, int] = {}
+    misses = []
+    for user_id in dict.fromkeys(user_ids):
+        key = get_user_key(database, user_id)
+        if key is None:
+            misses.append(user_id)
+        else:
+            keys[user_id] = key
+    if not misses:
+        return keys
+
+    # keys this session created: (database, user_id) -> key, cached once committed
+    uncommitted = info.setdefault("uncommitted_user_keys", {})
+    found = _select_keys(db, misses)
+    if create:
+        missing = [u for u in misses if u not in found]
+        if missing:
+            stmt = dialect_insert(db)(User).on_conflict_do_nothing(
+                index_elements=["external_id"]
+            ).returning(User.external_id, User.id)
+            rows = db.execute(stmt, [{"external_id": u} for u in missing])
+            inserted = {external_id: key for external_id, key in rows}
+            uncommitted.update({(database, user_id): key for user_id, key in inserted.items()})
+            found.update(inserted)
+            # a concurrent writer added the rest first
+            lost = [u for u in missing if u not in inserted]
+            if lost:
+                found.update(_select_keys(db, lost))
+
+    for user_id, key in found.items():
+        keys[user_id] = key
+        if (database, user_id) not in uncommitted:
+            set_user_key(database, user_id, key)
+    return keys
+
+
+def find_user_keys(db: Session, user_ids: Iterable[str]) -> Dict[str, int]:
+    """Keys of the user ids that have one (users never seen are simply absent)."""
+    return _user_keys(db, _database(db.get_bind().url, db.info), db.info, user_ids, create=False)
+
+
+def user_keys(db: Session, user_ids: Iterable[str]) -> Dict[str, int]:
+    """Keys for every user id, adding new ones to the dictionary (in the caller's transaction)."""
+    return _user_keys(db, _database(db.get_bind().url, db.info), db.info, user_ids, create=True)
+
+
+@event.listens_for(UserAssignment, "before_insert")
+@event.listens_for(Event, "before_insert")
+def _fill_user_key(mapper, connection: Connection, target):
+    """ORM-added rows (create_event, scripts, tests) get their key at flush."""
+    if target.user_key is None:
+        info = object_session(target).info
+        target.user_key = _user_keys(
+            connection, _database(connection.engine.url, info), info, [target.user_id], create=True
+        )[target.user_id]
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_committed_user_keys(session: Session):
+    for (database, user_id), key in session.info.pop("uncommitted_user_keys", {}).items():
+        set_user_key(database, user_id, key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_user_keys(session: Session):
+    # those ids may be handed to other users now
+    session.info.pop("uncommitted_user_keys", None)
@@ -0,0 +1,93 @@
+"""Client side of the single-writer deployment.
+
+With WRITER_SOCKET set, every web worker sends its writes (events,
+assignments, experiment creation) to the writer process over a Unix socket
+instead of opening SQLite write transactions itself; reads keep using the
+worker's own engine. Endpoints go through run_write, which runs the service
+function locally when forwarding is off.
+
+Requests name a service function and carry its arguments; the writer looks
+the name up in its own registry (app/services/writer_process.py), so only
+those functions can be called. Each thread keeps one connection and has at
+most one request in flight on it.
+"""
+import threading
+from multiprocessing.connection import Client, Connection
+from typing import Any, Callable, Optional, Union
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.database import run_session
+
+
+class WriterClient:
+    """Per-thread connections to the writer process; call() blocks until the write committed."""
+
+    def __init__(self, path: str = "", timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _connect(self) -> Connection:
+        try:
+            return Client(self.path, family="AF_UNIX")
+        except OSError:
+            raise HTTPException(status_code=503, detail="Writer process unavailable", headers={"Retry-After": "1"})
+
+    def _drop(self) -> None:
+        conn: Optional[Connection] = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def call(self, op: str, *args) -> Any:
+        """Run writer operation `op(session, *args)` in the writer process and return its result."""
+        if getattr(self._local, "path", None) != self.path:
+            self._drop()
+            self._local.path = self.path
+        conn = getattr(self._local, "conn", None)
+        try:
+            if conn is None:
+                raise BrokenPipeError
+            conn.send((op, args))
+        except OSError:
+            # stale connection (writer restarted): nothing was delivered, safe to resend once
+            self._drop()
+            conn = self._local.conn = self._connect()
+            conn.send((op, args))
+
+        try:
+            if not conn.poll(self.timeout):
+                raise TimeoutError
+            reply = conn.recv()
+        except (EOFError, OSError):
+            # the write may or may not have committed; don't retry it
+            self._drop()
+            raise HTTPException(status_code=503, detail="Writer process did not answer", headers={"Retry-After": "1"})
+
+        if reply[0] == "ok":
+            return reply[1]
+        _, status_code, detail, headers = reply
+        raise HTTPException(status_code=status_code, detail=detail, headers=headers)
+
+
+write_forwarder = WriterClient(path=settings.writer_socket, timeout=settings.writer_timeout)
+
+
+async def run_write(db: Union[Session, AsyncSession], fn: Callable[..., Any], *args) -> Any:
+    """
+    run_session for writes: `fn(session, *args)` on this worker's session, or,
+    with a writer socket configured, the same-named operation in the writer
+    process (whose results are response models / AssignmentRecords, not ORM rows).
+    """
+    if write_forwarder.enabled:
+        return await run_in_threadpool(write_forwarder.call, fn.__name__, *args)
+    return await run_session(db, fn, *args)
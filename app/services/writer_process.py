@@ -0,0 +1,312 @@
+"""The single writer process for multi-worker SQLite deployments.
+
+    WRITER_SOCKET=/tmp/ab_writer.sock python -m app.services.writer_process
+    WRITER_SOCKET=/tmp/ab_writer.sock uvicorn app.main:app --workers 4
+
+Web workers forward writes here (app/services/write_forwarder.py), so only
+this process ever holds SQLite's write lock and "database is locked" can't
+happen between workers. One thread per worker connection reads requests onto
+a queue; a single writer thread drains whatever has queued up while the
+previous commit ran and group-commits it:
+
+- events from every queued create_event / create_events_batch call go into
+  one create_events_batch (one transaction),
+- assignment calls for the same experiment become one bulk get-or-create,
+- anything else runs on its own, in arrival order.
+
+If a combined write fails, its requests are retried one by one so a bad
+request only fails itself, with the error its own call would give. The writer
+also runs the background workers (rollups, write-behind assignments, the
+async event queue) that each web worker would otherwise start.
+"""
+import logging
+import os
+import queue
+import signal
+import threading
+from collections import OrderedDict
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, init_db
+from app.schemas import ExperimentResponse
+from app.services.assignment_service import (
+    get_or_create_assignment, get_or_create_assignments_bulk, get_or_create_user_assignments
+)
+from app.services.assignment_writer import assignment_writer
+from app.services.event_service import create_events_batch
+from app.services.experiment_service import create_experiment
+from app.services.ingest_queue import event_ingest_queue, queue_events
+from app.services.rollup_service import rollup_worker
+
+logger = logging.getLogger(__name__)
+
+# (worker connection, operation name, arguments)
+Request = Tuple[Connection, str, tuple]
+
+EVENT_OPS = ("create_event", "create_events_batch")
+ASSIGNMENT_OPS = ("get_or_create_assignment", "get_or_create_assignments_bulk")
+
+
+def _create_experiment(db: Session, experiment_data) -> ExperimentResponse:
+    return ExperimentResponse.model_validate(create_experiment(db, experiment_data))
+
+
+# operations web workers may call, by service function name
+WRITE_OPERATIONS: Dict[str, Callable[..., Any]] = {
+    "create_event": lambda db, event_data: create_events_batch(db, [event_data])[0],
+    "create_events_batch": create_events_batch,
+    "get_or_create_assignment": get_or_create_assignment,
+    "get_or_create_assignments_bulk": get_or_create_assignments_bulk,
+    "get_or_create_user_assignments": get_or_create_user_assignments,
+    "create_experiment": _create_experiment,
+    "queue_events": queue_events,
+}
+
+
+def _error_reply(e: Exception) -> tuple:
+    if isinstance(e, HTTPException):
+        return ("error", e.status_code, e.detail, e.headers)
+    logger.exception("Forwarded write failed")
+    return ("error", 500, "Write failed", None)
+
+
+class WriterServer:
+    """Unix socket listener + one group-commit writer thread."""
+
+    def __init__(
+        self,
+        path: str,
+        session_factory: Callable[[], Session] = SessionLocal,
+        batch_size: int = 5000
+    ):
+        self.path = path
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self._requests: "queue.Queue[Request]" = queue.Queue()
+        self._stop = threading.Event()
+        self._listener: Optional[Listener] = None
+        self._threads: List[threading.Thread] = []
+        self._connections: Set[Connection] = set()
+        self._connections_lock = threading.Lock()
+        self.batches = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._listener is not None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left behind by a writer that didn't shut down cleanly
+        self._stop.clear()
+        self._listener = Listener(self.path, family="AF_UNIX")
+        # requests carry pickles: only this user may connect
+        os.chmod(self.path, 0o600)
+        for target, name in ((self._accept_loop, "writer-accept"), (self._run, "writer-commit")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        if self._listener is None:
+            return
+        self._stop.set()
+        try:
+            Client(self.path, family="AF_UNIX").close()  # wake the blocked accept()
+        except OSError:
+            pass
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._listener.close()
+        self._listener = None
+        # workers see EOF right away instead of waiting out their timeout
+        with self._connections_lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            conn.close()
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                continue
+            if self._stop.is_set():
+                conn.close()
+                break
+            with self._connections_lock:
+                self._connections.add(conn)
+            threading.Thread(target=self._read_loop, args=(conn,), name="writer-conn", daemon=True).start()
+
+    def _read_loop(self, conn: Connection):
+        while not self._stop.is_set():
+            try:
+                op, args = conn.recv()
+            except (EOFError, OSError):
+                break
+            self._requests.put((conn, op, args))
+        with self._connections_lock:
+            self._connections.discard(conn)
+
+    def _take_batch(self) -> List[Request]:
+        """Block for one request, then take whatever else is already queued (up to batch_size events)."""
+        try:
+            batch = [self._requests.get(timeout=0.2)]
+        except queue.Empty:
+            return []
+        events = 0
+        while events < self.batch_size:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            if request[1] == "create_events_batch":
+                events += len(request[2][0])
+            elif request[1] == "create_event":
+                events += 1
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if batch:
+                self.process(batch)
+        # answer what is still queued before shutting down
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self.process(batch)
+
+    @staticmethod
+    def _reply(conn: Connection, payload: tuple):
+        try:
+            conn.send(payload)
+        except (OSError, ValueError):
+            pass  # worker went away; its write stands
+
+    def _call(self, op: str, *args) -> Any:
+        db = self.session_factory()
+        try:
+            return WRITE_OPERATIONS[op](db, *args)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _run_single(self, request: Request):
+        conn, op, args = request
+        if op not in WRITE_OPERATIONS:
+            self._reply(conn, ("error", 400, f"Unknown write operation: {op}", None))
+            return
+        try:
+            self._reply(conn, ("ok", self._call(op, *args)))
+        except Exception as e:
+            self._reply(conn, _error_reply(e))
+
+    def _run_group(self, requests: List[Request], op: str, args: tuple, split: Callable[[Any], List[Any]]):
+        """One combined call for several requests; split(result) gives each request its answer."""
+        if len(requests) == 1:
+            self._run_single(requests[0])
+            return
+        try:
+            answers = split(self._call(op, *args))
+        except Exception:
+            # e.g. one bad event, or a paused experiment (where users who already
+            # have a row still get it from the single call): let each request fail alone
+            logger.info("Combined %s for %d requests failed, retrying one by one", op, len(requests))
+            for request in requests:
+                self._run_single(request)
+            return
+        for (conn, _, _), answer in zip(requests, answers):
+            self._reply(conn, ("ok", answer))
+
+    def _run_events(self, requests: List[Request]):
+        sizes = [1 if op == "create_event" else len(args[0]) for _, op, args in requests]
+        events = [e for _, op, args in requests for e in ([args[0]] if op == "create_event" else args[0])]
+
+        def split(out):
+            answers, start = [], 0
+            for (_, op, _), size in zip(requests, sizes):
+                answers.append(out[start] if op == "create_event" else out[start:start + size])
+                start += size
+            return answers
+
+        self._run_group(requests, "create_events_batch", (events,), split)
+
+    def _run_assignments(self, experiment_id: int, requests: List[Request]):
+        user_ids = []
+        for _, op, args in requests:
+            user_ids.extend([args[1]] if op == "get_or_create_assignment" else args[1])
+
+        def split(records):
+            by_user = {r.user_id: r for r in records}
+            return [
+                by_user[args[1]] if op == "get_or_create_assignment"
+                else [by_user[u] for u in dict.fromkeys(args[1])]
+                for _, op, args in requests
+            ]
+
+        self._run_group(requests, "get_or_create_assignments_bulk", (experiment_id, user_ids), split)
+
+    def process(self, batch: List[Request]):
+        """Group one drained batch of requests into as few transactions as possible."""
+        # counted before any reply goes out, so a caller that got its answer sees its batch
+        self.batches += 1
+        events: List[Request] = []
+        assignments: Dict[int, List[Request]] = OrderedDict()
+        others: List[Request] = []
+        for request in batch:
+            _, op, args = request
+            if op in EVENT_OPS:
+                events.append(request)
+            elif op in ASSIGNMENT_OPS:
+                assignments.setdefault(args[0], []).append(request)
+            else:
+                others.append(request)
+
+        if events:
+            self._run_events(events)
+        for experiment_id, requests in assignments.items():
+            self._run_assignments(experiment_id, requests)
+        for request in others:
+            self._run_single(request)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    if not settings.writer_socket:
+        raise SystemExit("WRITER_SOCKET is not set")
+
+    init_db()
+    if settings.rollup_worker_enabled:
+        rollup_worker.start()
+    if settings.assignment_write_mode == "write_behind":
+        assignment_writer.start()
+    if settings.event_queue_enabled:
+        event_ingest_queue.start()
+
+    server = WriterServer(settings.writer_socket, batch_size=settings.writer_batch_size)
+    server.start()
+    logger.info("Writer listening on %s", settings.writer_socket)
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    stopped.wait()
+
+    server.stop()
+    rollup_worker.stop()
+    assignment_writer.stop()
+    event_ingest_queue.stop()
+
+
+if __name__ == "__main__":
+    main()
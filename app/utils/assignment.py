@@ -1,9 +1,20 @@
 
 import hashlib
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
 
 # # import random
 # # import secrets
-# # from typing import Sequence
+
+# hash_user_experiment always lands in 0-99
+BUCKET_COUNT = 100
+# below this, a plain list lookup beats converting to a numpy array
+NUMPY_MIN_BATCH = 2048
+
+# results sampling: users hash into 0..SAMPLE_BUCKETS-1, independent of variant allocation
+SAMPLE_BUCKETS = 10000
+SAMPLE_SALT = "results-sample"
 
 
 def hash_user_experiment(user_id: str, experiment_id: int) -> int:
@@ -25,6 +36,16 @@ def hash_user_experiment(user_id: str, experiment_id: int) -> int:
     # return 0
 
 
+def hash_user_sample(user_id: str) -> int:
+    """
+    Deterministic 0..SAMPLE_BUCKETS-1 bucket for results sampling.
+    Salted so the sample is not correlated with variant assignment; the same
+    for every experiment, so a user is either in a sample or not.
+    """
+    hash_obj = hashlib.md5(f"{SAMPLE_SALT}:{user_id}".encode())
+    return int(hash_obj.hexdigest()[:8], 16) % SAMPLE_BUCKETS
+
+
 def assign_variant(hash_value: int, variants_with_percentages: list) -> int:
     """
     Assign variant based on hash value and traffic percentages.
@@ -49,3 +70,37 @@ def assign_variant(hash_value: int, variants_with_percentages: list) -> int:
 
     # return variants_with_percentages[0][0]
 
+
+def hash_user_experiment_batch(user_ids: Iterable[str], experiment_id: int) -> List[int]:
+    """
+    Buckets for many users in one pass. Bit-identical to hash_user_experiment:
+    int.from_bytes(digest) is the same number as int(hexdigest, 16), without
+    the hex round-trip, and the experiment suffix is encoded once.
+    """
+    suffix = f"_{experiment_id}".encode()
+    md5 = hashlib.md5
+    from_bytes = int.from_bytes
+    return [from_bytes(md5(u.encode() + suffix).digest(), "big") % BUCKET_COUNT for u in user_ids]
+
+
+def build_allocation_table(variants_with_percentages: Sequence[Tuple[int, float]]) -> Tuple[int, ...]:
+    """
+    Precompile bucket -> variant_id for one experiment (index = hash bucket).
+    Built with assign_variant itself, so lookups match it exactly.
+    """
+    if not variants_with_percentages:
+        return ()
+    return tuple(assign_variant(b, list(variants_with_percentages)) for b in range(BUCKET_COUNT))
+
+
+def assign_variants_batch(
+    user_ids: Sequence[str],
+    experiment_id: int,
+    allocation: Tuple[int, ...]
+) -> List[int]:
+    """variant_id for each user, via batched hashing + the allocation table."""
+    buckets = hash_user_experiment_batch(user_ids, experiment_id)
+    if len(buckets) >= NUMPY_MIN_BATCH:
+        table = np.asarray(allocation, dtype=np.int64)
+        return table[np.asarray(buckets, dtype=np.intp)].tolist()
+    return [allocation[b] for b in buckets]
@@ -1,6 +1,7 @@
 
-from typing import Optional, Any
-from cachetools import TTLCache
+from datetime import datetime
+from typing import Optional, Any, NamedTuple, Tuple
+from cachetools import LRUCache, TTLCache
 from app.config import settings
 
 # # from cachetools import LRUCache
@@ -8,6 +9,30 @@ from app.config import settings
 # # from typing import Callable
 
 
+class AssignmentRecord(NamedTuple):
+    """Immutable snapshot of an assignment; safe to keep after the session closes."""
+    id: Optional[int]
+    experiment_id: int
+    user_id: str
+    variant_id: int
+    variant_name: str
+    assigned_at: datetime
+
+
+class VariantConfig(NamedTuple):
+    id: int
+    name: str
+    traffic_percentage: float
+
+
+class ExperimentConfig(NamedTuple):
+    """What assignment needs to know about an experiment (variants ordered by id)."""
+    id: int
+    status: str
+    variants: Tuple[VariantConfig, ...]
+    allocation: Tuple[int, ...] = ()  # hash bucket -> variant_id, see build_allocation_table
+
+
 # Cache for user assignments - key: "assignment:{experiment_id}:{user_id}"
 assignment_cache = TTLCache(
     maxsize=settings.cache_max_size,
@@ -20,19 +45,47 @@ experiment_cache = TTLCache(
     ttl=settings.cache_ttl * 2  # Experiments change less frequently
 )
 
+# Cache for computed results - key: "results:{experiment_id}:{params}",
+# value: (watermark, ExperimentResults); stale entries are detected by watermark
+results_cache = TTLCache(
+    maxsize=settings.results_cache_max_size,
+    ttl=settings.results_cache_ttl
+)
 
-def get_assignment(experiment_id: int, user_id: str) -> Optional[Any]:
+# Integer keys of external user ids - key: (database, user_id); never stale,
+# so LRU only (see app/services/user_keys.py)
+user_key_cache = LRUCache(maxsize=settings.user_key_cache_size)
+
+
+def get_assignment(experiment_id: int, user_id: str) -> Optional[AssignmentRecord]:
     """Get cached assignment if exists"""
     key = f"assignment:{experiment_id}:{user_id}"
     return assignment_cache.get(key)
 
 
-def set_assignment(experiment_id: int, user_id: str, value: Any):
+def set_assignment(experiment_id: int, user_id: str, value: AssignmentRecord):
     """Cache an assignment"""
     key = f"assignment:{experiment_id}:{user_id}"
     assignment_cache[key] = value
 
 
+def forget_assignment(experiment_id: int, user_id: str, value: AssignmentRecord):
+    """Drop a cached assignment, unless it has been replaced since"""
+    key = f"assignment:{experiment_id}:{user_id}"
+    if assignment_cache.get(key) == value:
+        assignment_cache.pop(key, None)
+
+
+def get_user_key(database: str, user_id: str) -> Optional[int]:
+    """Get cached integer key of an external user id in one database"""
+    return user_key_cache.get((database, user_id))
+
+
+def set_user_key(database: str, user_id: str, user_key: int):
+    """Cache the integer key of an external user id"""
+    user_key_cache[(database, user_id)] = user_key
+
+
 def get_experiment(experiment_id: int) -> Optional[Any]:
     """Get cached experiment if exists"""
     key = f"experiment:{experiment_id}"
@@ -45,13 +98,38 @@ def set_experiment(experiment_id: int, value: Any):
     experiment_cache[key] = value
 
 
+def get_experiment_config(experiment_id: int) -> Optional[ExperimentConfig]:
+    """Get cached assignment config for an experiment if exists"""
+    key = f"experiment_config:{experiment_id}"
+    return experiment_cache.get(key)
+
+
+def set_experiment_config(experiment_id: int, value: ExperimentConfig):
+    """Cache an experiment's assignment config"""
+    key = f"experiment_config:{experiment_id}"
+    experiment_cache[key] = value
+
+
 def clear_experiment_cache(experiment_id: int):
     """Clear cached experiment (e.g., when updated)"""
     key = f"experiment:{experiment_id}"
     experiment_cache.pop(key, None)
+    experiment_cache.pop(f"experiment_config:{experiment_id}", None)
 
     # experiment_cache.clear()
 
+
+def get_results(experiment_id: int, params: Tuple) -> Optional[Tuple[Tuple, Any]]:
+    """Get cached (watermark, results) for an experiment + query params if exists"""
+    key = f"results:{experiment_id}:{params!r}"
+    return results_cache.get(key)
+
+
+def set_results(experiment_id: int, params: Tuple, watermark: Tuple, value: Any):
+    """Cache computed results together with the watermark they were computed at"""
+    key = f"results:{experiment_id}:{params!r}"
+    results_cache[key] = (watermark, value)
+
 # def cache_info():
 #     return {"assignments": len(assignment_cache), "experiments": len(experiment_cache)}
 
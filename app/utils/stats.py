@@ -0,0 +1,385 @@
+"""Vectorized statistics for comparing variants.
+
+Everything takes per-variant count arrays (last axis = variants; leading axes
+can stack several metrics) and evaluates all requested variant pairs in one
+NumPy pass, instead of one Python call per pair.
+"""
+import math
+import warnings
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+Z_CRIT_95 = 1.96
+
+# incomplete gamma: iteration cap / convergence tolerance
+_GAMMA_MAX_ITER = 500
+_GAMMA_EPS = 1e-15
+_GAMMA_TINY = 1e-300
+
+def baseline_pairs(k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(baseline, treatment) index arrays: variant 0 against every other variant."""
+    return np.zeros(max(k - 1, 0), dtype=int), np.arange(1, k)
+
+
+def all_pairs(k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(baseline, treatment) index arrays for every unordered pair i < j."""
+    return np.triu_indices(k, 1)
+
+
+def compare_proportions(
+    successes,
+    totals,
+    pairs: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    alpha: float = 0.05
+) -> Dict[str, np.ndarray]:
+    """
+    Two-proportion z-tests for variant pairs (defaults to baseline vs others).
+
+    Returns arrays over the pairs: rate_baseline, rate_treatment, lift_percentage
+    (inf when the baseline rate is 0 and the treatment's isn't), z_score and
+    p_value (nan where undefined), significant, and ci_low/ci_high for the
+    rate difference (unpooled SE; nan where undefined).
+    """
+    x = np.asarray(successes, dtype=float)
+    n = np.asarray(totals, dtype=float)
+    if pairs is None:
+        pairs = baseline_pairs(x.shape[-1])
+    i, j = pairs
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(n > 0, x / np.where(n > 0, n, 1.0), 0.0)
+        x1, n1, p1 = x[..., i], n[..., i], rate[..., i]
+        x2, n2, p2 = x[..., j], n[..., j], rate[..., j]
+
+        lift = np.where(p1 > 0, (p2 - p1) / np.where(p1 > 0, p1, 1.0) * 100.0, np.where(p2 == 0, 0.0, np.inf))
+
+        both = (n1 > 0) & (n2 > 0)
+        inv_n = np.where(both, 1.0 / np.where(n1 > 0, n1, 1.0) + 1.0 / np.where(n2 > 0, n2, 1.0), 0.0)
+        p_pool = np.where(both, (x1 + x2) / np.where(both, n1 + n2, 1.0), 0.0)
+        se = np.sqrt(np.maximum(p_pool * (1.0 - p_pool) * inv_n, 0.0))
+        testable = both & (se > 0)
+        z = np.where(testable, (p2 - p1) / np.where(testable, se, 1.0), np.nan)
+        p_value = np.where(testable, _erfc(np.abs(np.where(testable, z, 0.0)) / math.sqrt(2.0)), np.nan)
+
+        se_diff = np.sqrt(np.maximum(
+            p1 * (1.0 - p1) / np.where(n1 > 0, n1, 1.0) + p2 * (1.0 - p2) / np.where(n2 > 0, n2, 1.0), 0.0
+        ))
+        has_ci = both & (se_diff > 0)
+        diff = p2 - p1
+        ci_low = np.where(has_ci, diff - Z_CRIT_95 * se_diff, np.nan)
+        ci_high = np.where(has_ci, diff + Z_CRIT_95 * se_diff, np.nan)
+
+    return {
+        "baseline": np.asarray(i),
+        "treatment": np.asarray(j),
+        "rate_baseline": p1,
+        "rate_treatment": p2,
+        "lift_percentage": lift,
+        "z_score": z,
+        "p_value": p_value,
+        "significant": testable & (np.nan_to_num(p_value, nan=1.0) < alpha),
+        "testable": testable,
+        "ci_low": ci_low,
+        "ci_high": ci_high,
+    }
+
+
+# Stirling series for log Gamma: coefficients B_2k / (2k (2k - 1)) of x^-(2k-1)
+_STIRLING_COEF = (1 / 12, -1 / 360, 1 / 1260, -1 / 1680, 1 / 1188, -691 / 360360, 1 / 156)
+# arguments below this are shifted up first, so the truncated series is accurate to ~1e-15
+_STIRLING_MIN = 10.0
+
+
+def _lgamma(x: np.ndarray) -> np.ndarray:
+    """log Gamma(x) for x > 0, elementwise."""
+    x = np.asarray(x, dtype=float)
+    shift = np.zeros(x.shape)
+    small = x < _STIRLING_MIN
+    if small.any():
+        # log Gamma(x) = log Gamma(x + n) - log(x (x + 1) ... (x + n - 1))
+        for k in range(int(_STIRLING_MIN)):
+            shift -= np.where(small, np.log(x + k), 0.0)
+        x = np.where(small, x + _STIRLING_MIN, x)
+    inv, inv_sq = 1.0 / x, 1.0 / (x * x)
+    tail = np.zeros(x.shape)
+    for coef in reversed(_STIRLING_COEF):
+        tail = tail * inv_sq + coef
+    return (x - 0.5) * np.log(x) - x + 0.5 * math.log(2.0 * math.pi) + tail * inv + shift
+
+
+def _gamma_series(a: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Regularized lower incomplete gamma P(a, x) by its power series (x < a + 1)."""
+    ap = a.copy()
+    term = 1.0 / a
+    total = term.copy()
+    active = np.ones(a.shape, dtype=bool)
+    for _ in range(_GAMMA_MAX_ITER):
+        ap += 1.0
+        term = term * x / ap
+        total += np.where(active, term, 0.0)
+        active &= np.abs(term) >= np.abs(total) * _GAMMA_EPS
+        if not active.any():
+            break
+    return total * np.exp(a * np.log(x) - x - _lgamma(a))
+
+
+def _gamma_continued_fraction(a: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Regularized upper incomplete gamma Q(a, x) by Lentz's continued fraction (x >= a + 1)."""
+    b = x + 1.0 - a
+    c = np.full(a.shape, 1.0 / _GAMMA_TINY)
+    d = 1.0 / b
+    h = d.copy()
+    active = np.ones(a.shape, dtype=bool)
+    for k in range(1, _GAMMA_MAX_ITER):
+        an = -k * (k - a)
+        b = b + 2.0
+        d = an * d + b
+        d = 1.0 / np.where(np.abs(d) < _GAMMA_TINY, _GAMMA_TINY, d)
+        c = b + an / c
+        c = np.where(np.abs(c) < _GAMMA_TINY, _GAMMA_TINY, c)
+        delta = d * c
+        h = np.where(active, h * delta, h)
+        active &= np.abs(delta - 1.0) >= _GAMMA_EPS
+        if not active.any():
+            break
+    return np.exp(a * np.log(x) - x - _lgamma(a)) * h
+
+
+def _gammaincc(a, x) -> np.ndarray:
+    """
+    Regularized upper incomplete gamma Q(a, x), elementwise: every element
+    iterates its series / continued fraction together, as array operations.
+    nan where a <= 0, x < 0 or either is nan.
+    """
+    a, x = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(x, dtype=float))
+    out = np.full(a.shape, np.nan)
+    valid = (a > 0) & (x >= 0)
+    out[valid & (x == 0)] = 1.0
+    series = valid & (x > 0) & (x < a + 1.0)
+    fraction = valid & (x >= a + 1.0)
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore", under="ignore"):
+        if series.any():
+            out[series] = np.maximum(0.0, 1.0 - _gamma_series(a[series], x[series]))
+        if fraction.any():
+            out[fraction] = np.minimum(1.0, _gamma_continued_fraction(a[fraction], x[fraction]))
+    return out
+
+
+def _erfc(z) -> np.ndarray:
+    """Complementary error function, elementwise: erfc(z) = Q(1/2, z^2) for z >= 0."""
+    z = np.asarray(z, dtype=float)
+    q = _gammaincc(0.5, z * z)
+    return np.where(z < 0, 2.0 - q, q)
+
+
+def chi_square_sf(chi_square, df):
+    """Exact chi-square survival function P(X >= chi_square), elementwise."""
+    return _gammaincc(np.asarray(df, dtype=float) / 2.0, np.asarray(chi_square, dtype=float) / 2.0)
+
+
+def _betacf(a: np.ndarray, b: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Continued fraction for the incomplete beta function (modified Lentz), elementwise."""
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c = np.ones(a.shape)
+    d = 1.0 - qab * x / qap
+    d = 1.0 / np.where(np.abs(d) < _GAMMA_TINY, _GAMMA_TINY, d)
+    h = d.copy()
+    active = np.ones(a.shape, dtype=bool)
+    for m in range(1, _GAMMA_MAX_ITER):
+        m2 = 2 * m
+        for aa in (
+            m * (b - m) * x / ((qam + m2) * (a + m2)),
+            -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2)),
+        ):
+            d = 1.0 + aa * d
+            d = 1.0 / np.where(np.abs(d) < _GAMMA_TINY, _GAMMA_TINY, d)
+            c = 1.0 + aa / c
+            c = np.where(np.abs(c) < _GAMMA_TINY, _GAMMA_TINY, c)
+            delta = d * c
+            h = np.where(active, h * delta, h)
+        active &= np.abs(delta - 1.0) >= _GAMMA_EPS
+        if not active.any():
+            break
+    return h
+
+
+def _betainc(a: np.ndarray, b: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Regularized incomplete beta I_x(a, b) for a, b > 0, elementwise."""
+    out = np.where(x <= 0, 0.0, 1.0)
+    inside = (x > 0) & (x < 1)
+    if inside.any():
+        a, b, x = a[inside], b[inside], x[inside]
+        log_front = _lgamma(a + b) - _lgamma(a) - _lgamma(b) + a * np.log(x) + b * np.log1p(-x)
+        direct = x < (a + 1.0) / (a + b + 2.0)
+        value = np.empty(x.shape)
+        with np.errstate(over="ignore", invalid="ignore", divide="ignore", under="ignore"):
+            if direct.any():
+                value[direct] = (np.exp(log_front[direct]) * _betacf(a[direct], b[direct], x[direct]) / a[direct])
+            flip = ~direct
+            if flip.any():
+                value[flip] = 1.0 - np.exp(log_front[flip]) * _betacf(b[flip], a[flip], 1.0 - x[flip]) / b[flip]
+        out[inside] = value
+    return out
+
+
+def _t_two_sided(t: np.ndarray, df: np.ndarray) -> np.ndarray:
+    """P(|T| >= |t|) for Student's t; both arrays already broadcast, df > 0."""
+    return _betainc(df / 2.0, np.full(df.shape, 0.5), df / (df + t * t))
+
+
+def t_two_sided_p(t, df):
+    """Two-sided Student's t p-value, elementwise (nan where t or df is nan, or df <= 0)."""
+    t, df = np.broadcast_arrays(np.asarray(t, dtype=float), np.asarray(df, dtype=float))
+    out = np.full(t.shape, np.nan)
+    ok = ~np.isnan(t) & (df > 0)
+    if ok.any():
+        out[ok] = _t_two_sided(t[ok], df[ok])
+    return out
+
+
+def _t_critical(df, alpha: float) -> np.ndarray:
+    """t such that the two-sided p-value is alpha, elementwise (bisection on all elements at once)."""
+    df = np.asarray(df, dtype=float)
+    out = np.full(df.shape, np.nan)
+    ok = df > 0
+    if not ok.any():
+        return out
+    d = df[ok]
+    lo, hi = np.zeros(d.shape), np.full(d.shape, 2.0)
+    grow = _t_two_sided(hi, d) > alpha
+    while grow.any():
+        lo, hi = np.where(grow, hi, lo), np.where(grow, hi * 2.0, hi)
+        grow = _t_two_sided(hi, d) > alpha
+    for _ in range(200):
+        mid = (lo + hi) / 2.0
+        above = _t_two_sided(mid, d) > alpha
+        lo, hi = np.where(above, mid, lo), np.where(above, hi, mid)
+        if np.all(hi - lo < 1e-12 * hi):
+            break
+    out[ok] = (lo + hi) / 2.0
+    return out
+
+
+def welch_t_test(
+    counts,
+    sums,
+    sums_of_squares,
+    pairs: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    alpha: float = 0.05
+) -> Dict[str, np.ndarray]:
+    """
+    Welch t-tests on per-variant means given only streaming moments
+    (n, sum x, sum x^2). Returns arrays over the pairs: mean_baseline,
+    mean_treatment, diff, lift_percentage, t_statistic, df, p_value,
+    significant, testable and ci_low/ci_high for the mean difference.
+    """
+    n = np.asarray(counts, dtype=float)
+    s = np.asarray(sums, dtype=float)
+    ss = np.asarray(sums_of_squares, dtype=float)
+    if pairs is None:
+        pairs = baseline_pairs(n.shape[-1])
+    i, j = pairs
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        safe_n = np.where(n > 0, n, 1.0)
+        mean = np.where(n > 0, s / safe_n, 0.0)
+        var = np.where(n > 1, np.maximum(ss - s * mean, 0.0) / np.where(n > 1, n - 1.0, 1.0), np.nan)
+        se2_1, se2_2 = var[..., i] / safe_n[..., i], var[..., j] / safe_n[..., j]
+        m1, m2 = mean[..., i], mean[..., j]
+        diff = m2 - m1
+        lift = np.where(m1 != 0, diff / np.where(m1 != 0, np.abs(m1), 1.0) * 100.0, np.where(m2 == 0, 0.0, np.inf))
+
+        se = np.sqrt(se2_1 + se2_2)
+        testable = np.isfinite(se) & (se > 0)
+        t = np.where(testable, diff / np.where(testable, se, 1.0), np.nan)
+        # Welch-Satterthwaite degrees of freedom
+        df = np.where(testable, (se2_1 + se2_2) ** 2 / (
+            se2_1 ** 2 / np.where(n[..., i] > 1, n[..., i] - 1.0, 1.0)
+            + se2_2 ** 2 / np.where(n[..., j] > 1, n[..., j] - 1.0, 1.0)
+        ), np.nan)
+        p_value = t_two_sided_p(t, df)
+        margin = _t_critical(df, alpha) * se
+
+    return {
+        "baseline": np.asarray(i),
+        "treatment": np.asarray(j),
+        "mean_baseline": m1,
+        "mean_treatment": m2,
+        "diff": diff,
+        "lift_percentage": lift,
+        "t_statistic": t,
+        "df": df,
+        "p_value": p_value,
+        "significant": testable & (np.nan_to_num(p_value, nan=1.0) < alpha),
+        "testable": testable,
+        "ci_low": np.where(testable, diff - margin, np.nan),
+        "ci_high": np.where(testable, diff + margin, np.nan),
+    }
+
+
+def srm_test(observed, expected_percent) -> Dict[str, np.ndarray]:
+    """
+    Chi-square goodness-of-fit of observed assignment counts against the
+    expected traffic split (percent). Leading axes are independent tests.
+    """
+    obs = np.asarray(observed, dtype=float)
+    share = np.asarray(expected_percent, dtype=float) / 100.0
+    total = obs.sum(axis=-1, keepdims=True)
+    expected = total * share
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(expected > 0, (obs - expected) ** 2 / np.where(expected > 0, expected, 1.0), 0.0)
+    chi_square = terms.sum(axis=-1)
+    df = np.full(chi_square.shape, max(obs.shape[-1] - 1, 1), dtype=float)
+    return {
+        "chi_square": chi_square,
+        "df": df,
+        "p_value": chi_square_sf(chi_square, df),
+        "observed_percent": np.where(total > 0, obs / np.where(total > 0, total, 1.0) * 100.0, 0.0),
+    }
+
+
+def resample_means(values, counts, n_resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Bootstrap means of one sample, given as distinct outcome values and how
+    many users had each. Drawing n users with replacement is a multinomial
+    draw over the distinct values, so the cost grows with the number of
+    distinct outcomes, not users (a 0/1 conversion vector is two values).
+    """
+    values = np.asarray(values, dtype=float)
+    counts = np.asarray(counts, dtype=np.int64)
+    n = int(counts.sum())
+    if n == 0:
+        return np.full(n_resamples, np.nan)
+    draws = rng.multinomial(n, counts / n, size=n_resamples)
+    return draws @ values / n
+
+
+def bootstrap_intervals(means, pairs=None, level: float = 0.95) -> Dict[str, np.ndarray]:
+    """
+    Percentile intervals for the difference and relative lift (percent) of
+    variant pairs, from bootstrap means shaped (resamples, variants).
+    Resamples with a zero baseline mean are left out of the lift interval.
+    """
+    means = np.asarray(means, dtype=float)
+    if pairs is None:
+        pairs = baseline_pairs(means.shape[-1])
+    i, j = pairs
+    q = [(1.0 - level) / 2.0 * 100.0, (1.0 + level) / 2.0 * 100.0]
+    base, treat = means[:, i], means[:, j]
+    diff = treat - base
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lift = np.where(base != 0, diff / np.where(base != 0, base, 1.0) * 100.0, np.nan)
+    with warnings.catch_warnings():
+        # all-nan columns (e.g. baseline never converts) yield nan bounds
+        warnings.simplefilter("ignore", RuntimeWarning)
+        diff_low, diff_high = np.nanpercentile(diff, q, axis=0)
+        lift_low, lift_high = np.nanpercentile(lift, q, axis=0)
+    return {
+        "baseline": np.asarray(i),
+        "treatment": np.asarray(j),
+        "diff_low": diff_low,
+        "diff_high": diff_high,
+        "lift_low": lift_low,
+        "lift_high": lift_high,
+    }
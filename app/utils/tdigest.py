@@ -0,0 +1,138 @@
+"""t-digest sketches for quantiles of numeric event properties (e.g. load_ms).
+
+A digest is a small sorted list of (mean, weight) centroids; centroids near
+the tails are kept tiny so p99/p999 stay accurate. Digests are mergeable,
+so per-hour digests can be combined into any date range or time bucket.
+"""
+import math
+import struct
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# ~0.6 * COMPRESSION centroids; 200 keeps p99 within ~0.02% rank error
+COMPRESSION = 200.0
+# raw values buffered before folding them into the centroids
+BUFFER_SIZE = 500
+
+_HEADER = struct.Struct("<dddI")  # compression, min, max, centroid count
+
+
+class TDigest:
+    """Merging t-digest (k1 / arcsine scale function)."""
+    __slots__ = ("compression", "_means", "_weights", "_buffer", "_min", "_max")
+
+    def __init__(self, compression: float = COMPRESSION):
+        self.compression = compression
+        self._means: List[float] = []
+        self._weights: List[float] = []
+        self._buffer: List[float] = []
+        self._min = math.inf
+        self._max = -math.inf
+
+    def add(self, value: float) -> None:
+        self._buffer.append(value)
+        if len(self._buffer) >= BUFFER_SIZE:
+            self._compress()
+
+    def update(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "TDigest") -> None:
+        """In-place union with another digest."""
+        other._compress()
+        if not other._weights:
+            return
+        self._compress(other._means, other._weights)
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+
+    @property
+    def count(self) -> int:
+        self._compress()
+        return int(round(sum(self._weights)))
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2.0 * math.pi) * math.asin(2.0 * min(max(q, 0.0), 1.0) - 1.0)
+
+    def _compress(self, extra_means: Iterable[float] = (), extra_weights: Iterable[float] = ()) -> None:
+        """Fold buffered values (and another digest's centroids) into the centroid list."""
+        if not self._buffer and not extra_means:
+            return
+        means = np.concatenate([self._means, self._buffer, list(extra_means)])
+        weights = np.concatenate([self._weights, np.ones(len(self._buffer)), list(extra_weights)])
+        if self._buffer:
+            self._min = min(self._min, min(self._buffer))
+            self._max = max(self._max, max(self._buffer))
+            self._buffer = []
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order].tolist(), weights[order].tolist()
+
+        total = sum(weights)
+        out_means: List[float] = []
+        out_weights: List[float] = []
+        cur_mean, cur_weight = means[0], weights[0]
+        done = 0.0  # weight of the centroids already emitted
+        k_lower = self._k(0.0)
+        for mean, weight in zip(means[1:], weights[1:]):
+            if self._k((done + cur_weight + weight) / total) - k_lower <= 1.0:
+                cur_weight += weight
+                cur_mean += (mean - cur_mean) * weight / cur_weight
+            else:
+                out_means.append(cur_mean)
+                out_weights.append(cur_weight)
+                done += cur_weight
+                k_lower = self._k(done / total)
+                cur_mean, cur_weight = mean, weight
+        out_means.append(cur_mean)
+        out_weights.append(cur_weight)
+        self._means, self._weights = out_means, out_weights
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated q-quantile (0 <= q <= 1), or None for an empty digest."""
+        self._compress()
+        if not self._weights:
+            return None
+        if len(self._means) == 1 or q <= 0:
+            return self._min if q <= 0 else self._means[0]
+        if q >= 1:
+            return self._max
+
+        total = sum(self._weights)
+        target = q * total
+        # centroid i covers weight around its center; interpolate between centers
+        first_center = self._weights[0] / 2.0
+        if target < first_center:
+            return self._min + (self._means[0] - self._min) * target / first_center
+        cumulative = 0.0
+        for i in range(len(self._means) - 1):
+            center = cumulative + self._weights[i] / 2.0
+            next_center = cumulative + self._weights[i] + self._weights[i + 1] / 2.0
+            if target < next_center:
+                frac = (target - center) / (next_center - center)
+                return self._means[i] + (self._means[i + 1] - self._means[i]) * frac
+            cumulative += self._weights[i]
+        last_center = total - self._weights[-1] / 2.0
+        frac = (target - last_center) / (total - last_center)
+        return self._means[-1] + (self._max - self._means[-1]) * frac
+
+    def bounds(self) -> Tuple[Optional[float], Optional[float]]:
+        self._compress()
+        return (self._min, self._max) if self._weights else (None, None)
+
+    def to_bytes(self) -> bytes:
+        self._compress()
+        n = len(self._means)
+        return _HEADER.pack(self.compression, self._min, self._max, n) + struct.pack(
+            f"<{2 * n}d", *self._means, *self._weights
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        compression, lo, hi, n = _HEADER.unpack_from(data)
+        values = struct.unpack_from(f"<{2 * n}d", data, _HEADER.size)
+        digest = cls(compression)
+        digest._means, digest._weights = list(values[:n]), list(values[n:])
+        digest._min, digest._max = lo, hi
+        return digest
@@ -0,0 +1,2 @@
+# Benchmarks package
+# microbenchmarks, run with python -m benchmarks.<name>
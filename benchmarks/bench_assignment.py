@@ -0,0 +1,49 @@
+"""Microbenchmarks: scalar vs batched variant assignment.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_assignment [n_users]
+"""
+import sys
+import timeit
+
+from app.utils.assignment import (
+    hash_user_experiment, assign_variant, hash_user_experiment_batch,
+    build_allocation_table, assign_variants_batch, np
+)
+
+EXPERIMENT_ID = 42
+SPLIT = [(1, 33.3), (2, 33.3), (3, 33.4)]
+
+
+def scalar(user_ids):
+    return [assign_variant(hash_user_experiment(u, EXPERIMENT_ID), SPLIT) for u in user_ids]
+
+
+def batched(user_ids, table):
+    return assign_variants_batch(user_ids, EXPERIMENT_ID, table)
+
+
+def main(n: int = 100000, repeat: int = 5):
+    user_ids = [f"550e8400-e29b-41d4-a716-{i:012d}" for i in range(n)]
+    table = build_allocation_table(SPLIT)
+    assert scalar(user_ids) == batched(user_ids, table)
+
+    cases = [
+        ("scalar hash_user_experiment", lambda: [hash_user_experiment(u, EXPERIMENT_ID) for u in user_ids]),
+        ("batch  hash_user_experiment_batch", lambda: hash_user_experiment_batch(user_ids, EXPERIMENT_ID)),
+        ("scalar hash + assign_variant", lambda: scalar(user_ids)),
+        ("batch  hash + allocation table", lambda: batched(user_ids, table)),
+    ]
+
+    print(f"{n} users, best of {repeat} (numpy {'on' if np is not None else 'off'})")
+    baseline = None
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=1, repeat=repeat))
+        if baseline is None or name.startswith("scalar"):
+            baseline = best
+        print(f"  {name:<36} {best * 1000:8.1f} ms  {n / best / 1e6:6.2f} M users/s  x{baseline / best:.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
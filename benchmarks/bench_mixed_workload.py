@@ -0,0 +1,146 @@
+"""Mixed workload: event ingest latency while results queries scan the same table.
+
+Each storage profile (DB_STORAGE_PROFILE=shared / split) runs in its own
+subprocess against a fresh SQLite file, since the engines are built at import.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_mixed_workload [seconds] [seed_events]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+PROFILES = ("shared", "split")
+WRITERS = 4
+READERS = 4
+BATCH = 50
+USERS = 5000
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def child(seconds: float, seed_events: int) -> dict:
+    from app.config import settings
+    # raw scans on every read: the worst case for writers
+    settings.results_use_rollups = False
+    settings.results_use_user_summaries = False
+
+    from app.database import Base, engine, SessionLocal, ReadSessionLocal
+    from app.schemas import EventCreate, ExperimentCreate, VariantCreate
+    from app.services.assignment_service import get_or_create_assignments_bulk
+    from app.services.event_service import create_events_batch
+    from app.services.experiment_service import create_experiment
+    from app.services.results_service import get_experiment_results
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    experiment = create_experiment(db, ExperimentCreate(name="bench", variants=[
+        VariantCreate(name="control", traffic_percentage=50),
+        VariantCreate(name="treatment", traffic_percentage=50),
+    ]))
+    experiment.status = "active"
+    db.commit()
+    experiment_id = experiment.id
+    user_ids = [f"user_{i}" for i in range(USERS)]
+    get_or_create_assignments_bulk(db, experiment_id, user_ids)
+    start = datetime.utcnow() + timedelta(seconds=1)
+
+    def events(offset, n):
+        return [
+            EventCreate(user_id=user_ids[(offset + i) % USERS], type="purchase" if i % 7 == 0 else "view",
+                        timestamp=start + timedelta(milliseconds=offset + i), experiment_id=experiment_id)
+            for i in range(n)
+        ]
+
+    for i in range(0, seed_events, 5000):
+        create_events_batch(db, events(i, min(5000, seed_events - i)))
+    db.close()
+
+    stop = threading.Event()
+    latencies, errors, reads = [], [], [0]
+    lock = threading.Lock()
+
+    def writer(n):
+        offset = seed_events + n * 10_000_000
+        while not stop.is_set():
+            session = SessionLocal()
+            t0 = time.perf_counter()
+            try:
+                create_events_batch(session, events(offset, BATCH))
+            except Exception as e:  # "database is locked" once the busy timeout runs out
+                session.rollback()
+                with lock:
+                    errors.append(type(e).__name__)
+            finally:
+                session.close()
+            # failed batches count too: the client waited that long for an error
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+            offset += BATCH
+
+    def reader():
+        while not stop.is_set():
+            session = ReadSessionLocal()
+            try:
+                get_experiment_results(session, experiment_id, primary_event_type="purchase")
+                with lock:
+                    reads[0] += 1
+            finally:
+                session.close()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(WRITERS)]
+    threads += [threading.Thread(target=reader) for _ in range(READERS)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    return {
+        "batches": len(latencies) - len(errors),
+        "errors": len(errors),
+        "reads": reads[0],
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] if latencies else float("nan")) * 1000,
+    }
+
+
+def main(seconds: float = 10.0, seed_events: int = 200000):
+    print(f"{WRITERS} writers x {BATCH}-event batches, {READERS} results readers, "
+          f"{seed_events} seed events, {seconds:.0f}s per profile")
+    for profile in PROFILES:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                DB_STORAGE_PROFILE=profile,
+                DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                ROLLUP_WORKER_ENABLED="false",
+            )
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_mixed_workload", "--child", str(seconds), str(seed_events)],
+                env=env, check=True, capture_output=True, text=True
+            ).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"  {profile:<7} ingest p50 {r['p50_ms']:7.1f} ms  p99 {r['p99_ms']:7.1f} ms  "
+              f"max {r['max_ms']:7.1f} ms  {r['batches'] / seconds:6.1f} batches/s  "
+              f"{r['errors']} errors  {r['reads'] / seconds:5.1f} results/s")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        print(json.dumps(child(float(sys.argv[2]), int(sys.argv[3]))))
+    else:
+        main(*(float(a) if i == 0 else int(a) for i, a in enumerate(sys.argv[1:3])))
@@ -2,8 +2,9 @@
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from app.database import Base, get_db
+from app.database import Base, get_db, get_read_db
 from app.models import Experiment, Variant
+from app.utils.cache import assignment_cache, experiment_cache, results_cache, user_key_cache
 from fastapi.testclient import TestClient
 from app.main import app
 
@@ -19,6 +20,11 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 @pytest.fixture(scope="function")
 def db():
     """Create a fresh database for each test"""
+    # module-level caches outlive the per-test database
+    assignment_cache.clear()
+    experiment_cache.clear()
+    results_cache.clear()
+    user_key_cache.clear()
     Base.metadata.create_all(bind=engine)
     db = TestingSessionLocal()
     try:
@@ -38,6 +44,7 @@ def client(db):
             pass
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     yield TestClient(app)
     app.dependency_overrides.clear()
 
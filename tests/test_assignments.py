@@ -81,3 +81,196 @@ def test_assignment_inactive_experiment(db):
     with pytest.raises(Exception):  # Should raise HTTPException
         get_or_create_assignment(db, experiment.id, "test_user")
 
+
+
+def test_assignment_cache_hit_skips_database(db, sample_experiment):
+    """A cached assignment is returned as an immutable record without any SQL."""
+    from sqlalchemy import event
+    from tests.conftest import engine
+    from app.utils.cache import AssignmentRecord
+
+    first = get_or_create_assignment(db, sample_experiment.id, "cached_user")
+    assert isinstance(first, AssignmentRecord)
+    assert first.variant_name in {v.name for v in sample_experiment.variants}
+
+    statements = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        second = get_or_create_assignment(db, sample_experiment.id, "cached_user")
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+
+    assert statements == []
+    assert second == first
+    with pytest.raises(AttributeError):
+        second.variant_id = 0
+
+
+def test_assignment_endpoint_uses_record(client, sample_experiment):
+    headers = {"Authorization": "Bearer default-dev-token"}
+    url = f"/experiments/{sample_experiment.id}/assignment/endpoint_user"
+
+    first = client.get(url, headers=headers)
+    second = client.get(url, headers=headers)
+
+    assert first.status_code == 200
+    assert first.json() == second.json()
+    assert first.json()["variant_name"] in {v.name for v in sample_experiment.variants}
+
+
+def test_write_behind_assignment(db, sample_experiment, monkeypatch):
+    """write_behind mode answers from cached config and persists rows in the background."""
+    from app.config import settings
+    from app.services import assignment_service
+    from app.services.assignment_writer import AssignmentWriter
+    from tests.conftest import TestingSessionLocal
+
+    writer = AssignmentWriter(TestingSessionLocal, batch_size=3, flush_interval=0.01)
+    monkeypatch.setattr(settings, "assignment_write_mode", "write_behind")
+    monkeypatch.setattr(assignment_service, "assignment_writer", writer)
+    writer.start()
+    try:
+        records = [get_or_create_assignment(db, sample_experiment.id, f"wb_user_{i}") for i in range(10)]
+        db.rollback()  # release the read transaction so the writer can commit
+    finally:
+        writer.stop()
+
+    assert all(r.id is None for r in records)
+    rows = {
+        a.user_id: a.variant_id
+        for a in db.query(UserAssignment).filter(UserAssignment.experiment_id == sample_experiment.id)
+    }
+    assert rows == {r.user_id: r.variant_id for r in records}
+
+    # re-writing the same rows is a no-op thanks to the unique index
+    assert writer.write_batch(records) == 0
+
+
+def test_write_behind_batch_failures(db, sample_experiment, monkeypatch):
+    """A failing batch is retried; once it gives up, its users fall back to the synchronous insert."""
+    from app.config import settings
+    from app.services import assignment_service
+    from app.services.assignment_writer import AssignmentWriter
+    from app.utils.cache import get_assignment
+    from tests.conftest import TestingSessionLocal
+
+    class FlakyWriter(AssignmentWriter):
+        is_running = True  # no thread: batches are written by hand below
+        failures = 0
+
+        def write_batch(self, records):
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("database is locked")
+            return super().write_batch(records)
+
+    writer = FlakyWriter(TestingSessionLocal, flush_interval=0.01, max_attempts=3, retry_delay=0)
+    monkeypatch.setattr(settings, "assignment_write_mode", "write_behind")
+    monkeypatch.setattr(assignment_service, "assignment_writer", writer)
+    experiment_id = sample_experiment.id
+
+    # two failures, then the third attempt lands
+    writer.failures = 2
+    retried = [get_or_create_assignment(db, experiment_id, f"retry_user_{i}") for i in range(3)]
+    db.rollback()
+    writer._write_or_forget(writer._drain())
+    assert writer.failures == 0
+    assert db.query(UserAssignment).filter(UserAssignment.user_id.like("retry_user_%")).count() == 3
+
+    # every attempt fails: the id=None records leave the cache instead of standing in for rows
+    writer.failures = 3
+    lost = [get_or_create_assignment(db, experiment_id, f"lost_user_{i}") for i in range(3)]
+    db.rollback()
+    writer._write_or_forget(writer._drain())
+    assert all(get_assignment(experiment_id, r.user_id) is None for r in lost)
+    assert db.query(UserAssignment).filter(UserAssignment.user_id.like("lost_user_%")).count() == 0
+    assert all(get_assignment(experiment_id, r.user_id) is not None for r in retried)
+
+    monkeypatch.setattr(settings, "assignment_write_mode", "sync")
+    again = [get_or_create_assignment(db, experiment_id, r.user_id) for r in lost]
+    assert all(r.id is not None for r in again)
+    assert [r.variant_id for r in again] == [r.variant_id for r in lost]
+
+
+def test_bulk_assignment_matches_single_path(db, sample_experiment):
+    from app.services.assignment_service import get_or_create_assignments_bulk
+    from app.utils.cache import assignment_cache
+
+    existing = get_or_create_assignment(db, sample_experiment.id, "bulk_user_3")
+    user_ids = [f"bulk_user_{i}" for i in range(50)] + ["bulk_user_3"]
+
+    records = get_or_create_assignments_bulk(db, sample_experiment.id, user_ids)
+    assert [r.user_id for r in records] == [f"bulk_user_{i}" for i in range(50)]
+    assert next(r for r in records if r.user_id == "bulk_user_3") == existing
+
+    assignment_cache.clear()
+    again = get_or_create_assignments_bulk(db, sample_experiment.id, user_ids)
+    assert again == records
+
+    for r in records:
+        assignment_cache.clear()
+        assert get_or_create_assignment(db, sample_experiment.id, r.user_id) == r
+    assert db.query(UserAssignment).count() == 50
+
+
+def test_user_assignments_across_active_experiments(client, db, sample_experiment):
+    other = Experiment(name="Other Experiment", status="active")
+    paused = Experiment(name="Paused Experiment", status="paused")
+    db.add_all([other, paused])
+    db.flush()
+    db.add_all([
+        Variant(experiment_id=other.id, name="only", traffic_percentage=100.0),
+        Variant(experiment_id=paused.id, name="only", traffic_percentage=100.0),
+    ])
+    db.commit()
+
+    headers = {"Authorization": "Bearer default-dev-token"}
+    response = client.get("/users/multi_user/assignments", headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert [a["experiment_id"] for a in body] == [sample_experiment.id, other.id]
+    assert client.get("/users/multi_user/assignments", headers=headers).json() == body
+
+    response = client.post(
+        f"/experiments/{sample_experiment.id}/assignments",
+        json={"user_ids": ["multi_user", "someone_else"]},
+        headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json()[0] == body[0]
+
+    response = client.post(
+        f"/experiments/{paused.id}/assignments",
+        json={"user_ids": ["multi_user"]},
+        headers=headers
+    )
+    assert response.status_code == 400
+
+
+def test_batched_buckets_match_scalar_path():
+    """Batch hashing + allocation tables must reproduce the scalar functions exactly."""
+    from app.utils.assignment import (
+        hash_user_experiment, assign_variant, hash_user_experiment_batch,
+        build_allocation_table, assign_variants_batch
+    )
+
+    user_ids = [f"user_{i}" for i in range(3000)] + ["", "ünïcödé", "a" * 64, "550e8400-e29b-41d4-a716-446655440000"]
+    splits = [
+        [(1, 50.0), (2, 50.0)],
+        [(10, 33.3), (11, 33.3), (12, 33.4)],
+        [(5, 0.0), (6, 12.5), (7, 87.5)],
+        [(3, 99.95)],  # sums short of 100 -> falls back to the last variant
+    ]
+    for experiment_id in (1, 42, 123456):
+        assert hash_user_experiment_batch(user_ids, experiment_id) == [
+            hash_user_experiment(u, experiment_id) for u in user_ids
+        ]
+        for split in splits:
+            table = build_allocation_table(split)
+            expected = [assign_variant(hash_user_experiment(u, experiment_id), split) for u in user_ids]
+            assert assign_variants_batch(user_ids, experiment_id, table) == expected
+            assert assign_variants_batch(user_ids[:10], experiment_id, table) == expected[:10]
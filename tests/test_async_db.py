@@ -0,0 +1,167 @@
+"""Tests for the async database path (DATABASE_URL with an async driver)."""
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.database import get_db, get_read_db, is_async_url, sync_database_url
+from app.main import app
+from app.models import UserAssignment
+from app.services.assignment_service import get_or_create_assignment_async
+from app.utils.cache import assignment_cache
+
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./test.db"  # same file as the conftest engine
+HEADERS = {"Authorization": "Bearer default-dev-token"}
+
+
+def test_async_url_helpers():
+    assert is_async_url("sqlite+aiosqlite:///./x.db")
+    assert not is_async_url("sqlite:///./x.db")
+    assert sync_database_url("sqlite+aiosqlite:///./x.db") == "sqlite+pysqlite:///./x.db"
+    assert sync_database_url("postgresql+asyncpg://u:p@h/db") == "postgresql+psycopg2://u:p@h/db"
+    assert sync_database_url("sqlite:///./x.db") == "sqlite:///./x.db"
+
+
+def test_endpoints_on_async_sessions(db, sample_experiment):
+    """Routers run unchanged on AsyncSessions, with many assignment calls in flight at once."""
+    experiment_id = sample_experiment.id
+
+    async def scenario():
+        # one connection, like the split profile's writer pool: concurrent deferred
+        # transactions that read then write fail with "database is locked" otherwise
+        engine = create_async_engine(
+            ASYNC_DATABASE_URL, poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0
+        )
+        sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+        async def override_get_db():
+            async with sessions() as session:
+                yield session
+
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_read_db] = override_get_db
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                responses = await asyncio.gather(*(
+                    client.get(f"/experiments/{experiment_id}/assignment/async_user_{i % 100}", headers=HEADERS)
+                    for i in range(300)
+                ))
+                assert all(r.status_code == 200 for r in responses)
+                by_user = {}
+                for r in responses:
+                    body = r.json()
+                    assert by_user.setdefault(body["user_id"], body["variant_id"]) == body["variant_id"]
+
+                base = datetime.utcnow() + timedelta(minutes=1)
+                r = await client.post("/events", headers=HEADERS, json=[
+                    {"user_id": f"async_user_{i}", "type": "purchase",
+                     "timestamp": base.isoformat(), "experiment_id": experiment_id}
+                    for i in range(0, 100, 4)
+                ])
+                assert r.status_code == 201
+
+                # ORM response built inside the session call (no lazy load on an AsyncSession)
+                r = await client.post("/experiments", headers=HEADERS, json={
+                    "name": "Async created",
+                    "variants": [{"name": "a", "traffic_percentage": 50}, {"name": "b", "traffic_percentage": 50}]
+                })
+                assert r.status_code == 201 and len(r.json()["variants"]) == 2
+
+                # sample=... filters on the stored sample_bucket
+                r = await client.get(
+                    f"/experiments/{experiment_id}/results",
+                    params={"primary_event_type": "purchase", "sample": 0.5}, headers=HEADERS
+                )
+                assert r.status_code == 200
+                r = await client.get(
+                    f"/experiments/{experiment_id}/results", params={"primary_event_type": "purchase"}, headers=HEADERS
+                )
+                assert r.status_code == 200
+                assert r.json()["summary"]["total_assigned"] == 100
+                assert sum(v["primary_unique_users"] for v in r.json()["variants"]) == 25
+
+            # cache hits never open a session connection
+            assignment_cache.clear()
+            async with sessions() as session:
+                first = await get_or_create_assignment_async(session, experiment_id, "async_user_0")
+            unused = AsyncSession(engine)
+            again = await get_or_create_assignment_async(unused, experiment_id, "async_user_0")
+            assert again is first and not unused.in_transaction()
+        finally:
+            app.dependency_overrides.clear()
+            await engine.dispose()
+
+    asyncio.run(scenario())
+    assert db.query(UserAssignment).filter(UserAssignment.experiment_id == experiment_id).count() == 100
+
+
+def test_bootstrap_and_results_jobs_leave_the_event_loop(db, sample_experiment, monkeypatch):
+    """The results computation (bootstrap included) and job submission run in the threadpool, not on the event loop."""
+    from app.routers import results as results_router
+    from app.services import results_service
+    from app.services.bootstrap_service import BootstrapPool
+    from app.services.event_service import create_events_batch
+    from app.schemas import EventCreate
+    from app.services.assignment_service import get_or_create_assignments_bulk
+
+    experiment_id = sample_experiment.id
+    records = get_or_create_assignments_bulk(db, experiment_id, [f"boot_user_{i}" for i in range(40)])
+    ts = max(r.assigned_at for r in records) + timedelta(minutes=1)
+    create_events_batch(db, [
+        EventCreate(user_id=r.user_id, type="purchase", timestamp=ts, experiment_id=experiment_id) for r in records[::3]
+    ])
+
+    loop_threads = set()
+    calls = {}
+
+    class RecordingPool(BootstrapPool):
+        def resample_means(self, *args):
+            calls["bootstrap"] = threading.get_ident()
+            return super().resample_means(*args)
+
+    class RecordingJobs:
+        def submit(self, experiment_id, params):
+            calls["submit"] = threading.get_ident()
+            raise results_router.HTTPException(status_code=429, detail="recorded")
+
+    def recording_results(db, *args, **kwargs):
+        calls["results"] = threading.get_ident()
+        assert isinstance(db, Session)  # a blocking session, not the request's AsyncSession
+        return results_service.get_experiment_results(db, *args, **kwargs)
+
+    monkeypatch.setattr(results_service, "bootstrap_pool", RecordingPool(max_workers=0))
+    monkeypatch.setattr(results_router, "get_experiment_results", recording_results)
+    monkeypatch.setattr(results_router, "results_jobs", RecordingJobs())
+
+    async def scenario():
+        loop_threads.add(threading.get_ident())
+        engine = create_async_engine(ASYNC_DATABASE_URL)
+        sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+        async def override_get_db():
+            async with sessions() as session:
+                yield session
+
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_read_db] = override_get_db
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                params = {"primary_event_type": "purchase", "ci_method": "bootstrap", "seed": 7}
+                r = await client.get(f"/experiments/{experiment_id}/results", params=params, headers=HEADERS)
+                assert r.status_code == 200, r.text
+                assert r.json()["summary"]["bootstrap"]["seed"] == 7
+                r = await client.post(f"/experiments/{experiment_id}/results/jobs", params=params, headers=HEADERS)
+                assert r.status_code == 429
+        finally:
+            app.dependency_overrides.clear()
+            await engine.dispose()
+
+    asyncio.run(scenario())
+    assert set(calls) == {"results", "bootstrap", "submit"}
+    assert not loop_threads & set(calls.values())
@@ -0,0 +1,156 @@
+"""Tests for engine setup: SQLite pragmas, read-only engines, the FIFO writer pool."""
+import threading
+import time
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.config import settings
+from app.database import Base, FifoQueuePool, make_engine, sqlite_pragmas, upgrade_schema
+
+
+def test_split_profile_pragmas(monkeypatch):
+    monkeypatch.setattr(settings, "db_storage_profile", "split")
+    monkeypatch.setattr(settings, "sqlite_cache_size", "-65536")
+
+    writer = sqlite_pragmas()
+    assert writer["journal_mode"] == "WAL" and writer["synchronous"] == "NORMAL"
+    assert writer["busy_timeout"] == "5000" and writer["cache_size"] == "-65536"
+    assert "query_only" not in writer
+
+    reader = sqlite_pragmas(read_only=True)
+    assert reader["query_only"] == "ON" and "journal_mode" not in reader
+
+    monkeypatch.setattr(settings, "db_storage_profile", "shared")
+    assert sqlite_pragmas() == {"cache_size": "-65536"}
+
+    monkeypatch.setattr(settings, "sqlite_synchronous", "sometimes")
+    with pytest.raises(ValueError):
+        sqlite_pragmas()
+    monkeypatch.setattr(settings, "sqlite_synchronous", "")
+    monkeypatch.setattr(settings, "sqlite_mmap_size", "1; DROP TABLE events")
+    with pytest.raises(ValueError):
+        sqlite_pragmas()
+
+
+def test_read_only_engine_rejects_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "db_storage_profile", "split")
+    url = f"sqlite:///{tmp_path / 'split.db'}"
+    writer = make_engine(url)
+    reader = make_engine(url, read_only=True)
+    try:
+        with writer.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+
+        with reader.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 1
+            with pytest.raises(OperationalError):
+                conn.execute(text("INSERT INTO t VALUES (2)"))
+    finally:
+        writer.dispose()
+        reader.dispose()
+
+
+def test_fifo_pool_hands_connection_to_oldest_waiter(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'fifo.db'}", poolclass=FifoQueuePool, pool_size=1, max_overflow=0)
+    order = []
+
+    def wait_turn(n):
+        with engine.connect():
+            order.append(n)
+
+    try:
+        held = engine.connect()
+        threads = []
+        for n in range(5):
+            threads.append(threading.Thread(target=wait_turn, args=(n,)))
+            threads[-1].start()
+            time.sleep(0.05)  # queue up in a known order
+        held.close()
+        for t in threads:
+            t.join()
+        assert order == list(range(5))
+    finally:
+        engine.dispose()
+
+
+def test_upgrade_schema_backfills_user_keys_on_an_old_database(tmp_path):
+    """Tables from before the users dictionary get user_key, sample_bucket, summaries and the new indexes."""
+    from sqlalchemy import inspect
+    from sqlalchemy.orm import sessionmaker
+    from app.services.assignment_service import get_or_create_assignment
+    from app.services.results_service import get_experiment_results
+    from app.utils.assignment import hash_user_sample
+    from app.utils.cache import assignment_cache, experiment_cache
+
+    engine = make_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        # user_assignments / events as an older version created them: keyed on user_id
+        conn.execute(text("""
+            CREATE TABLE user_assignments (
+                id INTEGER PRIMARY KEY, experiment_id INTEGER NOT NULL, user_id VARCHAR NOT NULL,
+                variant_id INTEGER NOT NULL, assigned_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL)
+        """))
+        conn.execute(text("CREATE UNIQUE INDEX idx_assignments_experiment_user ON user_assignments (experiment_id, user_id)"))
+        conn.execute(text("CREATE INDEX ix_user_assignments_user_id ON user_assignments (user_id)"))
+        conn.execute(text("""
+            CREATE TABLE events (
+                id INTEGER PRIMARY KEY, user_id VARCHAR NOT NULL, event_type VARCHAR NOT NULL,
+                timestamp DATETIME NOT NULL, properties TEXT, experiment_id INTEGER)
+        """))
+        conn.execute(text("CREATE INDEX idx_events_user_timestamp ON events (user_id, timestamp)"))
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO experiments (id, name, status) VALUES (1, 'old', 'active')"))
+        conn.execute(text("INSERT INTO variants (id, experiment_id, name, traffic_percentage) VALUES (1, 1, 'a', 100)"))
+        conn.execute(text("""
+            INSERT INTO user_assignments (experiment_id, user_id, variant_id, assigned_at)
+            VALUES (1, 'u1', 1, '2024-01-01 00:00:00'), (1, 'u2', 1, '2024-01-01 00:00:00')
+        """))
+        conn.execute(text("""
+            INSERT INTO events (user_id, event_type, timestamp, experiment_id)
+            VALUES ('u1', 'purchase', '2024-01-01 01:00:00', 1), ('u3', 'view', '2024-01-01 01:00:00', 1)
+        """))
+
+    for _ in range(2):  # the second run finds nothing to do
+        with engine.begin() as conn:
+            upgrade_schema(conn, Base.metadata.sorted_tables)
+
+    with engine.connect() as conn:
+        keys = dict(conn.execute(text("SELECT external_id, id FROM users")).all())
+        assert sorted(keys) == ["u1", "u2", "u3"]
+        assert conn.execute(text("SELECT user_id, user_key, sample_bucket FROM user_assignments")).all() == [
+            ("u1", keys["u1"], hash_user_sample("u1")), ("u2", keys["u2"], hash_user_sample("u2"))
+        ]
+        assert conn.execute(text("SELECT user_id, user_key FROM events ORDER BY id")).all() == [
+            ("u1", keys["u1"]), ("u3", keys["u3"])
+        ]
+        # u3 has no assignment, so only u1's purchase is summarised
+        assert conn.execute(text("SELECT user_id, variant_id, event_count FROM user_experiment_summaries")).all() == [
+            ("u1", 1, 1)
+        ]
+        assert conn.execute(text("SELECT user_id, event_type, event_count FROM user_event_type_summaries")).all() == [
+            ("u1", "purchase", 1)
+        ]
+    indexes = {i["name"]: i["column_names"] for i in inspect(engine).get_indexes("user_assignments")}
+    assert indexes["idx_assignments_experiment_user"] == ["experiment_id", "user_key"]
+    assert "ix_user_assignments_user_id" not in indexes
+    assert "idx_events_user_timestamp" not in {i["name"] for i in inspect(engine).get_indexes("events")}
+
+    # experiment 1 may be cached from the shared test database
+    assignment_cache.clear()
+    experiment_cache.clear()
+    db = sessionmaker(bind=engine)()
+    try:
+        assert get_or_create_assignment(db, 1, "u1").id == 1
+        assert get_or_create_assignment(db, 1, "u4").user_id == "u4"
+        results = get_experiment_results(db, 1, primary_event_type="purchase")
+        variant = results.variants[0]
+        assert variant.assigned_count == 3 and variant.events_by_type == {"purchase": 1}
+        assert variant.unique_users_with_events == 1 and variant.primary_unique_users == 1
+    finally:
+        db.close()
+        engine.dispose()
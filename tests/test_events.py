@@ -60,3 +60,218 @@ def test_create_events_batch(db):
     db_events = db.query(Event).filter(Event.user_id.like("user_%")).all()
     assert len(db_events) >= 5
 
+
+
+def test_create_events_batch_bulk_insert(db):
+    """Large batches are chunked, ids come back in order, and nothing is re-selected per row."""
+    from sqlalchemy import event as sa_event
+    from tests.conftest import engine
+    from app.services import event_service
+
+    events_data = [
+        EventCreate(
+            user_id=f"bulk_{i}",
+            type="view" if i % 2 else "click",
+            timestamp=datetime(2024, 1, 15, 10, 0, 0),
+            properties={"i": i} if i % 3 else None
+        )
+        for i in range(2 * event_service.EVENT_INSERT_CHUNK_SIZE + 7)
+    ]
+
+    statements = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sa_event.listen(engine, "before_cursor_execute", _count)
+    try:
+        events = create_events_batch(db, events_data)
+    finally:
+        sa_event.remove(engine, "before_cursor_execute", _count)
+
+    assert len(events) == len(events_data)
+    assert len(statements) < 20  # a handful per chunk, not one per event
+
+    stored = {e.id: e for e in db.query(Event).all()}
+    for data, created in zip(events_data, events):
+        row = stored[created.id]
+        assert row.user_id == data.user_id == created.user_id
+        assert row.event_type == data.type == created.event_type
+        assert row.properties == created.properties
+
+
+def test_async_ingest_endpoint_queues_and_group_commits(client, db, monkeypatch):
+    from app.routers import events as events_router
+    from app.services.ingest_queue import EventIngestQueue
+    from tests.conftest import TestingSessionLocal
+
+    headers = {"Authorization": "Bearer default-dev-token"}
+    payload = [
+        {"user_id": f"async_{i}", "type": "click", "timestamp": "2024-01-15T10:35:00"}
+        for i in range(5)
+    ]
+
+    ingest = EventIngestQueue(TestingSessionLocal, max_events=6, batch_size=100, flush_interval=0.01)
+    monkeypatch.setattr(events_router, "event_ingest_queue", ingest)
+
+    # not started -> async mode is rejected rather than silently dropping events
+    assert client.post("/events?mode=async", json=payload, headers=headers).status_code == 400
+
+    ingest.start()
+    try:
+        response = client.post("/events?mode=async", json=payload, headers=headers)
+        assert response.status_code == 202
+        assert response.json() == {"accepted": 5}
+    finally:
+        ingest.stop()
+    assert ingest.written == 5
+    assert db.query(Event).filter(Event.user_id.like("async_%")).count() == 5
+
+
+def test_async_ingest_backpressure_and_flush_on_stop(client, db, monkeypatch):
+    from app.routers import events as events_router
+    from app.services.ingest_queue import EventIngestQueue
+    from tests.conftest import TestingSessionLocal
+
+    headers = {"Authorization": "Bearer default-dev-token"}
+    # long flush interval: queued events sit until stop()
+    ingest = EventIngestQueue(TestingSessionLocal, max_events=6, batch_size=100, flush_interval=30)
+    monkeypatch.setattr(events_router, "event_ingest_queue", ingest)
+    ingest.start()
+    try:
+        first = [{"user_id": f"bp_{i}", "type": "click", "timestamp": "2024-01-15T10:35:00"} for i in range(4)]
+        assert client.post("/events?mode=async", json=first, headers=headers).status_code == 202
+
+        # a request that doesn't fit is refused as a whole
+        second = [{"user_id": f"bp_x_{i}", "type": "click", "timestamp": "2024-01-15T10:35:00"} for i in range(3)]
+        response = client.post("/events?mode=async", json=second, headers=headers)
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+        assert ingest.pending == 4
+
+        # bigger than the whole queue: retrying can't help, so not a 429
+        too_big = [{"user_id": f"bp_y_{i}", "type": "click", "timestamp": "2024-01-15T10:35:00"} for i in range(7)]
+        response = client.post("/events?mode=async", json=too_big, headers=headers)
+        assert response.status_code == 413
+        assert "Retry-After" not in response.headers
+        assert ingest.pending == 4
+    finally:
+        ingest.stop()
+
+    assert ingest.pending == 0
+    assert db.query(Event).filter(Event.user_id.like("bp_%")).count() == 4
+
+
+def test_async_ingest_failed_group_keeps_the_good_rows(db, monkeypatch):
+    from app.schemas import EventCreate
+    from app.services import ingest_queue
+    from app.services.ingest_queue import EventIngestQueue
+    from tests.conftest import TestingSessionLocal
+
+    def create_events_batch(session, events):
+        if any(e.user_id == "bad" for e in events):
+            raise ValueError("unwritable row")
+        return real_create_events_batch(session, events)
+
+    real_create_events_batch = ingest_queue.create_events_batch
+    monkeypatch.setattr(ingest_queue, "create_events_batch", create_events_batch)
+    ingest = EventIngestQueue(TestingSessionLocal, batch_size=100)
+    user_ids = [f"group_{i}" for i in range(6)] + ["bad"] + [f"group_{i}" for i in range(6, 10)]
+    assert ingest.offer([
+        EventCreate(user_id=u, type="click", timestamp="2024-01-15T10:35:00") for u in user_ids
+    ])
+    ingest.flush()
+
+    assert (ingest.written, ingest.failed) == (10, 1)
+    assert db.query(Event).filter(Event.user_id.like("group_%")).count() == 10
+    assert db.query(Event).filter(Event.user_id == "bad").count() == 0
+
+
+def test_ndjson_ingest_streams_chunks_and_reports_bad_lines(client, db, monkeypatch):
+    import json
+    from app.config import settings
+    from app.routers import events as events_router
+
+    monkeypatch.setattr(settings, "ndjson_chunk_size", 3)
+    monkeypatch.setattr(settings, "ndjson_max_line_bytes", 200)
+    batches = []
+    real_batch = events_router.create_events_batch
+    monkeypatch.setattr(
+        events_router, "create_events_batch",
+        lambda db, events: batches.append(len(events)) or real_batch(db, events)
+    )
+
+    good = [
+        json.dumps({"user_id": f"nd_{i}", "type": "click", "timestamp": "2024-01-15T10:35:00"})
+        for i in range(7)
+    ]
+    lines = good[:2] + ["{not json"] + good[2:5] + [
+        json.dumps({"user_id": "nd_missing_type", "timestamp": "2024-01-15T10:35:00"}),
+        "",
+        json.dumps({"user_id": "x" * 300, "type": "click", "timestamp": "2024-01-15T10:35:00"}),
+    ] + good[5:]
+
+    def body():
+        # split mid-line to exercise the incremental reader
+        data = ("\n".join(lines)).encode()
+        for i in range(0, len(data), 37):
+            yield data[i:i + 37]
+
+    response = client.post(
+        "/events/ndjson",
+        content=body(),
+        headers={"Authorization": "Bearer default-dev-token", "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["accepted"] == 7
+    assert data["rejected"] == 3
+    assert [e["line"] for e in data["errors"]] == [3, 7, 9]
+    assert "type" in data["errors"][1]["error"]
+    assert "exceeds" in data["errors"][2]["error"]
+    assert data["errors_truncated"] is False
+
+    assert batches == [3, 3, 1]
+    assert db.query(Event).filter(Event.user_id.like("nd_%")).count() == 7
+
+
+def test_ndjson_ingest_requires_ndjson_content_type(client):
+    response = client.post(
+        "/events/ndjson",
+        content=b'{"user_id": "u", "type": "click", "timestamp": "2024-01-15T10:35:00"}\n',
+        headers={"Authorization": "Bearer default-dev-token", "Content-Type": "application/json"}
+    )
+    assert response.status_code == 415
+
+
+def test_ndjson_ingest_reports_lines_of_a_failed_chunk(client, db, monkeypatch):
+    import json
+    from sqlalchemy.exc import OperationalError
+    from app.config import settings
+    from app.routers import events as events_router
+
+    monkeypatch.setattr(settings, "ndjson_chunk_size", 2)
+    real_batch = events_router.create_events_batch
+
+    def flaky_batch(db, events):
+        if any(e.user_id == "nf_2" for e in events):
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return real_batch(db, events)
+
+    monkeypatch.setattr(events_router, "create_events_batch", flaky_batch)
+    lines = [
+        json.dumps({"user_id": f"nf_{i}", "type": "click", "timestamp": "2024-01-15T10:35:00"})
+        for i in range(5)
+    ]
+    response = client.post(
+        "/events/ndjson",
+        content="\n".join(lines).encode(),
+        headers={"Authorization": "Bearer default-dev-token", "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    # lines 3-4 were one chunk; the chunks before and after it were stored
+    assert data["accepted"] == 3 and data["rejected"] == 2
+    assert [e["line"] for e in data["errors"]] == [3, 4]
+    assert "not stored" in data["errors"][0]["error"]
+    assert sorted(u for (u,) in db.query(Event.user_id)) == ["nf_0", "nf_1", "nf_4"]
@@ -251,11 +251,11 @@ def test_results_timeseries_group_by_day(db, sample_experiment):
     a2 = get_or_create_assignment(db, experiment_id, "ts_user_2")
 
     # Put one assignment "yesterday"
-    yesterday = a1.assigned_at - timedelta(days=1)
-    a1.assigned_at = yesterday
-    db.add(a1)
+    row = db.query(UserAssignment).filter(UserAssignment.id == a1.id).one()
+    row.assigned_at = a1.assigned_at - timedelta(days=1)
     db.commit()
-    db.refresh(a1)
+    db.refresh(row)
+    a1 = row
 
     # Events after assignment so they count
     create_event(db, EventCreate(
@@ -277,6 +277,45 @@ def test_results_timeseries_group_by_day(db, sample_experiment):
     assert results.timeseries[0]["group_by"] == "day"
 
 
+@pytest.mark.parametrize("use_rollups", [False, True])
+def test_results_timeseries_week_and_cumulative(db, sample_experiment, monkeypatch, use_rollups):
+    """Weekly buckets start on Monday; cumulative mode counts each converter once."""
+    from app.config import settings
+    monkeypatch.setattr(settings, "results_use_rollups", use_rollups)
+
+    experiment_id = sample_experiment.id
+    v0 = sample_experiment.variants[0].id
+    # 2024-01-01 is a Monday
+    db.add(UserAssignment(experiment_id=experiment_id, user_id="wk_1", variant_id=v0,
+                          assigned_at=datetime(2024, 1, 1, 9)))
+    db.add(UserAssignment(experiment_id=experiment_id, user_id="wk_2", variant_id=v0,
+                          assigned_at=datetime(2024, 1, 9, 9)))
+    db.commit()
+    for user_id, ts in [("wk_1", datetime(2024, 1, 7, 23)), ("wk_1", datetime(2024, 1, 10, 12)),
+                        ("wk_2", datetime(2024, 1, 14, 12))]:
+        create_event(db, EventCreate(user_id=user_id, type="purchase", timestamp=ts, experiment_id=experiment_id))
+
+    def variant_rows(results):
+        return [
+            (row["bucket"], *(next((v["assigned"], v["events"], v["conversions"])
+                                   for v in row["variants"] if v["variant_id"] == v0)))
+            for row in results.timeseries
+        ]
+
+    weekly = get_experiment_results(db, experiment_id, group_by="week", primary_event_type="purchase")
+    assert variant_rows(weekly) == [
+        ("2024-01-01T00:00:00", 1, 1, 1),
+        ("2024-01-08T00:00:00", 1, 2, 2),
+    ]
+
+    running = get_experiment_results(db, experiment_id, group_by="week", primary_event_type="purchase", cumulative=True)
+    assert variant_rows(running) == [
+        ("2024-01-01T00:00:00", 1, 1, 1),
+        ("2024-01-08T00:00:00", 2, 3, 2),
+    ]
+    assert running.timeseries[-1]["cumulative"] is True
+
+
 def test_results_srm_flagged(db, sample_experiment):
     """SRM should be flagged if observed assignments are wildly off expected split."""
     from app.models import UserAssignment
@@ -296,3 +335,388 @@ def test_results_srm_flagged(db, sample_experiment):
     assert results.srm is not None
     assert results.srm["flagged"] is True
 
+
+
+def test_results_aggregates_repeat_events_per_user(db, sample_experiment):
+    """Multiple events from one user count as events, but only once as a unique user."""
+    experiment_id = sample_experiment.id
+
+    assignment = get_or_create_assignment(db, experiment_id, "agg_user")
+    for minutes, event_type in [(1, "click"), (2, "click"), (3, "purchase")]:
+        create_event(db, EventCreate(
+            user_id="agg_user",
+            type=event_type,
+            timestamp=assignment.assigned_at + timedelta(minutes=minutes),
+            experiment_id=experiment_id
+        ))
+
+    results = get_experiment_results(db, experiment_id, primary_event_type="purchase")
+    vm = next(v for v in results.variants if v.variant_id == assignment.variant_id)
+
+    assert vm.event_count == 3
+    assert vm.events_by_type == {"click": 2, "purchase": 1}
+    assert vm.unique_users_with_events == 1
+    assert vm.primary_event_count == 1
+    assert vm.primary_unique_users == 1
+    assert results.summary["total_events"] == 3
+
+    filtered = get_experiment_results(db, experiment_id, event_type="click", primary_event_type="purchase")
+    vm = next(v for v in filtered.variants if v.variant_id == assignment.variant_id)
+    assert vm.events_by_type == {"click": 2}
+    assert vm.primary_event_count == 0
+
+
+def test_results_endpoint_cache_and_etag(client, db, sample_experiment, monkeypatch):
+    """Repeat polls are served from cache / 304 until new data moves the watermark."""
+    from app.routers import results as results_router
+
+    experiment_id = sample_experiment.id
+    headers = {"Authorization": "Bearer default-dev-token"}
+    calls = []
+    real_compute = results_router.get_experiment_results
+    monkeypatch.setattr(
+        results_router, "get_experiment_results",
+        lambda db, experiment_id, **kwargs: calls.append(kwargs) or real_compute(db, experiment_id, **kwargs)
+    )
+
+    # keep the event in the baseline variant (a non-empty treatment over an
+    # empty baseline gives an infinite lift)
+    baseline_id = sample_experiment.variants[0].id
+    assignment = next(
+        a for a in (get_or_create_assignment(db, experiment_id, f"etag_user_{i}") for i in range(50))
+        if a.variant_id == baseline_id
+    )
+    url = f"/experiments/{experiment_id}/results?primary_event_type=purchase"
+
+    first = client.get(url, headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert len(calls) == 1
+
+    # same data: cache hit, then a conditional request gets 304 with no body
+    assert client.get(url, headers=headers).json() == first.json()
+    not_modified = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert len(calls) == 1
+
+    # different params are a different entry
+    client.get(url + "&event_type=purchase", headers=headers)
+    assert len(calls) == 2
+
+    # a new event moves the watermark
+    create_event(db, EventCreate(
+        user_id=assignment.user_id,
+        type="purchase",
+        timestamp=assignment.assigned_at + timedelta(minutes=1),
+        experiment_id=experiment_id
+    ))
+    fresh = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["ETag"] != etag
+    assert fresh.json()["summary"]["total_events"] == 1
+    assert len(calls) == 3
+
+
+def test_results_memory_flat_with_million_assignments(db, sample_experiment, monkeypatch):
+    """Assigned totals and timeseries buckets are grouped in SQL, never loaded as rows."""
+    import tracemalloc
+    from sqlalchemy import text
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "results_use_rollups", False)
+    experiment_id = sample_experiment.id
+    v0, v1 = (v.id for v in sample_experiment.variants)
+    n = 1_000_000
+
+    # generated in SQLite itself so the fixture doesn't cost Python memory either
+    db.execute(text("""
+        WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i < :last)
+        INSERT INTO users (id, external_id) SELECT i + 1, 'mem_' || i FROM seq
+    """), {"last": n - 1})
+    db.execute(text("""
+        WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i < :last)
+        INSERT INTO user_assignments (experiment_id, user_id, user_key, variant_id, assigned_at, sample_bucket)
+        SELECT :exp, 'mem_' || i, i + 1, CASE i % 2 WHEN 0 THEN :v0 ELSE :v1 END,
+               datetime('2024-01-01', '+' || (i % 72) || ' hours'), i % 10000
+        FROM seq
+    """), {"last": n - 1, "exp": experiment_id, "v0": v0, "v1": v1})
+    db.commit()
+
+    tracemalloc.start()
+    try:
+        results = get_experiment_results(db, experiment_id, group_by="day")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert results.summary["total_assigned"] == n
+    assert [row["bucket"] for row in results.timeseries] == [
+        "2024-01-01T00:00:00", "2024-01-02T00:00:00", "2024-01-03T00:00:00"
+    ]
+    assert sum(v["assigned"] for row in results.timeseries for v in row["variants"]) == n
+    # a million ORM rows would be hundreds of MB; grouped rows are a few KB
+    assert peak < 5 * 1024 * 1024
+
+
+def test_results_hash_sampled_preview(db, sample_experiment):
+    """sample=<rate> computes over a stable hash-selected subset and scales the counts."""
+    from app.services.event_service import create_events_batch
+    from app.utils.assignment import hash_user_sample
+
+    experiment_id = sample_experiment.id
+    v0, v1 = (v.id for v in sample_experiment.variants)
+    base = datetime(2024, 1, 15, 10, 0, 0)
+    users = [f"sample_user_{i}" for i in range(2000)]
+    for i, user_id in enumerate(users):
+        db.add(UserAssignment(experiment_id=experiment_id, user_id=user_id,
+                              variant_id=v0 if i % 2 else v1, assigned_at=base))
+    db.commit()
+    create_events_batch(db, [
+        EventCreate(user_id=user_id, type="purchase", timestamp=base + timedelta(minutes=1),
+                    experiment_id=experiment_id)
+        for user_id in users[::3]
+    ])
+
+    sampled = {u for u in users if hash_user_sample(u) < 2500}
+    results = get_experiment_results(db, experiment_id, primary_event_type="purchase", sample=0.25)
+    again = get_experiment_results(db, experiment_id, primary_event_type="purchase", sample=0.25)
+
+    assert results.summary["sample"]["rate"] == 0.25
+    assert results.summary["sample"]["sampled_assigned"] == len(sampled)
+    assert results.summary["sample"]["sampled_events"] == len(sampled & set(users[::3]))
+    assert results.summary["total_assigned"] == len(sampled) * 4
+    assert [v.model_dump() for v in results.variants] == [v.model_dump() for v in again.variants]
+
+    # significance is computed on the sampled users, not the scaled counts
+    comp = results.comparisons[0]
+    assert comp["baseline_assigned"] + comp["treatment_assigned"] == len(sampled)
+
+    full = get_experiment_results(db, experiment_id, primary_event_type="purchase")
+    assert "sample" not in full.summary
+    assert abs(results.summary["total_events"] - full.summary["total_events"]) / full.summary["total_events"] < 0.2
+
+
+def test_sampled_queries_range_scan_the_stored_bucket(db, sample_experiment):
+    """sample=<rate> reads only the sampled users' rows, via idx_assignments_experiment_sample."""
+    from sqlalchemy import func
+    from app.services.aggregation_service import joined_events_query, sample_criteria
+    from app.services.assignment_service import get_or_create_assignments_bulk
+    from app.services.event_service import create_events_batch
+    from app.utils.assignment import hash_user_sample
+
+    experiment_id = sample_experiment.id
+    users = [f"plan_user_{i}" for i in range(2000)]
+    records = get_or_create_assignments_bulk(db, experiment_id, users)
+    ts = max(r.assigned_at for r in records) + timedelta(minutes=1)
+    create_events_batch(db, [
+        EventCreate(user_id=u, type="purchase", timestamp=ts, experiment_id=experiment_id) for u in users
+    ])
+
+    def plan_and_steps(criteria):
+        queries = [
+            db.query(UserAssignment.variant_id, func.count(UserAssignment.id)).filter(
+                UserAssignment.experiment_id == experiment_id, *criteria
+            ).group_by(UserAssignment.variant_id),
+            joined_events_query(
+                db, experiment_id, UserAssignment.variant_id, func.count(Event.id), criteria=criteria
+            ).group_by(UserAssignment.variant_id),
+        ]
+        plans = []
+        for query in queries:
+            compiled = query.statement.compile(db.get_bind())
+            plans.append(" | ".join(row[3] for row in db.connection().exec_driver_sql(
+                "EXPLAIN QUERY PLAN " + str(compiled), tuple(compiled.params[k] for k in compiled.positiontup)
+            )))
+            query.all()  # warm up: statement preparation and schema loading aren't counted
+        # SQLite VM steps (in hundreds) while the queries run: a proxy for rows read
+        steps = [0]
+        raw = db.connection().connection.dbapi_connection
+        raw.set_progress_handler(lambda: steps.__setitem__(0, steps[0] + 1), 100)
+        try:
+            for query in queries:
+                query.all()
+        finally:
+            raw.set_progress_handler(None, 0)
+        return plans, steps[0]
+
+    plans, sampled_steps = plan_and_steps(sample_criteria(0.05))
+    for plan in plans:
+        assert "idx_assignments_experiment_sample (experiment_id=? AND sample_bucket<?)" in plan
+    # sampled users drive the join, one index seek per user into events
+    assert plans[1].index("user_assignments") < plans[1].index(
+        "idx_events_user_experiment_timestamp (user_key=? AND experiment_id=? AND timestamp>?)"
+    )
+
+    _, full_steps = plan_and_steps([])
+    assert sampled_steps * 4 < full_steps
+    assert all(a.sample_bucket == hash_user_sample(a.user_id) for a in db.query(UserAssignment))
+
+
+def test_results_jobs_run_in_process_pool(client, db, sample_experiment, monkeypatch):
+    """POST .../results/jobs returns a job id; polling it yields the same results as the sync call."""
+    import time
+    from app.routers import results as results_router
+    from app.services.results_jobs import ResultsJobManager
+    from tests.conftest import SQLALCHEMY_DATABASE_URL
+
+    experiment_id = sample_experiment.id
+    headers = {"Authorization": "Bearer default-dev-token"}
+    assignment = get_or_create_assignment(db, experiment_id, "job_user")
+    create_event(db, EventCreate(
+        user_id="job_user", type="purchase",
+        timestamp=assignment.assigned_at + timedelta(minutes=1), experiment_id=experiment_id
+    ))
+
+    jobs = ResultsJobManager(database_url=SQLALCHEMY_DATABASE_URL, max_workers=1)
+    monkeypatch.setattr(results_router, "results_jobs", jobs)
+    try:
+        url = f"/experiments/{experiment_id}/results/jobs?primary_event_type=purchase"
+        submitted = client.post(url, headers=headers)
+        assert submitted.status_code == 202
+        job_id = submitted.json()["job_id"]
+        assert submitted.json()["status"] in ("queued", "running")
+
+        deadline = time.time() + 60
+        while True:
+            polled = client.get(f"/experiments/{experiment_id}/results/jobs/{job_id}", headers=headers).json()
+            if polled["status"] in ("succeeded", "failed") or time.time() > deadline:
+                break
+            time.sleep(0.1)
+
+        assert polled["status"] == "succeeded"
+        sync = client.get(f"/experiments/{experiment_id}/results?primary_event_type=purchase", headers=headers).json()
+        assert polled["results"]["variants"] == sync["variants"]
+        assert polled["results"]["summary"] == sync["summary"]
+
+        assert client.get(f"/experiments/{experiment_id}/results/jobs/nope", headers=headers).status_code == 404
+        assert client.post("/experiments/9999/results/jobs", headers=headers).status_code == 404
+    finally:
+        jobs.shutdown()
+
+    # pending limit reached -> 429 instead of an unbounded queue
+    monkeypatch.setattr(results_router, "results_jobs", ResultsJobManager(max_pending=0))
+    assert client.post(url, headers=headers).status_code == 429
+
+
+def test_results_pairwise_comparisons(db):
+    """pairwise=true compares every variant pair; comparisons stay baseline vs others."""
+    from app.models import Experiment, Variant
+
+    experiment = Experiment(name="Three way", status="active")
+    db.add(experiment)
+    db.flush()
+    variants = [Variant(experiment_id=experiment.id, name=f"v{i}", traffic_percentage=100 / 3) for i in range(3)]
+    db.add_all(variants)
+    db.commit()
+    for v in variants:
+        for i in range(10):
+            db.add(UserAssignment(experiment_id=experiment.id, user_id=f"pw_{v.id}_{i}", variant_id=v.id))
+    db.commit()
+
+    results = get_experiment_results(db, experiment.id, pairwise=True)
+    assert len(results.comparisons) == 2
+    assert [(c["baseline"], c["treatment"]) for c in results.pairwise_comparisons] == [
+        ("v0", "v1"), ("v0", "v2"), ("v1", "v2")
+    ]
+    assert results.srm["flagged"] is False
+    assert get_experiment_results(db, experiment.id).pairwise_comparisons is None
+
+
+def test_results_bootstrap_ci(db):
+    """ci_method=bootstrap replaces the normal CI with percentile intervals, reproducible by seed."""
+    from fastapi import HTTPException
+    from app.models import Experiment, Variant
+    from app.services.event_service import create_events_batch
+
+    experiment = Experiment(name="Bootstrap", status="active")
+    db.add(experiment)
+    db.flush()
+    variants = [Variant(experiment_id=experiment.id, name=f"v{i}", traffic_percentage=50) for i in range(2)]
+    db.add_all(variants)
+    db.commit()
+    base = datetime(2024, 1, 15, 10, 0, 0)
+    converting = []
+    for v, n_converting in zip(variants, (10, 20)):
+        for i in range(100):
+            user_id = f"bs_{v.id}_{i}"
+            db.add(UserAssignment(experiment_id=experiment.id, user_id=user_id, variant_id=v.id, assigned_at=base))
+            if i < n_converting:
+                converting.append(user_id)
+    db.commit()
+    create_events_batch(db, [
+        EventCreate(user_id=user_id, type="purchase", timestamp=base + timedelta(minutes=1),
+                    experiment_id=experiment.id)
+        for user_id in converting
+    ])
+
+    first = get_experiment_results(db, experiment.id, ci_method="bootstrap", bootstrap_resamples=1000, seed=7)
+    again = get_experiment_results(db, experiment.id, ci_method="bootstrap", bootstrap_resamples=1000, seed=7)
+    row = first.comparisons[0]
+    assert row["ci_method"] == "bootstrap"
+    assert row == again.comparisons[0]
+    assert first.summary["bootstrap"] == {"method": "percentile", "resamples": 1000, "seed": 7}
+    assert row["conversion_rate_diff_ci_95"]["diff_low"] < 0.1 < row["conversion_rate_diff_ci_95"]["diff_high"]
+    assert row["lift_ci_95"]["low"] < 100.0 < row["lift_ci_95"]["high"]
+
+    normal = get_experiment_results(db, experiment.id)
+    assert "lift_ci_95" not in normal.comparisons[0]
+    with pytest.raises(HTTPException) as exc:
+        get_experiment_results(db, experiment.id, ci_method="bootstrap", bootstrap_resamples=10)
+    assert exc.value.status_code == 400
+
+
+def test_results_continuous_metric(db, sample_experiment):
+    """metric=sum:properties.revenue: per-user revenue moments in SQL, Welch t-test vs baseline."""
+    import math
+    import numpy as np
+    from fastapi import HTTPException
+    from app.services.event_service import create_events_batch
+
+    experiment_id = sample_experiment.id
+    v0, v1 = (v.id for v in sample_experiment.variants)
+    base = datetime(2024, 1, 15, 10, 0, 0)
+    revenue = {v0: [], v1: []}
+    events = []
+    for i in range(60):
+        user_id = f"revenue_user_{i}"
+        v_id = v0 if i % 2 else v1
+        db.add(UserAssignment(experiment_id=experiment_id, user_id=user_id, variant_id=v_id, assigned_at=base))
+        # a third of users buy twice, a third once, the rest never
+        amounts = [10.0 + i, 5.0] if i % 3 == 0 else ([float(i)] if i % 3 == 1 else [])
+        revenue[v_id].append(sum(amounts))
+        events += [
+            EventCreate(user_id=user_id, type="purchase", timestamp=base + timedelta(minutes=1),
+                        experiment_id=experiment_id, properties={"revenue": amount, "currency": "USD"})
+            for amount in amounts
+        ]
+    # events without the property, or before assignment, add nothing
+    events.append(EventCreate(user_id="revenue_user_0", type="click", timestamp=base + timedelta(minutes=2),
+                              experiment_id=experiment_id))
+    events.append(EventCreate(user_id="revenue_user_1", type="purchase", timestamp=base - timedelta(minutes=1),
+                              experiment_id=experiment_id, properties={"revenue": 1000.0}))
+    db.commit()
+    create_events_batch(db, events)
+
+    results = get_experiment_results(db, experiment_id, metric="sum:properties.revenue")
+    by_id = {vm.variant_id: vm for vm in results.variants}
+    for v_id, values in revenue.items():
+        stats = by_id[v_id].metric
+        assert stats["sum"] == pytest.approx(sum(values))
+        assert stats["mean_per_user"] == pytest.approx(np.mean(values), abs=1e-6)
+        assert stats["std_dev"] == pytest.approx(np.std(values, ddof=1), abs=1e-6)
+        assert stats["users_with_value"] == sum(1 for v in values if v)
+
+    row = results.metric_comparisons[0]
+    a, b = np.array(revenue[row["baseline_variant_id"]]), np.array(revenue[row["treatment_variant_id"]])
+    se = math.sqrt(a.var(ddof=1) / len(a) + b.var(ddof=1) / len(b))
+    assert row["t_statistic"] == pytest.approx((b.mean() - a.mean()) / se, abs=1e-5)
+    assert row["mean_diff_ci_95"]["diff_low"] < row["mean_diff"] < row["mean_diff_ci_95"]["diff_high"]
+    assert row["metric"] == "sum:properties.revenue"
+
+    counted = get_experiment_results(db, experiment_id, metric="count:properties.revenue")
+    assert sum(vm.metric["sum"] for vm in counted.variants) == 60  # 20 users x 2 + 20 x 1
+    assert get_experiment_results(db, experiment_id).metric_comparisons is None
+    with pytest.raises(HTTPException) as exc:
+        get_experiment_results(db, experiment_id, metric="avg:revenue")
+    assert exc.value.status_code == 400
@@ -0,0 +1,301 @@
+"""Tests for the hourly rollup tables and the results path that reads them."""
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app.config import settings
+from app.models import Event, UserAssignment, EventRollupHourly, AssignmentRollupHourly, EventDigestHourly
+from app.services.results_service import get_experiment_results
+from app.services.rollup_service import refresh_rollups, RollupWorker, get_high_water_mark
+from app.services.event_service import create_event
+from app.schemas import EventCreate
+
+
+def _seed(db, experiment, base, users=6):
+    """Assign users at fixed times and give each a few events over two days."""
+    variants = experiment.variants
+    for i in range(users):
+        variant = variants[i % len(variants)]
+        db.add(UserAssignment(
+            experiment_id=experiment.id,
+            user_id=f"rollup_user_{i}",
+            variant_id=variant.id,
+            assigned_at=base
+        ))
+    db.commit()
+    for i in range(users):
+        for hours, event_type in [(1, "click"), (2, "click"), (26, "purchase")]:
+            if event_type == "purchase" and i % 2:
+                continue
+            create_event(db, EventCreate(
+                user_id=f"rollup_user_{i}",
+                type=event_type,
+                timestamp=base + timedelta(hours=hours, minutes=i),
+                experiment_id=experiment.id
+            ))
+
+
+def _snapshot(results):
+    return (
+        results.summary["total_assigned"],
+        results.summary["total_events"],
+        [(v.variant_id, v.assigned_count, v.event_count, v.events_by_type,
+          v.unique_users_with_events, v.primary_event_count, v.primary_unique_users)
+         for v in results.variants],
+        results.timeseries,
+    )
+
+
+def _raw_and_rollup(db, monkeypatch, experiment_id, **kwargs):
+    monkeypatch.setattr(settings, "results_use_rollups", False)
+    raw = get_experiment_results(db, experiment_id, **kwargs)
+    monkeypatch.setattr(settings, "results_use_rollups", True)
+    rolled = get_experiment_results(db, experiment_id, **kwargs)
+    return _snapshot(raw), _snapshot(rolled)
+
+
+def test_refresh_rollups_folds_and_advances_marks(db, sample_experiment):
+    base = datetime(2024, 1, 15, 10, 0, 0)
+    _seed(db, sample_experiment, base)
+
+    folded = refresh_rollups(db, batch_size=4)
+    assert folded["assignments"] == 6
+    assert folded["events"] > 0
+    assert get_high_water_mark(db, "events") == folded["events"]
+
+    rolled = db.query(EventRollupHourly).all()
+    assert sum(r.event_count for r in rolled) == 15
+    assert sum(r.assigned_count for r in db.query(AssignmentRollupHourly).all()) == 6
+
+    # nothing new -> nothing folded, counts are not doubled
+    assert refresh_rollups(db) == {"events": 0, "assignments": 0}
+    assert sum(r.event_count for r in db.query(EventRollupHourly).all()) == 15
+
+
+def test_rollup_results_match_raw_results(db, sample_experiment, monkeypatch):
+    base = datetime(2024, 1, 15, 10, 0, 0)
+    _seed(db, sample_experiment, base)
+    refresh_rollups(db)
+
+    # unfolded tail past the high-water mark must still be counted
+    create_event(db, EventCreate(
+        user_id="rollup_user_0",
+        type="purchase",
+        timestamp=base + timedelta(hours=30),
+        experiment_id=sample_experiment.id
+    ))
+
+    for kwargs in [
+        {},
+        {"primary_event_type": "purchase", "group_by": "day"},
+        {"group_by": "hour"},
+        {"start_date": base + timedelta(hours=2), "end_date": base + timedelta(hours=26)},
+        {"event_type": "click", "group_by": "day"},
+    ]:
+        raw, rolled = _raw_and_rollup(db, monkeypatch, sample_experiment.id, **kwargs)
+        assert raw == rolled, kwargs
+
+
+def test_unaligned_dates_fall_back_to_raw(db, sample_experiment, monkeypatch):
+    base = datetime(2024, 1, 15, 10, 0, 0)
+    _seed(db, sample_experiment, base)
+    refresh_rollups(db)
+
+    raw, rolled = _raw_and_rollup(
+        db, monkeypatch, sample_experiment.id,
+        start_date=base + timedelta(hours=1, minutes=2),
+        end_date=base + timedelta(hours=2, minutes=3)
+    )
+    assert raw == rolled
+
+
+def test_rollup_worker_run_once(db, sample_experiment):
+    from tests.conftest import TestingSessionLocal
+
+    base = datetime(2024, 1, 15, 10, 0, 0)
+    _seed(db, sample_experiment, base, users=2)
+
+    worker = RollupWorker(TestingSessionLocal, interval_seconds=0.01)
+    folded = worker.run_once()
+    assert folded["assignments"] == 2
+    assert worker.run_once() == {"events": 0, "assignments": 0}
+
+
+def test_approx_distinct_counts_from_sketches(db, sample_experiment, monkeypatch):
+    """approx=true merges per-bucket sketches (folded + raw tail) and reports the error bound."""
+    monkeypatch.setattr(settings, "results_use_rollups", True)
+    base = datetime(2024, 1, 15, 10, 0, 0)
+    _seed(db, sample_experiment, base)
+    refresh_rollups(db, batch_size=4)  # several folds merge into the same bucket sketches
+    # unfolded tail, including a repeat user
+    for user_id in ("rollup_user_0", "rollup_user_1"):
+        create_event(db, EventCreate(
+            user_id=user_id, type="purchase",
+            timestamp=base + timedelta(hours=30), experiment_id=sample_experiment.id
+        ))
+
+    def distinct(results):
+        return (
+            [(v.variant_id, v.unique_users_with_events, v.primary_unique_users) for v in results.variants],
+            [[(v["variant_id"], v["conversions"]) for v in row["variants"]] for row in results.timeseries],
+        )
+
+    for kwargs in ({}, {"cumulative": True}, {"start_date": base + timedelta(hours=24)}):
+        exact = get_experiment_results(db, sample_experiment.id, primary_event_type="purchase", group_by="day", **kwargs)
+        approx = get_experiment_results(
+            db, sample_experiment.id, primary_event_type="purchase", group_by="day", approx=True, **kwargs
+        )
+        # a handful of users is within HLL's exact (linear counting) range
+        assert distinct(approx) == distinct(exact)
+        assert approx.summary["distinct_counts"]["method"] == "hyperloglog"
+        assert 0 < approx.summary["distinct_counts"]["relative_standard_error"] < 0.01
+
+    # unaligned range: sketches can't answer, counts stay exact and say so
+    unaligned = get_experiment_results(db, sample_experiment.id, start_date=base + timedelta(minutes=5), approx=True)
+    assert unaligned.summary["distinct_counts"] == {"method": "exact"}
+
+
+def test_hyperloglog_merge_and_accuracy():
+    from app.utils.hll import HyperLogLog, RELATIVE_STANDARD_ERROR
+
+    a, b = HyperLogLog(), HyperLogLog()
+    a.update(f"user_{i}" for i in range(30000))
+    b.update(f"user_{i}" for i in range(20000, 50000))
+    restored = HyperLogLog.from_bytes(a.to_bytes())
+    restored.merge(HyperLogLog.from_bytes(b.to_bytes()))
+
+    assert abs(restored.count() - 50000) / 50000 < 4 * RELATIVE_STANDARD_ERROR
+    small = HyperLogLog()
+    small.update(["x", "y", "x"])
+    assert HyperLogLog.from_bytes(small.to_bytes()).count() == 2
+
+
+def test_quantiles_from_rollup_digests(db, sample_experiment, monkeypatch):
+    """quantiles=properties.load_ms merges hourly t-digests (folded + raw tail), matching a raw scan."""
+    monkeypatch.setattr(settings, "rollup_quantile_properties", ["load_ms"])
+    base = datetime(2024, 1, 15, 10, 0, 0)
+    _seed(db, sample_experiment, base)
+    experiment_id = sample_experiment.id
+    for i in range(40):
+        create_event(db, EventCreate(
+            user_id=f"rollup_user_{i % 6}", type="page_load",
+            timestamp=base + timedelta(hours=1 + i % 3, minutes=i),
+            experiment_id=experiment_id, properties={"load_ms": 100 + i * 7}
+        ))
+    refresh_rollups(db, batch_size=16)
+    assert db.query(EventDigestHourly).filter(EventDigestHourly.property == "load_ms").count() == 6  # 2 variants x 3 hours
+    # unfolded tail
+    create_event(db, EventCreate(
+        user_id="rollup_user_0", type="page_load", timestamp=base + timedelta(hours=5),
+        experiment_id=experiment_id, properties={"load_ms": 5000}
+    ))
+
+    def quantiles(results):
+        return (
+            [v.quantiles for v in results.variants],
+            [[v["quantiles"] for v in row["variants"]] for row in results.timeseries],
+        )
+
+    for kwargs in ({}, {"cumulative": True}, {"start_date": base + timedelta(hours=2)}):
+        monkeypatch.setattr(settings, "results_use_rollups", False)
+        raw = get_experiment_results(db, experiment_id, quantiles="properties.load_ms", group_by="hour", **kwargs)
+        monkeypatch.setattr(settings, "results_use_rollups", True)
+        rolled = get_experiment_results(db, experiment_id, quantiles="properties.load_ms", group_by="hour", **kwargs)
+        assert raw.summary["quantiles"]["source"] == "events"
+        assert rolled.summary["quantiles"]["source"] == "rollup_digests"
+        assert quantiles(rolled) == quantiles(raw)
+
+    results = get_experiment_results(db, experiment_id, quantiles="properties.load_ms")
+    v0 = results.variants[0].quantiles
+    assert v0["count"] == 21 and v0["max"] == 5000
+    assert v0["p50"] < v0["p90"] < v0["p99"] <= 5000
+    # properties that aren't digested are answered from the raw events
+    missing = get_experiment_results(db, experiment_id, quantiles="properties.ttfb_ms")
+    assert missing.summary["quantiles"]["source"] == "events"
+    assert missing.variants[0].quantiles["count"] == 0 and missing.variants[0].quantiles["p99"] is None
+
+
+def test_events_folded_before_their_write_behind_assignment(db, sample_experiment, monkeypatch):
+    """A write-behind row that lands after its user's events were folded adds them to the rollups."""
+    from app.services import assignment_service
+    from app.services.assignment_service import get_or_create_assignment
+    from app.services.assignment_writer import AssignmentWriter
+    from tests.conftest import TestingSessionLocal
+
+    monkeypatch.setattr(settings, "rollup_quantile_properties", ["load_ms"])
+    base = datetime(2024, 1, 15, 10, 0, 0)
+    _seed(db, sample_experiment, base)
+    experiment_id = sample_experiment.id
+
+    class HeldWriter(AssignmentWriter):
+        is_running = True  # no thread: rows stay queued until flush() below
+
+    writer = HeldWriter(TestingSessionLocal)
+    monkeypatch.setattr(settings, "assignment_write_mode", "write_behind")
+    monkeypatch.setattr(assignment_service, "assignment_writer", writer)
+    records = [get_or_create_assignment(db, experiment_id, f"late_user_{i}") for i in range(3)]
+    for i, record in enumerate(records):
+        create_event(db, EventCreate(
+            user_id=record.user_id, type="purchase", timestamp=record.assigned_at + timedelta(minutes=1),
+            experiment_id=experiment_id, properties={"load_ms": 1000 + i}
+        ))
+    refresh_rollups(db)
+    db.rollback()  # release the read transaction so the writer can commit
+
+    assert all(r.id is None for r in records)
+    writer.flush()
+    assert db.query(UserAssignment).filter(UserAssignment.user_id.like("late_user_%")).count() == 3
+    assert get_high_water_mark(db, "events") == db.query(func.max(Event.id)).scalar()  # nothing left in the tail
+
+    kwargs = dict(primary_event_type="purchase", quantiles="properties.load_ms")
+    raw, rolled = _raw_and_rollup(db, monkeypatch, experiment_id, **kwargs)
+    assert rolled == raw
+    assert sum(v[3]["purchase"] for v in rolled[2]) == 3 + 3  # three seeded purchases, three late ones
+
+    exact = get_experiment_results(db, experiment_id, **kwargs)
+    approx = get_experiment_results(db, experiment_id, approx=True, **kwargs)
+    assert approx.summary["quantiles"]["source"] == "rollup_digests"
+    assert [v.quantiles for v in approx.variants] == [v.quantiles for v in exact.variants]
+    assert [v.primary_unique_users for v in approx.variants] == [v.primary_unique_users for v in exact.variants]
+
+
+def test_events_folded_before_their_synchronous_assignment(db, sample_experiment):
+    """With default settings, events stored before a user's assignment count once it is inserted."""
+    from app.services.assignment_service import get_or_create_assignment, get_or_create_assignments_bulk
+
+    experiment_id = sample_experiment.id
+    later = datetime.utcnow() + timedelta(hours=1)  # at/after the assignment that follows
+    for user_id in ("early_single", "early_bulk"):
+        create_event(db, EventCreate(user_id=user_id, type="purchase", timestamp=later, experiment_id=experiment_id))
+    refresh_rollups(db)  # both events are below the high-water mark before either user is assigned
+    db.rollback()
+
+    get_or_create_assignment(db, experiment_id, "early_single")
+    results = get_experiment_results(db, experiment_id, primary_event_type="purchase")
+    assert results.summary["total_events"] == 1
+    assert sum(v.unique_users_with_events for v in results.variants) == 1
+    assert sum(v.primary_unique_users for v in results.variants) == 1
+
+    get_or_create_assignments_bulk(db, experiment_id, ["early_bulk"])
+    results = get_experiment_results(db, experiment_id, primary_event_type="purchase")
+    assert results.summary["total_events"] == 2
+    assert sum(v.unique_users_with_events for v in results.variants) == 2
+
+
+def test_tdigest_merge_and_accuracy():
+    import numpy as np
+    from app.utils.tdigest import TDigest
+
+    rng = np.random.default_rng(5)
+    values = rng.lognormal(5, 1, 100_000)
+    parts = [TDigest() for _ in range(24)]
+    for i, value in enumerate(values.tolist()):
+        parts[i % 24].add(value)
+    merged = TDigest()
+    for part in parts:
+        merged.merge(TDigest.from_bytes(part.to_bytes()))
+
+    ordered = np.sort(values)
+    assert merged.count == len(values)
+    assert merged.bounds() == (ordered[0], ordered[-1])
+    for q in (0.5, 0.9, 0.99, 0.999):
+        rank = np.searchsorted(ordered, merged.quantile(q)) / len(values)
+        assert abs(rank - q) < 0.002
@@ -0,0 +1,129 @@
+"""Tests for per-experiment shard files (EVENT_SHARD_DIR).
+
+The table schemas are fixed when app.models is imported, so each scenario runs
+in a fresh interpreter with the sharding settings in its environment.
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+import textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIO = textwrap.dedent("""
+    import sys
+    from datetime import datetime, timedelta
+    from fastapi.testclient import TestClient
+    from app.database import SessionLocal, shards
+    from app.main import app
+    from app.models import Experiment
+    from app.services.rollup_service import refresh_rollups
+    from app.utils.cache import experiment_cache
+
+    HEADERS = {"Authorization": "Bearer default-dev-token"}
+    USERS = [f"u{i}" for i in range(40)]
+
+    with TestClient(app) as client:
+        ids = []
+        for name in ("first", "second"):
+            r = client.post("/experiments", headers=HEADERS, json={"name": name, "variants": [
+                {"name": "a", "traffic_percentage": 50}, {"name": "b", "traffic_percentage": 50}
+            ]})
+            ids.append(r.json()["id"])
+        db = SessionLocal()
+        db.query(Experiment).update({"status": "active"})
+        db.commit()
+        experiment_cache.clear()
+
+        r = client.post(f"/experiments/{ids[0]}/assignments", headers=HEADERS, json={"user_ids": USERS})
+        assert r.status_code == 200, r.text
+        r = client.get("/users/u1/assignments", headers=HEADERS)
+        assert [a["experiment_id"] for a in r.json()] == ids, r.text
+        assert client.get("/experiments/999/assignment/u1", headers=HEADERS).status_code == 404
+
+        ts = (datetime.utcnow() + timedelta(minutes=1)).isoformat()
+        events = [
+            {"user_id": "u1", "type": "view", "timestamp": ts},
+            {"user_id": "u1", "type": "view", "timestamp": ts, "experiment_id": ids[1]},
+        ] + [{"user_id": u, "type": "purchase", "timestamp": ts, "experiment_id": ids[0]} for u in USERS[::2]]
+        r = client.post("/events", headers=HEADERS, json=events)
+        assert r.status_code == 201, r.text
+        assert [(e["user_id"], e["experiment_id"]) for e in r.json()] == [
+            (e["user_id"], e.get("experiment_id")) for e in events
+        ]
+
+        def purchases(experiment_id):
+            r = client.get(f"/experiments/{experiment_id}/results", headers=HEADERS)
+            assert r.status_code == 200, r.text
+            body = r.json()
+            return sum(v["assigned_count"] for v in body["variants"]), sum(
+                v["events_by_type"].get("purchase", 0) for v in body["variants"]
+            )
+
+        assert purchases(ids[0]) == (40, 20)
+        folded = refresh_rollups(db)
+        assert folded == {"events": 1 + 20 + 1, "assignments": 40 + 1}, folded
+        assert purchases(ids[0]) == (40, 20)
+        assert client.get("/experiments/999/results", headers=HEADERS).status_code == 404
+
+        shards.archive(ids[0], sys.argv[1])
+        assert purchases(ids[0]) == (0, 0)  # reads as empty, without recreating the file
+        assert purchases(ids[1])[0] == 1
+        r = client.post("/experiments", headers=HEADERS, json={"name": "unwritten", "variants": [
+            {"name": "a", "traffic_percentage": 100}
+        ]})
+        assert purchases(r.json()["id"]) == (0, 0)
+        db.close()
+""")
+
+
+def _run(tmp_path, **env) -> subprocess.CompletedProcess:
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    return subprocess.run(
+        [sys.executable, "-c", SCENARIO, str(archive)],
+        cwd=ROOT,
+        env=dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{tmp_path / 'main.db'}",
+            EVENT_SHARD_DIR=str(tmp_path / "shards"),
+            ROLLUP_WORKER_ENABLED="false",
+            **env
+        ),
+        capture_output=True,
+        text=True
+    )
+
+
+def _count(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_experiment_data_lives_in_its_own_shard_file(tmp_path):
+    result = _run(tmp_path)
+    assert result.returncode == 0, result.stderr
+
+    # only the event without an experiment stayed in the main file
+    assert _count(tmp_path / "main.db", "events") == 1
+    assert _count(tmp_path / "main.db", "user_assignments") == 0
+    # experiment 1 was archived and experiment 3 only read: neither has a file
+    assert [name for name in os.listdir(tmp_path / "shards") if name.endswith(".db")] == ["experiment_2.db"]
+    assert _count(tmp_path / "shards" / "experiment_2.db", "events") == 1
+
+    archived = tmp_path / "archive" / "experiment_1.db"
+    assert _count(archived, "events") == 20
+    assert _count(archived, "user_assignments") == 40
+    assert _count(archived, "event_rollups_hourly") == 2
+
+
+def test_bucketed_shards(tmp_path):
+    # "archive" is refused for buckets: the scenario fails on that call, after the rest passed
+    result = _run(tmp_path, EVENT_SHARD_BUCKETS="1")
+    assert "can't be archived one by one" in result.stderr
+    assert os.listdir(tmp_path / "shards") == ["bucket_0.db"]
+    assert _count(tmp_path / "shards" / "bucket_0.db", "events") == 21
@@ -0,0 +1,110 @@
+"""Tests for the vectorized statistics helpers."""
+import math
+import numpy as np
+from app.utils.stats import (
+    compare_proportions, all_pairs, baseline_pairs, chi_square_sf, srm_test, bootstrap_intervals,
+    welch_t_test, t_two_sided_p
+)
+
+
+def test_chi_square_sf_is_exact():
+    xs = np.array([0.1, 1.0, 3.841458820694124, 20.0, 50.0])
+    # closed forms: df=1 -> erfc(sqrt(x/2)), df=2 -> exp(-x/2)
+    assert np.allclose(chi_square_sf(xs, 1), [math.erfc(math.sqrt(x / 2)) for x in xs], rtol=1e-12)
+    assert np.allclose(chi_square_sf(xs, 2), np.exp(-xs / 2), rtol=1e-12)
+    assert math.isclose(float(chi_square_sf(3.841458820694124, 1)), 0.05, rel_tol=1e-9)
+    assert float(chi_square_sf(0.0, 3)) == 1.0
+
+
+def test_compare_proportions_matches_scalar_z_test():
+    x, n = [120, 150, 90], [1000, 1000, 800]
+    result = compare_proportions(x, n)
+    assert list(result["baseline"]) == [0, 0]
+    assert list(result["treatment"]) == [1, 2]
+
+    p1, p2 = 0.12, 0.15
+    pool = 270 / 2000
+    z = (p2 - p1) / math.sqrt(pool * (1 - pool) * (2 / 1000))
+    assert math.isclose(result["z_score"][0], z, rel_tol=1e-12)
+    assert math.isclose(result["p_value"][0], math.erfc(abs(z) / math.sqrt(2)), rel_tol=1e-12)
+    assert math.isclose(result["lift_percentage"][0], 25.0)
+    se = math.sqrt(p1 * (1 - p1) / 1000 + p2 * (1 - p2) / 1000)
+    assert math.isclose(result["ci_low"][0], (p2 - p1) - 1.96 * se)
+
+
+def test_compare_proportions_pairwise_and_stacked_metrics():
+    k = 20
+    rng = np.random.default_rng(7)
+    n = np.full(k, 5000)
+    x = rng.binomial(n, 0.1)
+    full = compare_proportions(x, n, all_pairs(k))
+    assert full["p_value"].shape == (k * (k - 1) // 2,)
+    assert np.all((full["p_value"] >= 0) & (full["p_value"] <= 1))
+
+    # leading axis = metrics; each row matches its own single-metric run
+    stacked = compare_proportions(np.stack([x, x // 2]), np.stack([n, n]), baseline_pairs(k))
+    single = compare_proportions(x // 2, n, baseline_pairs(k))
+    assert np.allclose(stacked["p_value"][1], single["p_value"])
+
+    # empty variants are untestable rather than errors
+    empty = compare_proportions([0, 5], [0, 10])
+    assert not empty["testable"][0] and math.isnan(empty["p_value"][0])
+
+
+def test_srm_test():
+    result = srm_test([95, 5], [50, 50])
+    assert float(result["chi_square"]) == 81.0
+    assert float(result["df"]) == 1
+    assert float(result["p_value"]) < 1e-15
+    assert list(result["observed_percent"]) == [95.0, 5.0]
+
+
+def test_bootstrap_intervals_match_normal_approximation():
+    from app.services.bootstrap_service import BootstrapPool
+
+    samples = [([0.0, 1.0], [880, 120]), ([0.0, 1.0], [850, 150])]
+    means = BootstrapPool(max_workers=0, chunk_size=1000).resample_means(samples, 4000, seed=1)
+    assert means.shape == (4000, 2)
+    assert abs(means[:, 0].mean() - 0.12) < 0.002
+
+    boot = bootstrap_intervals(means)
+    normal = compare_proportions([120, 150], [1000, 1000])
+    assert abs(boot["diff_low"][0] - normal["ci_low"][0]) < 0.003
+    assert abs(boot["diff_high"][0] - normal["ci_high"][0]) < 0.003
+    assert boot["lift_low"][0] < 25.0 < boot["lift_high"][0]
+
+
+def test_bootstrap_is_reproducible_across_pool_sizes():
+    from app.services.bootstrap_service import BootstrapPool
+
+    # 1M users per variant: resampling cost depends on distinct outcomes, not users
+    samples = [([0.0, 1.0], [990_000, 10_000]), ([0.0, 1.0], [989_000, 11_000])]
+    pooled = BootstrapPool(max_workers=2, chunk_size=500)
+    try:
+        a = pooled.resample_means(samples, 2000, seed=42)
+    finally:
+        pooled.shutdown()
+    b = BootstrapPool(max_workers=0, chunk_size=500).resample_means(samples, 2000, seed=42)
+    c = BootstrapPool(max_workers=0, chunk_size=500).resample_means(samples, 2000, seed=43)
+    assert np.array_equal(a, b)
+    assert not np.array_equal(b, c)
+
+
+def test_welch_t_test_from_moments():
+    # reference values: t=2, df=10 -> p=0.0733880; t_0.975(10)=2.2281389
+    assert math.isclose(float(t_two_sided_p(2.0, 10)), 0.0733880348, rel_tol=1e-8)
+    assert math.isclose(float(t_two_sided_p(3.0, 1)), 1 - 2 / math.pi * math.atan(3.0), rel_tol=1e-10)
+
+    rng = np.random.default_rng(3)
+    a, b = rng.exponential(10, 5000), rng.exponential(11, 3000)
+    result = welch_t_test([a.size, b.size], [a.sum(), b.sum()], [(a * a).sum(), (b * b).sum()])
+    va, vb = a.var(ddof=1) / a.size, b.var(ddof=1) / b.size
+    t = (b.mean() - a.mean()) / math.sqrt(va + vb)
+    df = (va + vb) ** 2 / (va ** 2 / (a.size - 1) + vb ** 2 / (b.size - 1))
+    assert math.isclose(result["t_statistic"][0], t, rel_tol=1e-9)
+    assert math.isclose(result["df"][0], df, rel_tol=1e-9)
+    assert math.isclose(result["ci_high"][0] - result["diff"][0], 1.9604 * math.sqrt(va + vb), rel_tol=1e-3)
+
+    # zero variance on both sides is untestable, not an error
+    flat = welch_t_test([10, 10], [0.0, 0.0], [0.0, 0.0])
+    assert not flat["testable"][0] and math.isnan(flat["p_value"][0])
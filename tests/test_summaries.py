@@ -0,0 +1,86 @@
+"""Tests for the per-user exposure/conversion summaries kept at ingest time."""
+from datetime import timedelta
+from app.config import settings
+from app.models import UserExperimentSummary, UserEventTypeSummary
+from app.services.assignment_service import get_or_create_assignment
+from app.services.event_service import create_event, create_events_batch
+from app.services.results_service import get_experiment_results
+from app.schemas import EventCreate
+
+
+def test_summary_rows_track_first_events_and_counts(db, sample_experiment):
+    experiment_id = sample_experiment.id
+    assignment = get_or_create_assignment(db, experiment_id, "summary_user")
+    t0 = assignment.assigned_at
+
+    # before assignment -> ignored, like the results join
+    create_event(db, EventCreate(user_id="summary_user", type="click", timestamp=t0 - timedelta(hours=1), experiment_id=experiment_id))
+    create_events_batch(db, [
+        EventCreate(user_id="summary_user", type="click", timestamp=t0 + timedelta(minutes=5), experiment_id=experiment_id),
+        EventCreate(user_id="summary_user", type="purchase", timestamp=t0 + timedelta(minutes=9), experiment_id=experiment_id),
+    ])
+    create_event(db, EventCreate(user_id="summary_user", type="click", timestamp=t0 + timedelta(minutes=2), experiment_id=experiment_id))
+
+    summary = db.query(UserExperimentSummary).filter_by(experiment_id=experiment_id, user_id="summary_user").one()
+    assert summary.variant_id == assignment.variant_id
+    assert summary.event_count == 3
+    assert summary.first_event_at == t0 + timedelta(minutes=2)
+    assert summary.last_event_at == t0 + timedelta(minutes=9)
+
+    by_type = {
+        r.event_type: r for r in
+        db.query(UserEventTypeSummary).filter_by(experiment_id=experiment_id, user_id="summary_user")
+    }
+    assert by_type["click"].event_count == 2
+    assert by_type["click"].first_event_at == t0 + timedelta(minutes=2)
+    assert by_type["purchase"].first_event_at == t0 + timedelta(minutes=9)
+
+
+def test_summary_unique_users_match_raw_join(db, sample_experiment, monkeypatch):
+    experiment_id = sample_experiment.id
+    last = None
+    for i in range(12):
+        a = get_or_create_assignment(db, experiment_id, f"su_{i}")
+        events = [EventCreate(user_id=f"su_{i}", type="click", timestamp=a.assigned_at + timedelta(minutes=i), experiment_id=experiment_id)]
+        if i % 3 == 0:
+            events.append(EventCreate(user_id=f"su_{i}", type="purchase", timestamp=a.assigned_at + timedelta(hours=i), experiment_id=experiment_id))
+        create_events_batch(db, events)
+        last = a.assigned_at
+
+    def _users(results):
+        return sorted((v.variant_id, v.unique_users_with_events, v.primary_unique_users) for v in results.variants)
+
+    for kwargs in [
+        {"primary_event_type": "purchase"},
+        {"primary_event_type": "purchase", "end_date": last + timedelta(hours=4)},
+        {"event_type": "purchase", "primary_event_type": "purchase"},
+        {"event_type": "click", "primary_event_type": "purchase"},
+    ]:
+        monkeypatch.setattr(settings, "results_use_user_summaries", False)
+        raw = get_experiment_results(db, experiment_id, **kwargs)
+        monkeypatch.setattr(settings, "results_use_user_summaries", True)
+        summarized = get_experiment_results(db, experiment_id, **kwargs)
+        assert _users(raw) == _users(summarized), kwargs
+
+
+def test_late_assignment_rows_pick_up_earlier_events(db, sample_experiment):
+    """Write-behind rows can land after the user's first events; those still get summarized."""
+    from datetime import datetime
+    from app.services.assignment_writer import AssignmentWriter
+    from app.utils.cache import AssignmentRecord
+    from tests.conftest import TestingSessionLocal
+
+    experiment_id = sample_experiment.id
+    variant = sample_experiment.variants[0]
+    assigned_at = datetime(2024, 1, 15, 10, 0, 0)
+
+    create_event(db, EventCreate(user_id="late_user", type="click", timestamp=assigned_at + timedelta(seconds=1), experiment_id=experiment_id))
+    assert db.query(UserExperimentSummary).count() == 0
+
+    writer = AssignmentWriter(TestingSessionLocal)
+    inserted = writer.write_batch([AssignmentRecord(None, experiment_id, "late_user", variant.id, variant.name, assigned_at)])
+    assert inserted == 1
+
+    summary = db.query(UserExperimentSummary).filter_by(user_id="late_user").one()
+    assert summary.event_count == 1
+    assert summary.variant_id == variant.id
@@ -0,0 +1,65 @@
+"""Tests for the users dictionary (integer keys for external user ids)."""
+import uuid
+from datetime import timedelta
+
+from app.models import Event, User, UserAssignment
+from app.schemas import EventCreate
+from app.services.assignment_service import get_or_create_assignment, get_or_create_assignments_bulk
+from app.services.event_service import create_event, create_events_batch
+from app.services.results_service import get_experiment_results
+from app.services.user_keys import find_user_keys, user_keys
+from app.utils.cache import user_key_cache
+
+
+def test_assignments_and_events_share_one_key_per_user(db, sample_experiment):
+    experiment_id = sample_experiment.id
+    user_ids = [str(uuid.uuid4()) for _ in range(20)]
+    records = get_or_create_assignments_bulk(db, experiment_id, user_ids)
+    ts = max(r.assigned_at for r in records) + timedelta(minutes=1)
+
+    create_events_batch(db, [
+        EventCreate(user_id=u, type="purchase", timestamp=ts, experiment_id=experiment_id) for u in user_ids[:10]
+    ])
+    create_event(db, EventCreate(user_id=user_ids[0], type="view", timestamp=ts, experiment_id=experiment_id))
+    create_event(db, EventCreate(user_id="never_assigned", type="view", timestamp=ts, experiment_id=experiment_id))
+
+    keys = {u.external_id: u.id for u in db.query(User)}
+    assert len(keys) == 21
+    assert all(a.user_key == keys[a.user_id] for a in db.query(UserAssignment))
+    assert all(e.user_key == keys[e.user_id] for e in db.query(Event))
+    assert find_user_keys(db, ["unknown", user_ids[3]]) == {user_ids[3]: keys[user_ids[3]]}
+
+    # the join and distinct counts run on user_key
+    results = get_experiment_results(db, experiment_id, primary_event_type="purchase")
+    assert sum(v.unique_users_with_events for v in results.variants) == 10
+    assert sum(v.primary_unique_users for v in results.variants) == 10
+
+    # lookups by external id go through the dictionary
+    assert get_or_create_assignment(db, experiment_id, user_ids[5]) == records[5]
+
+
+def test_keys_from_rolled_back_transaction_are_not_cached(db):
+    keys = user_keys(db, ["a", "b"])
+    assert len(user_key_cache) == 0  # not committed yet
+    db.rollback()
+
+    assert find_user_keys(db, ["a", "b"]) == {}
+    other = user_keys(db, ["c"])
+    db.commit()
+    # "c" may reuse a's id; a stale cache entry would have mapped "a" to it
+    assert find_user_keys(db, ["a"]) == {}
+    assert set(other) == {"c"} and set(keys) == {"a", "b"}
+
+
+def test_uncommitted_keys_are_cached_on_commit_and_dropped_on_rollback(db):
+    keys = user_keys(db, ["a", "b"])
+    assert len(db.info["uncommitted_user_keys"]) == 2
+    db.commit()
+    assert "uncommitted_user_keys" not in db.info
+    assert len(user_key_cache) == 2
+    assert find_user_keys(db, ["a", "b"]) == keys
+
+    user_keys(db, ["c"])
+    db.rollback()
+    assert "uncommitted_user_keys" not in db.info
+    assert len(user_key_cache) == 2
@@ -0,0 +1,109 @@
+"""Tests for the single-writer deployment (web workers forward writes over a Unix socket)."""
+from datetime import datetime, timedelta
+from multiprocessing import Pipe
+
+import pytest
+
+from app.models import Event, Experiment, UserAssignment
+from app.schemas import EventCreate
+from app.services.write_forwarder import write_forwarder
+from app.services.writer_process import WriterServer
+from app.utils.cache import assignment_cache, experiment_cache
+from tests.conftest import TestingSessionLocal
+
+HEADERS = {"Authorization": "Bearer default-dev-token"}
+
+
+@pytest.fixture
+def writer(db, tmp_path, monkeypatch):
+    server = WriterServer(str(tmp_path / "writer.sock"), session_factory=TestingSessionLocal)
+    server.start()
+    monkeypatch.setattr(write_forwarder, "path", server.path)
+    yield server
+    server.stop()
+
+
+def test_endpoints_forward_writes_to_writer(client, db, writer):
+    r = client.post("/experiments", headers=HEADERS, json={
+        "name": "Forwarded",
+        "variants": [{"name": "a", "traffic_percentage": 50}, {"name": "b", "traffic_percentage": 50}]
+    })
+    assert r.status_code == 201 and len(r.json()["variants"]) == 2
+    experiment_id = r.json()["id"]
+
+    # still a draft: the writer's 400 comes back as this request's error
+    r = client.get(f"/experiments/{experiment_id}/assignment/u1", headers=HEADERS)
+    assert r.status_code == 400 and "not active" in r.json()["detail"]
+
+    db.query(Experiment).filter(Experiment.id == experiment_id).update({"status": "active"})
+    db.commit()
+    experiment_cache.clear()
+
+    r = client.get(f"/experiments/{experiment_id}/assignment/u1", headers=HEADERS)
+    assert r.status_code == 200
+    r = client.post(f"/experiments/{experiment_id}/assignments", headers=HEADERS, json={"user_ids": ["u1", "u2", "u3"]})
+    assert r.status_code == 200 and [a["user_id"] for a in r.json()] == ["u1", "u2", "u3"]
+
+    ts = (datetime.utcnow() + timedelta(minutes=1)).isoformat()
+    r = client.post("/events", headers=HEADERS, json={"user_id": "u1", "type": "click", "timestamp": ts})
+    assert r.status_code == 201 and r.json()["id"]
+    r = client.post("/events", headers=HEADERS, json=[
+        {"user_id": u, "type": "purchase", "timestamp": ts, "experiment_id": experiment_id} for u in ("u1", "u2")
+    ])
+    assert r.status_code == 201 and len(r.json()) == 2
+
+    db.expire_all()
+    assert db.query(UserAssignment).filter(UserAssignment.experiment_id == experiment_id).count() == 3
+    assert db.query(Event).count() == 3
+    assert writer.batches >= 6
+
+
+def test_writer_groups_requests_and_isolates_failures(db, sample_experiment, writer):
+    experiment_id = sample_experiment.id
+    ts = datetime.utcnow()
+    pipes = [Pipe() for _ in range(5)]
+
+    def request(i, op, *args):
+        return (pipes[i][1], op, args)
+
+    writer.process([
+        request(0, "create_events_batch", [EventCreate(user_id=f"e{i}", type="view", timestamp=ts) for i in range(3)]),
+        request(1, "create_event", EventCreate(user_id="single", type="click", timestamp=ts)),
+        request(2, "get_or_create_assignments_bulk", experiment_id, ["a", "b", "a"]),
+        request(3, "get_or_create_assignment", experiment_id, "b"),
+        request(4, "drop_table", "events"),
+    ])
+    assert writer.batches == 1
+
+    status, batch = pipes[0][0].recv()
+    assert status == "ok" and [e.user_id for e in batch] == ["e0", "e1", "e2"]
+    status, single = pipes[1][0].recv()
+    assert status == "ok" and single.user_id == "single" and single.id == batch[-1].id + 1
+    status, bulk = pipes[2][0].recv()
+    assert status == "ok" and [r.user_id for r in bulk] == ["a", "b"]
+    status, record = pipes[3][0].recv()
+    assert status == "ok" and record == bulk[1]
+    assert pipes[4][0].recv() == ("error", 400, "Unknown write operation: drop_table", None)
+
+    # paused: the combined bulk call is rejected, but "a" already has a row and gets it back
+    db.query(Experiment).filter(Experiment.id == experiment_id).update({"status": "paused"})
+    db.commit()
+    experiment_cache.clear()
+    assignment_cache.clear()
+    writer.process([
+        request(0, "get_or_create_assignment", experiment_id, "a"),
+        request(1, "get_or_create_assignment", experiment_id, "new_user"),
+    ])
+    status, record = pipes[0][0].recv()
+    assert status == "ok" and record.user_id == "a"
+    status, code, detail, _ = pipes[1][0].recv()
+    assert status == "error" and code == 400 and "not active" in detail
+
+
+def test_writer_unavailable_is_503(client, db, tmp_path, monkeypatch):
+    monkeypatch.setattr(write_forwarder, "path", str(tmp_path / "missing.sock"))
+    r = client.post("/events", headers=HEADERS, json={
+        "user_id": "u1", "type": "click", "timestamp": datetime.utcnow().isoformat()
+    })
+    assert r.status_code == 503
+    assert db.query(Event).count() == 0